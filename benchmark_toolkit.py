@@ -0,0 +1,376 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from file_management_toolkit import judge_create_directory
+from synthetic_takeout_toolkit import write_synthetic_takeout_json, \
+    add_synthetic_extracted_category, start_fixture_server, \
+    point_url_to_fixture_server, synthetic_city_list
+
+# Reproducible benchmarks of every stage of the pipeline on synthetic
+# Takeout exports. Run it from the repo root, e.g.
+#   python benchmark_toolkit.py --sizes 1000 10000 --distribution clustered
+# The results are saved into benchmark_results/<commit>.json so different
+# commits can be compared with compare_benchmark_results()
+
+default_size_list = [1000, 10000, 100000, 1000000]
+
+# Some stages don't scale to a million places in a reasonable time (KMeans
+# with n_init=30 for every k, one folium.Marker per place, one Chrome page
+# per place). They're run on a random sample of at most this many rows and
+# the sample size is stored with the result
+stage_row_cap_dict = {
+    'elbow_search': 5000,
+    'map_rendering': 5000,
+    'scraping': 50,
+}
+
+# Modules whose import time is measured by measure_import_times()
+import_module_list = ['google_map_data_toolkit', 'folium_map_toolkit',
+                      'plt_render_toolkit', 'hierarchical_cluster_toolkit',
+                      'elbow_plot_toolkit', 'scrape_google_map_toolkit']
+
+# Stages in the order they run. The stages up to labelling feed each other,
+# so when one of them fails the ones after it can't run
+stage_list = ['ingestion', 'cleaning', 'filtering', 'scraping', 'labelling',
+              'elbow_search', 'hull_generation', 'map_rendering']
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))  # git and the imports
+# of the toolkits have to run from here whatever the working directory is
+
+
+class StageFailedError(Exception):
+    # Raised by run_stage() when a stage that the next ones need fails
+    pass
+
+
+def get_git_commit():
+    # Short hash of the checked out commit, used to name the result file
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL, cwd=repo_dir
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def measure(func, *args, measure_memory=True, **kwargs):
+    # Return the result of func, its wall time and the peak Python memory
+    # allocated while it ran (numpy and pandas buffers are tracked by
+    # tracemalloc too). tracemalloc slows every allocation down, by more for
+    # the allocation-heavy stages, so the time comes from a 1st run without
+    # it and the memory from a 2nd run with it. Without measure_memory, func
+    # only runs once and the peak memory is None
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    wall_time = time.perf_counter() - start
+
+    peak_memory = None
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            func(*args, **kwargs)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, wall_time, peak_memory
+
+
+def sample_rows(input_df, stage):
+    # Random but reproducible sample for the stages in stage_row_cap_dict
+    row_cap = stage_row_cap_dict.get(stage)
+    if row_cap is None or input_df.shape[0] <= row_cap:
+        return input_df
+    return input_df.sample(n=row_cap, random_state=0)
+
+
+def kmeans_label(input_df, num_cluster):
+    # Cluster the sites the same way the notebook does so the hull and map
+    # stages get realistic input
+    from sklearn.cluster import KMeans
+
+    output_df = input_df.copy()
+    num_cluster = min(num_cluster, output_df.shape[0])
+    output_df['Cluster'] = KMeans(n_clusters=num_cluster, n_init=3,
+                                  random_state=0).fit_predict(
+        output_df[['Latitude', 'Longitude']])
+    return output_df.sort_values(by=['Cluster'])
+
+
+def generate_all_hulls(df_no_restaurant):
+    # Hull generation + interpolation for every cluster as done by
+    # plot_polygon_shades_for_clusters()
+    from convex_hull_interpolation_toolkit import generate_convex_hull, \
+        generate_interpolation, create_four_point_diamond_around
+
+    hull_list = []
+    for cluster_idx in df_no_restaurant['Cluster'].unique():
+        points = df_no_restaurant.loc[
+            df_no_restaurant['Cluster'] == cluster_idx,
+            ['Longitude', 'Latitude']].values
+        if points.shape[0] < 3:
+            points = np.vstack((points, create_four_point_diamond_around(
+                points.mean(axis=0).reshape(1, 2), 0.02)))
+        hull_list.append(generate_interpolation(*generate_convex_hull(points)))
+    return hull_list
+
+
+def render_folium_html(open_df, df_no_restaurant, num_cluster):
+    from folium_map_toolkit import generate_folium_map
+
+    my_map = generate_folium_map(open_df, df_no_restaurant, num_cluster)
+    return my_map.get_root().render()  # Same work as my_map.save()
+
+
+def scrape_from_fixture_server(filtered_df):
+    # Scrape the fixture server with the same managed driver and the same
+    # url_to_category() as scrape_all_categories_from_urls(), minus the
+    # random sleep between pages that would dominate the timing
+    from selenium.common import NoSuchElementException
+    from scrape_google_map_toolkit import url_to_category, \
+        ManagedChromeDriver
+
+    server = start_fixture_server()
+    driver = ManagedChromeDriver()
+    try:
+        extracted_categories = []
+        for url in filtered_df['Google Maps URL']:
+            try:
+                extracted_categories.append(url_to_category(
+                    driver, point_url_to_fixture_server(url, server)).text)
+            except NoSuchElementException:
+                extracted_categories.append('No Category')
+    finally:
+        driver.quit()
+        server.shutdown()
+    return extracted_categories
+
+
+def format_memory_mb(memory_mb):
+    return 'n/a' if memory_mb is None else '{:.1f} MB'.format(memory_mb)
+
+
+def run_stage(result_list, stage, num_row, func, *args, required=False,
+              measure_memory=True, **kwargs):
+    # Measure one stage, store its throughput and peak memory into
+    # result_list and return the stage output. A stage that can't run
+    # because a dependency is missing (e.g. selenium) is recorded as
+    # skipped, a stage that raises anything else as failed. When a required
+    # stage (one whose output the next stages need) fails,
+    # StageFailedError is raised
+    try:
+        output, wall_time, peak_memory = measure(
+            func, *args, measure_memory=measure_memory, **kwargs)
+    except ImportError as error:
+        print('> Stage {} skipped: {}'.format(stage, error))
+        result_list.append({'stage': stage, 'rows': num_row,
+                            'skipped': str(error)})
+        if required:
+            raise StageFailedError(stage)
+        return None
+    except Exception as error:
+        print('> Stage {} failed: {!r}'.format(stage, error))
+        result_list.append({'stage': stage, 'rows': num_row,
+                            'failed': repr(error)})
+        if required:
+            raise StageFailedError(stage)
+        return None
+
+    peak_memory_mb = None if peak_memory is None else \
+        peak_memory / (1024 * 1024)
+    result_list.append({
+        'stage': stage,
+        'rows': num_row,
+        'wall_time_s': wall_time,
+        'rows_per_s': num_row / wall_time if wall_time > 0 else None,
+        'peak_memory_mb': peak_memory_mb,
+    })
+    print('> {} on {} rows: {:.3f} s, {} peak'.format(
+        stage, num_row, wall_time, format_memory_mb(peak_memory_mb)))
+    return output
+
+
+def run_benchmark_for_size(num_place, distribution, work_dir,
+                           include_scraping=False, num_cluster=8):
+    # Run all the stages on one synthetic export of num_place places. When a
+    # stage fails, the stages that depend on it are recorded as skipped
+    json_path = os.path.join(work_dir, 'saved_places_{}_{}.json'.format(
+        distribution, num_place))
+    write_synthetic_takeout_json(json_path, num_place, distribution)
+
+    result_list = []
+    try:
+        run_all_stages(result_list, json_path, num_place, include_scraping,
+                       num_cluster)
+    except StageFailedError as error:
+        measured_stage_set = {result['stage'] for result in result_list}
+        for stage in stage_list[stage_list.index(str(error)) + 1:]:
+            if stage == 'scraping' and not include_scraping:
+                continue
+            if stage not in measured_stage_set:
+                result_list.append({'stage': stage, 'rows': None,
+                                    'skipped': '{} failed'.format(error)})
+
+    for result in result_list:
+        result.update({'num_place': num_place, 'distribution': distribution})
+    return result_list
+
+
+def run_all_stages(result_list, json_path, num_place, include_scraping,
+                   num_cluster):
+    from google_map_data_toolkit import json_to_df, location_df_clean, \
+        location_df_filter_by_allowed_cities, label_based_on_scraped_category
+
+    allowed_cities = [city[0] for city in synthetic_city_list]
+
+    location_df = run_stage(result_list, 'ingestion', num_place,
+                            json_to_df, json_path, required=True)
+    cleaned_df = run_stage(result_list, 'cleaning', num_place,
+                           location_df_clean, location_df, required=True)
+    filtered_df = run_stage(result_list, 'filtering', cleaned_df.shape[0],
+                            location_df_filter_by_allowed_cities,
+                            cleaned_df, allowed_cities, required=True)
+
+    if include_scraping:
+        # The memory run would scrape every page a 2nd time
+        scrape_df = sample_rows(filtered_df, 'scraping')
+        run_stage(result_list, 'scraping', scrape_df.shape[0],
+                  scrape_from_fixture_server, scrape_df,
+                  measure_memory=False)
+
+    full_df = add_synthetic_extracted_category(filtered_df)
+    full_df_labeled = run_stage(result_list, 'labelling', full_df.shape[0],
+                                label_based_on_scraped_category, full_df,
+                                required=True)
+
+    open_df = full_df_labeled[full_df_labeled['Category'] != 'Closed'].copy()
+    df_no_restaurant = open_df[open_df['Category'] != 'Restaurant'].copy()
+
+    elbow_df = sample_rows(df_no_restaurant, 'elbow_search')
+    coordinate_array = elbow_df[['Longitude', 'Latitude']].values
+
+    def elbow_search():
+        from elbow_plot_toolkit import calculate_inertia
+        return calculate_inertia(coordinate_array, num_cluster)
+
+    run_stage(result_list, 'elbow_search', elbow_df.shape[0], elbow_search)
+
+    df_no_restaurant = kmeans_label(df_no_restaurant, num_cluster)
+    run_stage(result_list, 'hull_generation', df_no_restaurant.shape[0],
+              generate_all_hulls, df_no_restaurant)
+
+    map_open_df = sample_rows(open_df, 'map_rendering')
+    map_df_no_restaurant = df_no_restaurant[
+        df_no_restaurant.index.isin(map_open_df.index)]
+    run_stage(result_list, 'map_rendering', map_open_df.shape[0],
+              render_folium_html, map_open_df, map_df_no_restaurant,
+              num_cluster)
+
+
+def run_benchmarks(size_list=None, distribution='clustered',
+                   output_dir='benchmark_results', include_scraping=False):
+    # Caller function that benchmarks every size in size_list and saves the
+    # results into output_dir/<commit>.json
+    size_list = size_list or default_size_list
+    judge_create_directory(output_dir)
+
+    result_list = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for num_place in size_list:
+            result_list.extend(run_benchmark_for_size(
+                num_place, distribution, work_dir, include_scraping))
+
+    commit = get_git_commit()
+    result_path = os.path.join(output_dir, '{}.json'.format(commit))
+    with open(result_path, 'w', encoding='utf-8') as file:
+        json.dump({
+            'commit': commit,
+            'created': datetime.now().isoformat(),
+            'stage_row_caps': stage_row_cap_dict,
+            'results': result_list,
+        }, file, indent=2)
+    print('> Benchmark results saved to {}.'.format(result_path))
+    return result_path
+
+
+def measure_import_times(module_name_list=None):
+    # Import every module in a fresh interpreter, since a module imported
+    # once is cached by Python, and print how long it took. A worker that
+    # only renders maps shouldn't pay for selenium, SciPy or pyplot
+    module_name_list = module_name_list or import_module_list
+
+    import_time_dict = {}
+    for module_name in module_name_list:
+        code = ('import time; start = time.perf_counter(); import {}; '
+                'print(time.perf_counter() - start)'.format(module_name))
+        try:
+            import_time_dict[module_name] = float(subprocess.check_output(
+                [sys.executable, '-c', code], stderr=subprocess.DEVNULL,
+                cwd=repo_dir))
+        except subprocess.CalledProcessError:
+            print('> {} can\'t be imported.'.format(module_name))
+            continue
+        print('> import {}: {:.3f} s'.format(
+            module_name, import_time_dict[module_name]))
+    return import_time_dict
+
+
+def compare_benchmark_results(baseline_path, candidate_path):
+    # Print the wall time ratio candidate/baseline for every (stage, size)
+    # measured in both files. A ratio above 1 is a slowdown
+    def load_result_dict(file_path):
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return {(result['stage'], result['num_place'],
+                     result['distribution']): result
+                    for result in json.load(file)['results']
+                    if 'wall_time_s' in result}
+
+    baseline_dict = load_result_dict(baseline_path)
+    candidate_dict = load_result_dict(candidate_path)
+
+    ratio_dict = {}
+    for key in sorted(baseline_dict.keys() & candidate_dict.keys()):
+        ratio = candidate_dict[key]['wall_time_s'] / \
+                baseline_dict[key]['wall_time_s']
+        ratio_dict[key] = ratio
+        print('> {} ({} places, {}): {:.2f}x time, {} -> {}'.format(
+            key[0], key[1], key[2], ratio,
+            format_memory_mb(baseline_dict[key]['peak_memory_mb']),
+            format_memory_mb(candidate_dict[key]['peak_memory_mb'])))
+    return ratio_dict
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the travel planning pipeline on synthetic '
+                    'Google map exports.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=default_size_list)
+    parser.add_argument('--distribution', default='clustered',
+                        choices=['uniform', 'clustered', 'dense'])
+    parser.add_argument('--output-dir', default='benchmark_results')
+    parser.add_argument('--scraping', action='store_true',
+                        help='Also benchmark the scraper against the local '
+                             'fixture server (needs selenium and Chrome)')
+    parser.add_argument('--compare', nargs=2,
+                        metavar=('BASELINE_JSON', 'CANDIDATE_JSON'))
+    parser.add_argument('--imports', action='store_true',
+                        help='Only measure the import time of the toolkits')
+    arguments = parser.parse_args()
+
+    if arguments.compare:
+        compare_benchmark_results(*arguments.compare)
+    elif arguments.imports:
+        measure_import_times()
+    else:
+        run_benchmarks(arguments.sizes, arguments.distribution,
+                       arguments.output_dir, arguments.scraping)
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+from dedup_toolkit import calculate_distance_m
+from profiling_toolkit import profile_stage
+
+# Cluster of the places saved after the clustering, without fitting KMeans
+# again (which can reshuffle every cluster and with them the day plans). The
+# index keeps the final centroids and the edges of the hull of every cluster
+# (generate_cluster_hulls()) as arrays, so a batch of new places is assigned
+# with a few numpy operations: a place inside hulls goes to the one whose
+# centroid is the closest, a place outside every hull goes to the nearest
+# centroid and is flagged, because it may deserve a new cluster or a refit
+
+default_batch_size = 2000  # Places tested at once against all the hull
+# edges. Bigger batches are faster but use batch size x edges booleans
+
+
+@profile_stage()
+def build_cluster_assignment_index(df_no_restaurant, centroid_array=None,
+                                   delta=0.02):
+    # df_no_restaurant has the column Cluster. centroid_array is the
+    # [[latitude, longitude], ...] of every cluster in the order of the
+    # cluster numbers, e.g. kmeans.cluster_centers_; by default the mean of
+    # every cluster, which is what KMeans converges to
+    from convex_hull_interpolation_toolkit import generate_cluster_hulls
+
+    cluster_array = np.sort(df_no_restaurant['Cluster'].unique())
+    if centroid_array is None:
+        centroid_array = df_no_restaurant.groupby('Cluster')[
+            ['Latitude', 'Longitude']].mean().loc[cluster_array].values
+    else:
+        centroid_array = np.asarray(centroid_array, dtype=float)[cluster_array]
+
+    hull_dict = generate_cluster_hulls(df_no_restaurant, delta)
+    edge_list = []  # (x1, y1, x2, y2) of every edge, cluster after cluster
+    for cluster_idx in cluster_array:
+        interp_x, interp_y = hull_dict[cluster_idx]
+        x = np.append(interp_x, interp_x[0])  # Close the polygon
+        y = np.append(interp_y, interp_y[0])
+        edge_list.append(np.column_stack((x[:-1], y[:-1], x[1:], y[1:])))
+    edge_array = np.vstack(edge_list)
+
+    cluster_index = {
+        'cluster': cluster_array,
+        'centroid': centroid_array,  # Latitude, longitude
+        'edge': edge_array,  # Longitude, latitude like the hulls
+        'edge_start': np.cumsum([0] + [len(edge) for edge in
+                                       edge_list[:-1]])  # 1st edge of every
+        # cluster
+    }
+    print('> Cluster assignment index built for {} clusters and {} hull '
+          'edges.'.format(len(cluster_array), len(edge_array)))
+    return cluster_index
+
+
+def find_containing_hulls(cluster_index, latitudes, longitudes):
+    # Boolean array (places x clusters) of the hulls that contain every
+    # place, by ray casting: a horizontal ray from the place crosses the
+    # edges of a polygon an odd number of times only if the place is inside
+    x1, y1, x2, y2 = cluster_index['edge'].T
+    px = longitudes[:, np.newaxis]
+    py = latitudes[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_array = ((y1 > py) != (y2 > py)) & \
+            (px < (x2 - x1) * (py - y1) / (y2 - y1) + x1)
+    crossing_count_array = np.add.reduceat(crossing_array.astype(np.int32),
+                                           cluster_index['edge_start'],
+                                           axis=1)  # Crossings per cluster
+    return crossing_count_array % 2 == 1
+
+
+def assign_points(cluster_index, latitudes, longitudes,
+                  batch_size=default_batch_size):
+    # Cluster of every point as a df with the columns Cluster, Inside Hull
+    # and Distance To Centroid (m), in the order of the points
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    position_array = np.empty(len(latitudes), dtype=int)
+    inside_hull_array = np.empty(len(latitudes), dtype=bool)
+
+    centroid_array = cluster_index['centroid']
+    for start in range(0, len(latitudes), batch_size):
+        batch_latitudes = latitudes[start:start + batch_size]
+        batch_longitudes = longitudes[start:start + batch_size]
+
+        # Same distance as KMeans.predict(): plain distance on
+        # [latitude, longitude]
+        distance_array = (batch_latitudes[:, np.newaxis] -
+                          centroid_array[:, 0]) ** 2 + \
+                         (batch_longitudes[:, np.newaxis] -
+                          centroid_array[:, 1]) ** 2
+        inside_array = find_containing_hulls(cluster_index, batch_latitudes,
+                                             batch_longitudes)
+        inside_hull = inside_array.any(axis=1)
+        # Inside some hulls: the closest of those. Outside: the closest of
+        # all
+        position_array[start:start + batch_size] = np.where(
+            inside_hull[:, np.newaxis] & ~inside_array, np.inf,
+            distance_array).argmin(axis=1)
+        inside_hull_array[start:start + batch_size] = inside_hull
+
+    return pd.DataFrame({
+        'Cluster': cluster_index['cluster'][position_array],
+        'Inside Hull': inside_hull_array,
+        'Distance To Centroid (m)': calculate_distance_m(
+            latitudes, longitudes, centroid_array[position_array, 0],
+            centroid_array[position_array, 1])
+    })
+
+
+@profile_stage()
+def assign_new_places(new_df, cluster_index,
+                      batch_size=default_batch_size):
+    # Caller function. new_df (e.g. the non-restaurants of a delta ingest)
+    # gets the columns Cluster, Outside Hulls and Distance To Centroid (m);
+    # the clusters of the places already planned don't change
+    assignment_df = assign_points(cluster_index, new_df['Latitude'].values,
+                                  new_df['Longitude'].values, batch_size)
+    output_df = new_df.copy()
+    if 'Cluster' in output_df.columns:
+        output_df = output_df.drop(columns=['Cluster'])
+    output_df.insert(0, 'Cluster', assignment_df['Cluster'].values)
+    output_df['Outside Hulls'] = ~assignment_df['Inside Hull'].values
+    output_df['Distance To Centroid (m)'] = assignment_df[
+        'Distance To Centroid (m)'].values
+
+    print('> {} new places assigned to a cluster, {} of them outside every '
+          'hull.'.format(output_df.shape[0],
+                         int(output_df['Outside Hulls'].sum())))
+    return output_df
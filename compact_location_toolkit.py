@@ -0,0 +1,164 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+from google_map_data_toolkit import extract_place_id, build_google_maps_url
+
+# Compact in-memory representation of the cleaned location df, for keeping
+# the places of many trips in a long-lived process. The long Google Maps URL
+# is replaced by the 2 numbers of its place id (the URL is rebuilt when it's
+# needed), the coordinates are stored as float32 or as fixed-point int32 and
+# the string columns become categories or compact strings
+
+# String columns of the cleaned df. Columns whose values repeat a lot
+# (Extracted Category, Category) become categories and mostly unique
+# columns (Address, Business Name) become compact strings
+compact_string_column_list = ['Address', 'Business Name',
+                              'Extracted Category', 'Category']
+
+# Latitude and Longitude are multiplied by this in the fixed-point mode. 1e7
+# is the precision of the json (7 decimals, ~1 cm) and 180 * 1e7 still fits
+# into an int32
+fixed_point_scale = 10 ** 7
+
+fixed_point_column_dict = {
+    'Latitude': 'Latitude E7',
+    'Longitude': 'Longitude E7'
+}
+
+
+def place_id_to_int_pair(place_id_series):
+    # "0x<high>:0x<low>" (ftid) -> (high, low) and "cid:<cid>" -> (0, cid).
+    # A real ftid never has a high part of 0, so 0 marks the cid form
+    is_cid = place_id_series.str.startswith('cid:')
+
+    high_array = np.zeros(place_id_series.shape[0], dtype=np.uint64)
+    low_array = np.zeros(place_id_series.shape[0], dtype=np.uint64)
+
+    ftid_parts = place_id_series[~is_cid].str.split(':', expand=True)
+    if not ftid_parts.empty:
+        high_array[~is_cid.values] = [int(part, 16) for part in ftid_parts[0]]
+        low_array[~is_cid.values] = [int(part, 16) for part in ftid_parts[1]]
+    low_array[is_cid.values] = [int(cid[4:]) for cid in
+                                place_id_series[is_cid]]
+    return high_array, low_array
+
+
+def int_pair_to_place_id(place_id_high, place_id_low):
+    # Inverse of place_id_to_int_pair() for a single place. Both halves of a
+    # ftid are 16 hex digits, leading zeros included, so they're padded back
+    if place_id_high == 0:
+        return 'cid:{}'.format(int(place_id_low))
+    return '0x{:016x}:0x{:016x}'.format(int(place_id_high), int(place_id_low))
+
+
+def compact_string_dtype():
+    # Arrow-backed strings store all the characters of a column in 1 buffer
+    # instead of 1 Python object per row. Without pyarrow, fall back to
+    # interned Python strings
+    try:
+        import pyarrow
+        return pd.StringDtype('pyarrow')
+    except ImportError:
+        return None
+
+
+def intern_strings(input_series):
+    # Make identical strings of an object column share 1 Python object
+    return input_series.map(
+        lambda x: sys.intern(x) if isinstance(x, str) else x)
+
+
+def compact_location_df(input_df, coordinate_mode='float32'):
+    # Return the compact version of a cleaned (or filtered, scraped,
+    # labeled...) location df. coordinate_mode is 'float32' (keeps the
+    # columns Latitude and Longitude, ~0.5 m precision, works directly with
+    # the maps and the clustering) or 'fixed' (int32 columns Latitude E7 and
+    # Longitude E7 with the full precision of the json; use
+    # expand_location_df() before mapping)
+    output_df = input_df.copy()
+
+    place_id_series = extract_place_id(output_df['Google Maps URL'])
+    if place_id_series.isnull().any():
+        raise ValueError('{} Google Maps URL(s) have neither a ftid nor a '
+                         'cid and cannot be compacted.'.format(
+            place_id_series.isnull().sum()))
+    place_id_high, place_id_low = place_id_to_int_pair(place_id_series)
+    url_position = output_df.columns.get_loc('Google Maps URL')
+    output_df = output_df.drop(columns=['Google Maps URL'])
+    output_df.insert(url_position, 'Place ID Low', place_id_low)
+    output_df.insert(url_position, 'Place ID High', place_id_high)
+
+    if coordinate_mode == 'float32':
+        for column in fixed_point_column_dict:
+            output_df[column] = output_df[column].astype(np.float32)
+    elif coordinate_mode == 'fixed':
+        for column, fixed_column in fixed_point_column_dict.items():
+            output_df[column] = np.round(
+                output_df[column].values * fixed_point_scale
+            ).astype(np.int32)
+        output_df = output_df.rename(columns=fixed_point_column_dict)
+    else:
+        raise ValueError('Unknown coordinate_mode {}. Use float32 or '
+                         'fixed.'.format(coordinate_mode))
+
+    string_dtype = compact_string_dtype()
+    for column in compact_string_column_list:
+        if column not in output_df.columns:
+            continue
+        if output_df[column].nunique() <= output_df.shape[0] / 2:
+            output_df[column] = output_df[column].astype('category')
+        elif string_dtype is not None:
+            output_df[column] = output_df[column].astype(string_dtype)
+        else:
+            output_df[column] = intern_strings(output_df[column])
+
+    print('> Location df compacted from {:.1f} KB to {:.1f} KB.'.format(
+        location_df_memory_kb(input_df), location_df_memory_kb(output_df)))
+    return output_df
+
+
+def expand_location_df(input_df):
+    # Inverse of compact_location_df(): rebuild the Google Maps URL and
+    # restore float64 coordinates and object string columns
+    output_df = input_df.copy()
+
+    google_maps_urls = [
+        build_google_maps_url(int_pair_to_place_id(high, low), address)
+        for high, low, address in zip(output_df['Place ID High'],
+                                      output_df['Place ID Low'],
+                                      output_df['Address'])
+    ]
+    url_position = output_df.columns.get_loc('Place ID High')
+    output_df = output_df.drop(columns=['Place ID High', 'Place ID Low'])
+    output_df.insert(url_position, 'Google Maps URL', google_maps_urls)
+
+    for column, fixed_column in fixed_point_column_dict.items():
+        if fixed_column in output_df.columns:
+            output_df[fixed_column] = \
+                output_df[fixed_column].values / fixed_point_scale
+            output_df = output_df.rename(columns={fixed_column: column})
+        output_df[column] = output_df[column].astype(np.float64)
+
+    for column in compact_string_column_list:
+        if column in output_df.columns:
+            output_df[column] = output_df[column].astype(object).where(
+                output_df[column].notnull(), np.nan)  # Missing values are
+            # NaN again, not pd.NA, like in the df made by json_to_df()
+
+    return output_df
+
+
+def get_google_maps_url(row):
+    # Google Maps URL of a row of a normal or a compact location df
+    if 'Google Maps URL' in row.index:
+        return row['Google Maps URL']
+    return build_google_maps_url(
+        int_pair_to_place_id(row['Place ID High'], row['Place ID Low']),
+        row['Address'])
+
+
+def location_df_memory_kb(input_df):
+    # Real memory footprint of a df, including the Python string objects
+    return input_df.memory_usage(deep=True).sum() / 1024
@@ -1,10 +1,13 @@
-from scipy.spatial import ConvexHull
-from scipy import interpolate
-
 import numpy as np
 
+from profiling_toolkit import profile_stage
+
 
+@profile_stage()
 def generate_convex_hull(points):
+    from scipy.spatial import ConvexHull  # SciPy is only loaded when a hull
+    # is needed
+
     hull = ConvexHull(points)  # Get convex hull
 
     # get x and y coordinates
@@ -23,6 +26,8 @@ def generate_convex_hull(points):
 
 def generate_interpolation(x_hull, y_hull):
     # Make interpolation from convex hull
+    from scipy import interpolate
+
     dist = np.sqrt(
         (x_hull[:-1] - x_hull[1:]) ** 2 + (y_hull[:-1] - y_hull[1:]) ** 2)
     dist_along = np.concatenate(([0], dist.cumsum()))
@@ -38,6 +43,88 @@ def generate_interpolation(x_hull, y_hull):
     return interp_x, interp_y
 
 
+def create_four_point_diamond_around(points, delta):
+    # points is a numpy.ndarray that contains only 1 true location's
+    # longitude and latitude. This function will create 4 more
+    # pseudo-locations and add them back to the points numpy.ndarray
+
+    new_rows = np.array([
+        [points[0, 0] + delta, points[0, 1]],
+        # Plus delta to the first number
+        [points[0, 0] - delta, points[0, 1]],
+        # Minus delta from the first number
+        [points[0, 0], points[0, 1] + delta],
+        # Plus delta to the second number
+        [points[0, 0], points[0, 1] - delta],
+        # Minus delta from the second number
+    ])  # Create a numpy.ndarray for the 4 pseudo-locations
+
+    return new_rows
+
+
+def generate_cluster_hulls(df_no_restaurant, delta=0.02):
+    # Smoothed convex hull of every cluster of df_no_restaurant as
+    # {cluster number: (interpolated longitudes, interpolated latitudes)}.
+    # delta is the amount to add or subtract for the pseudo-locations. I
+    # have adjusted this based on the Wilmington travel planning
+    hull_dict = {}
+    for cluster_idx in df_no_restaurant.Cluster.unique():
+        # You won't have a cluster that contains 0 location Technically,
+        # you can only make convex hull and the later interpolation with at
+        # least 3 points. So for clusters that contain only 1 or 2
+        # locations, you need to do something to increase the
+        # pseudo-location number to make the shade
+
+        cluster_df = df_no_restaurant[df_no_restaurant.Cluster == cluster_idx]
+        location_count_in_cluster = cluster_df.shape[0]
+
+        points = cluster_df[['Longitude', 'Latitude']].values  # Obtain the
+        # true location's longitude and latitude. Remember, points is a
+        # numpy.ndarray not a df
+
+        if location_count_in_cluster == 1:# When a cluster has only 1
+            # location, add 4 pseudo-locations to make a diamond shade
+            # around the 1 true location. The side of the diamond will be
+            # controlled by the delta variable
+
+            new_rows = create_four_point_diamond_around(points, delta)
+            # Create 4 pseudo points around the 1 true location
+
+            points = np.vstack((points, new_rows))  # Add the 4
+            # pseudo-locations to be with the 1 true location
+
+        elif location_count_in_cluster == 2:  # When a cluster has only 2
+            # locations, you still cannot use the midpoint of the 2
+            # locations as the hull will be flat and the algorithum will
+            # complain about it. My method is to calculate out the midpoint
+            # and add in 4 pseudo-locations to create a diamond shape around
+            # that midpoint. Those 4 pseudo-locations will be added into the
+            # point ndarray to make the hull. I used a diamond here to avoid
+            # have only 2 pseudo-locations that perfectly align with the 2
+            # true locations, resulting in a flat hull again.
+            mid_point = points.mean(axis=0)
+            reshaped_mid_point = np.reshape(mid_point, (1, 2))
+
+            new_rows = create_four_point_diamond_around(reshaped_mid_point,
+                                                        delta)
+
+            points = np.vstack(
+                (points, new_rows))  # Add the 4 pseudo-locations to be with
+            # the 2 true locations
+
+        else:  # location_count_in_cluster >= 3:
+            # Then you can simply use the points obtained before without any
+            # processing
+
+            pass
+
+        x_hull, y_hull = generate_convex_hull(
+            points)  # Generate the convex
+        # hull
 
+        interp_x, interp_y = generate_interpolation(x_hull, y_hull)
+        # Generate the interpolation
 
+        hull_dict[cluster_idx] = (interp_x, interp_y)
 
+    return hull_dict
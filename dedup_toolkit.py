@@ -0,0 +1,231 @@
+import re
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+from google_map_data_toolkit import extract_place_id
+from profiling_toolkit import profile_stage
+
+# Merging several Google map exports (several trips or several people's
+# lists) gives the same place more than once, sometimes with a slightly
+# different name or coordinates. Rather than comparing every pair of places,
+# the candidates are blocked: places with the same ftid/cid are duplicates
+# right away and the others are only compared with places in the same or a
+# neighbouring grid cell, so the work grows linearly with the number of
+# places
+
+meters_per_degree_latitude = 111320  # Length of 1 degree of latitude
+
+# Offsets to the neighbouring grid cells. Only half of the 8 neighbours are
+# needed since every pair of cells is then visited exactly once
+neighbour_cell_offset_list = [(0, 0), (1, -1), (1, 0), (1, 1), (0, 1)]
+
+latitude_band_degree = 1  # Height of the latitude bands that share a cell
+# width. cos(latitude) barely changes over 1 degree, so the cells stay close
+# to max_distance_m wide
+
+
+def combine_location_dfs(location_df_list, source_name_list=None):
+    # Stack the cleaned location dfs of several exports. The column Source
+    # tells which export every row comes from
+    source_name_list = source_name_list or list(
+        range(len(location_df_list)))
+
+    df_list = []
+    for location_df, source_name in zip(location_df_list, source_name_list):
+        source_df = location_df.copy()
+        source_df['Source'] = source_name
+        df_list.append(source_df)
+
+    return pd.concat(df_list, ignore_index=True)
+
+
+def normalize_text(input_series):
+    # Lowercase and keep only letters and digits so "Joe's Cafe" and
+    # "Joes Café." are compared on their content
+    return input_series.fillna('').astype(str).str.lower().map(
+        lambda x: re.sub(r'[^0-9a-zÀ-ɏ]+', ' ', x).strip())
+
+
+def text_similarity(text_a, text_b):
+    # 0 (nothing in common) to 1 (same text). Empty texts are never similar
+    if not text_a or not text_b:
+        return 0.0
+    return SequenceMatcher(None, text_a, text_b).ratio()
+
+
+def split_street_address(address_series):
+    # Street number and street name of every address. Only the part before
+    # the 1st comma is kept: the city, state and ZIP code are the same for
+    # all the places of an area and would make any 2 addresses look similar
+    street_series = normalize_text(
+        address_series.fillna('').astype(str).str.split(',').str[0])
+    street_parts = street_series.str.extract(r'^(\d+[a-z]?\b)?\s*(.*)$')
+    return street_parts[0].fillna('').values, street_parts[1].fillna('').values
+
+
+def compare_names(name_a, name_b, min_similarity):
+    # True or False, or None when a name is missing and can't be compared
+    if not name_a or not name_b:
+        return None
+    return text_similarity(name_a, name_b) >= min_similarity
+
+
+def compare_addresses(number_a, street_a, number_b, street_b,
+                      min_similarity):
+    # Same as compare_names() for the street addresses. 2 different street
+    # numbers are 2 different places, however similar the street names are
+    if not street_a or not street_b:
+        return None
+    if number_a and number_b and number_a != number_b:
+        return False
+    return text_similarity(street_a, street_b) >= min_similarity
+
+
+def generate_spatial_candidate_pairs(input_df, max_distance_m):
+    # Return the (i, j) positions of all the pairs of places that are in the
+    # same or in neighbouring grid cells. A cell is max_distance_m high and
+    # at least max_distance_m wide, so 2 places closer than max_distance_m
+    # are always in neighbouring cells. A degree of longitude shrinks with
+    # cos(latitude), so the width of the cells in degrees is set per
+    # latitude band from the latitude of the band that is the farthest from
+    # the equator; a single width for all the places would be too narrow for
+    # the places far from their mean latitude
+    cell_latitude = max_distance_m / meters_per_degree_latitude
+    band_num_cell = max(1, int(latitude_band_degree / cell_latitude))
+
+    cell_df = pd.DataFrame({
+        'position': np.arange(input_df.shape[0]),
+        'longitude': input_df['Longitude'].values,
+        'cell_y': np.floor(input_df['Latitude'].values / cell_latitude),
+    }).dropna()
+    cell_df['band'] = cell_df['cell_y'] // band_num_cell
+
+    pair_list = []
+    for band in cell_df['band'].unique():
+        # The band and the 1st row of cells of the next band, for the pairs
+        # across the edge. Only the pairs with a place of the band are kept,
+        # the others belong to the next band
+        band_top = (band + 1) * band_num_cell
+        band_df = cell_df[(cell_df['band'] == band) |
+                          (cell_df['cell_y'] == band_top)].copy()
+        band_df['in_band'] = band_df['band'] == band
+        max_abs_latitude = min(max(abs(band * band_num_cell),
+                                   abs(band_top + 1)) * cell_latitude, 90)
+        cell_longitude = cell_latitude / max(
+            np.cos(np.radians(max_abs_latitude)), 0.01)
+        band_df['cell_x'] = np.floor(band_df['longitude'] / cell_longitude)
+        band_df = band_df[['position', 'cell_x', 'cell_y', 'in_band']]
+
+        for offset_x, offset_y in neighbour_cell_offset_list:
+            shifted_df = band_df.copy()
+            shifted_df['cell_x'] -= offset_x
+            shifted_df['cell_y'] -= offset_y
+            pair_df = band_df.merge(shifted_df, on=['cell_x', 'cell_y'],
+                                    suffixes=('_a', '_b'))
+            pair_df = pair_df[pair_df['in_band_a'] | pair_df['in_band_b']]
+            if (offset_x, offset_y) == (0, 0):  # Keep every pair of the
+                # same cell once and skip the place itself
+                pair_df = pair_df[
+                    pair_df['position_a'] < pair_df['position_b']]
+            pair_list.append(pair_df[['position_a', 'position_b']].values)
+
+    return np.vstack(pair_list) if pair_list else np.empty((0, 2), dtype=int)
+
+
+def calculate_distance_m(latitude_a, longitude_a, latitude_b, longitude_b):
+    # Equirectangular approximation of the distance in meters, which is
+    # accurate enough for places that are at most a few hundred meters apart
+    x = np.radians(longitude_b - longitude_a) * np.cos(
+        np.radians((latitude_a + latitude_b) / 2))
+    y = np.radians(latitude_b - latitude_a)
+    return np.sqrt(x ** 2 + y ** 2) * 6371000
+
+
+def find_root(parent_array, i):
+    # Union-find root with path halving
+    while parent_array[i] != i:
+        parent_array[i] = parent_array[parent_array[i]]
+        i = parent_array[i]
+    return i
+
+
+def union(parent_array, i, j):
+    root_i = find_root(parent_array, i)
+    root_j = find_root(parent_array, j)
+    if root_i != root_j:
+        parent_array[max(root_i, root_j)] = min(root_i, root_j)
+
+
+@profile_stage()
+def find_duplicate_groups(input_df, max_distance_m=75, min_similarity=0.85):
+    # Give every row a Duplicate Group number. Rows of the same group are the
+    # same place: they share a ftid/cid, or they're at most max_distance_m
+    # apart and their Business Name and street address agree. A name or
+    # address missing on either side isn't compared, but whatever can be
+    # compared has to agree, and at least 1 of the 2 has to
+    num_row = input_df.shape[0]
+    parent_array = np.arange(num_row)
+
+    # Block 1: same ftid/cid
+    place_id_series = extract_place_id(input_df['Google Maps URL'])
+    for positions in pd.Series(np.arange(num_row)).groupby(
+            place_id_series.values).groups.values():
+        positions = list(positions)
+        for position in positions[1:]:
+            union(parent_array, positions[0], position)
+
+    # Block 2: close places with the same name and address
+    candidate_pairs = generate_spatial_candidate_pairs(input_df,
+                                                       max_distance_m)
+    latitudes = input_df['Latitude'].values
+    longitudes = input_df['Longitude'].values
+    distances = calculate_distance_m(
+        latitudes[candidate_pairs[:, 0]], longitudes[candidate_pairs[:, 0]],
+        latitudes[candidate_pairs[:, 1]], longitudes[candidate_pairs[:, 1]])
+    close_pairs = candidate_pairs[distances <= max_distance_m]
+
+    names = normalize_text(input_df['Business Name']).values
+    street_numbers, streets = split_street_address(input_df['Address'])
+    for i, j in close_pairs:
+        if find_root(parent_array, i) == find_root(parent_array, j):
+            continue  # Already known to be the same place
+        agreement_list = [
+            compare_names(names[i], names[j], min_similarity),
+            compare_addresses(street_numbers[i], streets[i],
+                              street_numbers[j], streets[j], min_similarity)
+        ]
+        if False not in agreement_list and True in agreement_list:
+            union(parent_array, i, j)
+
+    group_array = np.array([find_root(parent_array, i)
+                            for i in range(num_row)])
+    return pd.Series(pd.factorize(group_array)[0], index=input_df.index,
+                     name='Duplicate Group')
+
+
+@profile_stage()
+def deduplicate_places(input_df, max_distance_m=75, min_similarity=0.85):
+    # Caller function that keeps 1 canonical row per place. The canonical row
+    # is the most complete one (fewest missing values) of its group and the
+    # column Duplicate Count tells how many rows were merged into it, so
+    # repeated places are scraped and mapped only once
+    output_df = input_df.copy()
+    output_df['Duplicate Group'] = find_duplicate_groups(
+        output_df, max_distance_m, min_similarity)
+    output_df['Duplicate Count'] = output_df.groupby(
+        'Duplicate Group')['Duplicate Group'].transform('size')
+
+    output_df['_non_null_count'] = output_df.notnull().sum(axis=1)
+    canonical_df = output_df.sort_values(
+        by=['Duplicate Group', '_non_null_count'],
+        ascending=[True, False],
+        kind='stable'
+    ).drop_duplicates(subset=['Duplicate Group'])
+    canonical_df = canonical_df.drop(columns=['_non_null_count']) \
+        .sort_index().reset_index(drop=True)
+
+    print('> {} rows have been merged into {} unique places.'.format(
+        input_df.shape[0], canonical_df.shape[0]))
+    return canonical_df
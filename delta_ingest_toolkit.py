@@ -0,0 +1,119 @@
+import json
+from datetime import datetime
+
+import pandas as pd
+
+from google_map_data_toolkit import json_to_df, location_df_clean, \
+    extract_place_id
+from profiling_toolkit import profile_stage
+
+# Delta ingestion of a new Google map export. Instead of scraping, labelling
+# and clustering every saved place again, the new export is compared with the
+# place table of the previous run by place id (ftid or cid) and by the
+# Updated timestamp, and only the added and changed places go through the
+# rest of the pipeline. A change manifest records what happened
+
+delta_key_list = ['added', 'changed', 'removed', 'unchanged']
+
+
+def add_place_id_column(input_df):
+    # Add the column Place ID (ftid or cid from the Google Maps URL) if the df
+    # doesn't have it yet
+    output_df = input_df.copy()
+    if 'Place ID' not in output_df.columns:
+        output_df.insert(0, 'Place ID',
+                         extract_place_id(output_df['Google Maps URL']))
+    return output_df
+
+
+@profile_stage()
+def compute_export_delta(new_df, previous_df):
+    # Split the places of new_df (cleaned with keep_updated=True) into
+    # added, changed and unchanged places, and find the places of
+    # previous_df that are removed from the new export. A place is changed
+    # when its Updated timestamp is different. If previous_df has no column
+    # Updated (e.g. a .csv saved before the delta ingestion existed), the
+    # places found in both are regarded as unchanged
+    new_df = add_place_id_column(new_df)
+    previous_df = add_place_id_column(previous_df)
+
+    in_previous = new_df['Place ID'].isin(previous_df['Place ID'])
+    in_new = previous_df['Place ID'].isin(new_df['Place ID'])
+
+    if 'Updated' in previous_df.columns and 'Updated' in new_df.columns:
+        previous_updated = previous_df.drop_duplicates(
+            subset=['Place ID']).set_index('Place ID')['Updated']
+        is_changed = in_previous & (
+                new_df['Place ID'].map(previous_updated).astype(str) !=
+                new_df['Updated'].astype(str))
+    else:
+        is_changed = pd.Series(False, index=new_df.index)
+
+    delta_dict = {
+        'added': new_df[~in_previous].reset_index(drop=True),
+        'changed': new_df[is_changed].reset_index(drop=True),
+        'removed': previous_df[~in_new].reset_index(drop=True),
+        'unchanged': new_df[in_previous & ~is_changed].reset_index(drop=True)
+    }
+
+    print('> {} places added, {} changed, {} removed and {} unchanged since '
+          'the previous export.'.format(*[delta_dict[key].shape[0]
+                                          for key in delta_key_list]))
+    return delta_dict
+
+
+def get_places_to_process(delta_dict):
+    # The added and changed places are the only ones that need to be
+    # filtered, scraped and labeled again
+    return pd.concat([delta_dict['added'], delta_dict['changed']],
+                     ignore_index=True)
+
+
+def build_change_manifest(delta_dict, export_path=None):
+    # Summary of a delta ingestion with the place ids of every group except
+    # the unchanged places, which are only counted
+    manifest_dict = {
+        'created': datetime.now().isoformat(),
+        'export': export_path,
+        'counts': {key: int(delta_dict[key].shape[0])
+                   for key in delta_key_list},
+    }
+    for key in ['added', 'changed', 'removed']:
+        manifest_dict[key] = delta_dict[key]['Place ID'].tolist()
+    return manifest_dict
+
+
+def save_change_manifest(manifest_dict, file_path):
+    with open(file_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest_dict, file, indent=2)
+    print('> Change manifest saved to {}.'.format(file_path))
+    return file_path
+
+
+def apply_delta(previous_df, processed_df, delta_dict):
+    # Build the new place table: the previous table without the removed and
+    # the changed places, plus the freshly processed (e.g. scraped and
+    # labeled) added and changed places
+    previous_df = add_place_id_column(previous_df)
+    processed_df = add_place_id_column(processed_df)
+
+    outdated_place_id_set = set(delta_dict['removed']['Place ID']) | \
+        set(delta_dict['changed']['Place ID'])
+    kept_df = previous_df[~previous_df['Place ID'].isin(outdated_place_id_set)]
+
+    return pd.concat([kept_df, processed_df], ignore_index=True)
+
+
+def delta_ingest(file_path, previous_df, manifest_path=None):
+    # Caller function: read and clean the new export, compare it with the
+    # previous place table and optionally save the change manifest. Returns
+    # the places that need processing together with the delta, which is
+    # later given to apply_delta()
+    new_df = location_df_clean(json_to_df(file_path), keep_updated=True)
+    delta_dict = compute_export_delta(new_df, previous_df)
+
+    if manifest_path is not None:
+        save_change_manifest(build_change_manifest(delta_dict, file_path),
+                             manifest_path)
+
+    return get_places_to_process(delta_dict), delta_dict
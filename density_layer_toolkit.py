@@ -0,0 +1,254 @@
+import folium
+import folium.plugins as plugins
+import numpy as np
+import pandas as pd
+from branca.element import MacroElement
+from jinja2 import Template
+
+# Aggregated layers for dense place sets. Instead of 1 folium.Marker per
+# place, the places are binned into hexagons (1 hexagon layer per zoom
+# range, binned with vectorized numpy) and drawn together with a heatmap.
+# The individual markers are only shown from a high zoom on
+
+# A hexagon is about this many screen pixels wide at the zoom it's made for
+hex_size_pixel = 40
+
+# Zoom levels that get their own hexagon layer. The layer of a zoom level is
+# shown until the zoom of the next one (or marker_min_zoom for the last one)
+default_hex_zoom_list = [8, 10, 12, 14]
+
+default_marker_min_zoom = 15  # From this zoom on the markers are shown
+
+# Hexagon outline color of the category with the most places in a hexagon
+category_color_dict = {
+    'Restaurant': 'orange',
+    'Site': 'blue',
+    'Garden': 'green',
+    'Museum': 'red',
+    'Store': 'purple'
+}
+
+
+def hex_size_for_zoom(zoom, latitude):
+    # Radius (center to corner) of the hexagons in degrees of latitude for a
+    # web mercator zoom level. A 256 pixel tile covers 360 degrees of
+    # longitude at zoom 0, and a degree of longitude is cos(latitude)
+    # shorter than a degree of latitude
+    degree_per_pixel = 360 / (256 * 2 ** zoom)
+    return hex_size_pixel * degree_per_pixel * np.cos(np.radians(latitude)) / 2
+
+
+def project_coordinates(longitudes, latitudes, latitude_origin):
+    # Stretch the longitudes so 1 unit is the same distance in both
+    # directions around latitude_origin, otherwise the hexagons would be
+    # squashed
+    x = longitudes * np.cos(np.radians(latitude_origin))
+    return x, latitudes
+
+
+def unproject_coordinates(x, y, latitude_origin):
+    return x / np.cos(np.radians(latitude_origin)), y
+
+
+def coordinates_to_hex(x, y, hex_size):
+    # Vectorized pointy-top hexagon binning. Every point is converted to
+    # fractional axial coordinates and rounded to the nearest hexagon with
+    # the cube coordinate rounding
+    q = (np.sqrt(3) / 3 * x - y / 3) / hex_size
+    r = (2 / 3 * y) / hex_size
+    s = -q - r
+
+    rounded_q = np.round(q)
+    rounded_r = np.round(r)
+    rounded_s = np.round(s)
+    q_diff = np.abs(rounded_q - q)
+    r_diff = np.abs(rounded_r - r)
+    s_diff = np.abs(rounded_s - s)
+
+    fix_q = (q_diff > r_diff) & (q_diff > s_diff)
+    fix_r = ~fix_q & (r_diff > s_diff)
+    rounded_q = np.where(fix_q, -rounded_r - rounded_s, rounded_q)
+    rounded_r = np.where(fix_r, -rounded_q - rounded_s, rounded_r)
+    return rounded_q.astype(np.int64), rounded_r.astype(np.int64)
+
+
+def hex_to_coordinates(q, r, hex_size):
+    # Center of the hexagons
+    x = hex_size * np.sqrt(3) * (q + r / 2)
+    y = hex_size * 3 / 2 * r
+    return x, y
+
+
+def hex_corner_offsets(hex_size):
+    # The 6 corners of a pointy-top hexagon relative to its center
+    angles = np.radians(60 * np.arange(6) - 30)
+    return hex_size * np.cos(angles), hex_size * np.sin(angles)
+
+
+def aggregate_hexbins(open_df, hex_size, latitude_origin=None):
+    # Count the places of every category in every hexagon. Returns 1 row
+    # per non-empty hexagon with its center, the total Count and 1 count
+    # column per category
+    if latitude_origin is None:
+        latitude_origin = open_df['Latitude'].mean()
+    x, y = project_coordinates(open_df['Longitude'].values,
+                               open_df['Latitude'].values, latitude_origin)
+    q, r = coordinates_to_hex(x, y, hex_size)
+
+    hex_codes, hex_keys = pd.factorize(pd.MultiIndex.from_arrays([q, r]))
+    category_codes, category_array = pd.factorize(open_df['Category'],
+                                                  use_na_sentinel=False)
+
+    num_hex = len(hex_keys)
+    count_matrix = np.zeros((num_hex, len(category_array)), dtype=np.int64)
+    np.add.at(count_matrix, (hex_codes, category_codes), 1)  # Scatter-add
+    # all the places into their (hexagon, category) cell at once
+
+    hex_q = hex_keys.get_level_values(0).values
+    hex_r = hex_keys.get_level_values(1).values
+    center_x, center_y = hex_to_coordinates(hex_q, hex_r, hex_size)
+    center_longitude, center_latitude = unproject_coordinates(
+        center_x, center_y, latitude_origin)
+
+    hexbin_df = pd.DataFrame(count_matrix,
+                             columns=[str(category)
+                                      for category in category_array])
+    hexbin_df.insert(0, 'Count', count_matrix.sum(axis=1))
+    hexbin_df.insert(0, 'Longitude', center_longitude)
+    hexbin_df.insert(0, 'Latitude', center_latitude)
+    hexbin_df.insert(0, 'r', hex_r)
+    hexbin_df.insert(0, 'q', hex_q)
+    return hexbin_df
+
+
+def hexbin_polygon_locations(hexbin_df, hex_size, latitude_origin):
+    # [[latitude, longitude], ...] corners of every hexagon, all computed in
+    # 1 broadcast
+    offset_x, offset_y = hex_corner_offsets(hex_size)
+    center_x, center_y = project_coordinates(hexbin_df['Longitude'].values,
+                                             hexbin_df['Latitude'].values,
+                                             latitude_origin)
+    corner_longitude, corner_latitude = unproject_coordinates(
+        center_x[:, None] + offset_x[None, :],
+        center_y[:, None] + offset_y[None, :], latitude_origin)
+    return np.stack((corner_latitude, corner_longitude), axis=2).tolist()
+
+
+def add_heatmap_layer(my_map, open_df, zoom, name='Heatmap'):
+    # The heatmap is fed with the centers of small hexagons (sized for zoom)
+    # weighted by their number of places rather than with every place, so
+    # its size in the html doesn't grow with the number of places
+    latitude_origin = open_df['Latitude'].mean()
+    hexbin_df = aggregate_hexbins(
+        open_df, hex_size_for_zoom(zoom, latitude_origin), latitude_origin)
+
+    heatmap_group = folium.FeatureGroup(name=name)
+    plugins.HeatMap(
+        hexbin_df[['Latitude', 'Longitude', 'Count']].values.tolist(),
+        radius=15,
+        blur=20,
+        min_opacity=0.3
+    ).add_to(heatmap_group)
+    heatmap_group.add_to(my_map)
+    return heatmap_group
+
+
+def add_hexbin_layer(my_map, open_df, zoom):
+    # 1 hexagon layer sized for the given zoom. The tooltip of a hexagon
+    # lists the number of places of every category in it
+    latitude_origin = open_df['Latitude'].mean()
+    hex_size = hex_size_for_zoom(zoom, latitude_origin)
+    hexbin_df = aggregate_hexbins(open_df, hex_size, latitude_origin)
+    category_column_list = list(hexbin_df.columns[5:])
+    polygon_locations = hexbin_polygon_locations(hexbin_df, hex_size,
+                                                 latitude_origin)
+    max_count = hexbin_df['Count'].max()
+
+    hexbin_group = folium.FeatureGroup(name='Hexagons (zoom {})'.format(zoom))
+    for (_, row), locations in zip(hexbin_df.iterrows(), polygon_locations):
+        category_count_dict = {category: int(row[category])
+                               for category in category_column_list
+                               if row[category] > 0}
+        top_category = max(category_count_dict, key=category_count_dict.get)
+        tooltip_html = '<b>{} places</b><br>{}'.format(
+            int(row['Count']),
+            '<br>'.join('{}: {}'.format(category, count)
+                        for category, count in sorted(
+                    category_count_dict.items(), key=lambda x: -x[1])))
+
+        folium.Polygon(
+            locations=locations,
+            color=category_color_dict.get(top_category, 'grey'),
+            weight=1,
+            fill=True,
+            fill_opacity=0.15 + 0.6 * row['Count'] / max_count,
+            tooltip=tooltip_html
+        ).add_to(hexbin_group)
+
+    hexbin_group.add_to(my_map)
+    return hexbin_group
+
+
+class ZoomLayerSwitch(MacroElement):
+    # Show every layer only within its [min_zoom, max_zoom] range. Layers
+    # are added to or removed from the map on every zoomend, which also
+    # keeps the checkboxes of the LayerControl in sync
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var zoomLayers = [
+                {% for min_zoom, max_zoom, layer in this.zoom_layer_list %}
+                [{{ min_zoom }}, {{ max_zoom }}, {{ layer.get_name() }}],
+                {% endfor %}
+            ];
+            function switchLayers() {
+                var zoom = map.getZoom();
+                zoomLayers.forEach(function(entry) {
+                    var visible = zoom >= entry[0] && zoom <= entry[1];
+                    if (visible && !map.hasLayer(entry[2])) {
+                        map.addLayer(entry[2]);
+                    } else if (!visible && map.hasLayer(entry[2])) {
+                        map.removeLayer(entry[2]);
+                    }
+                });
+            }
+            map.on('zoomend', switchLayers);
+            switchLayers();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, zoom_layer_list):
+        super().__init__()
+        self._name = 'ZoomLayerSwitch'
+        self.zoom_layer_list = zoom_layer_list  # [(min_zoom, max_zoom,
+        # layer), ...]
+
+
+def add_aggregated_layers(my_map, open_df, marker_group_list,
+                          hex_zoom_list=None,
+                          marker_min_zoom=default_marker_min_zoom):
+    # Caller function for the aggregated mode of generate_folium_map(): a
+    # heatmap and 1 hexagon layer per zoom range below marker_min_zoom, and
+    # the marker feature groups (restaurants, sites) only from
+    # marker_min_zoom on
+    hex_zoom_list = sorted(hex_zoom_list or default_hex_zoom_list)
+    hex_zoom_list = [zoom for zoom in hex_zoom_list if zoom < marker_min_zoom]
+
+    zoom_layer_list = []
+    heatmap_group = add_heatmap_layer(my_map, open_df, marker_min_zoom)
+    zoom_layer_list.append((0, marker_min_zoom - 1, heatmap_group))
+
+    for i, zoom in enumerate(hex_zoom_list):
+        min_zoom = 0 if i == 0 else zoom
+        max_zoom = hex_zoom_list[i + 1] - 1 if i + 1 < len(hex_zoom_list) \
+            else marker_min_zoom - 1
+        zoom_layer_list.append((min_zoom, max_zoom,
+                                add_hexbin_layer(my_map, open_df, zoom)))
+
+    for marker_group in marker_group_list:
+        zoom_layer_list.append((marker_min_zoom, 30, marker_group))
+
+    ZoomLayerSwitch(zoom_layer_list).add_to(my_map)
+    return my_map
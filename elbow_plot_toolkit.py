@@ -1,9 +1,11 @@
-import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
-from kneed import KneeLocator
-from tqdm.notebook import tqdm  # Show loop progress
+from tqdm.auto import tqdm  # Show loop progress (a notebook widget in
+# Jupyter and a text bar elsewhere, e.g. when benchmarking)
 
-from scrape_google_map_toolkit import sound_notification
+from notification_toolkit import notify
+from profiling_toolkit import profile_stage
+
+# matplotlib, scikit-learn and kneed are imported inside the functions that
+# use them so importing this module stays fast
 
 
 def determine_max_num_try_cluster(coordinate_array):
@@ -31,10 +33,12 @@ def determine_max_num_try_cluster(coordinate_array):
     return max_num_try_cluster
 
 
+@profile_stage()
 def calculate_inertia(coordinate_array, max_num_try_cluster):
     # Calculate inertia for each k value
     # max_num_try_cluster is the max number to try to do the clustering
     # wcss is a list of inertia
+    from sklearn.cluster import KMeans
 
     wcss = []
     for k in tqdm(range(1, max_num_try_cluster + 1)):
@@ -60,6 +64,8 @@ def generate_x_axis(max_num_try_cluster):
 
 
 def calculate_optimal_cluster_num(x_axis, wcss):
+    from kneed import KneeLocator
+
     kn = KneeLocator(  # Calculate out the optimal number of clusters
         x_axis,
         wcss,
@@ -74,6 +80,7 @@ def calculate_optimal_cluster_num(x_axis, wcss):
 
 def make_elbow_plot(coordinate_array, max_num_try_cluster):
     # Generate the elbow plot
+    import matplotlib.pyplot as plt
 
     x_axis = generate_x_axis(max_num_try_cluster)
     wcss = calculate_inertia(coordinate_array, max_num_try_cluster)
@@ -104,5 +111,5 @@ def make_elbow_plot(coordinate_array, max_num_try_cluster):
     )
 
     plt.show()
-    sound_notification()  # Vocally notify the job is done
+    notify('done')  # Vocally notify the job is done
     return optimal_cluster_num
@@ -0,0 +1,459 @@
+import json
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+
+from profiling_toolkit import profile_stage
+
+# Export the places, the cluster hulls and the day routes of a trip to
+# GeoJSON (web maps), KML (Google Earth, Organic Maps...) and GPX (hiking and
+# navigation apps). Every writer streams: the places are written 1 row at a
+# time from a df or from an iterable of dfs (e.g. several trips, or
+# pd.read_csv(..., chunksize=...)), the hulls 1 cluster at a time, so the
+# memory used doesn't grow with the size of the export. Fewer decimals of
+# the coordinates make smaller files: 5 decimals are about 1 m
+
+default_coordinate_decimals = 6
+
+# Columns written as the properties/description of a place, if the df has
+# them
+place_property_column_list = ['Business Name', 'Address', 'Category',
+                              'Extracted Category', 'Google Maps URL',
+                              'Cluster', 'Day', 'Visit Start', 'Visit End']
+
+# KML icon color of every category (aabbggrr)
+kml_color_dict = {
+    'Restaurant': 'ff00a5ff',  # Orange
+    'Site': 'ffff0000',  # Blue
+    'Garden': 'ff008000',  # Green
+    'Museum': 'ff0000ff',  # Red
+    'Store': 'ff800080'  # Purple
+}
+
+
+def to_json_value(value):
+    # NaN and NA become null and numpy scalars become Python numbers
+    if value is None or (np.isscalar(value) and pd.isnull(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def format_coordinate(value, coordinate_decimals):
+    # Fixed number of decimals without trailing zeros, e.g. 34.2257
+    return '{:.{}f}'.format(value, coordinate_decimals).rstrip('0') \
+        .rstrip('.')
+
+
+def hex_to_kml_color(hex_color):
+    # '#rrggbb' -> 'bbggrr', KML colors are written the other way around
+    return hex_color[5:7] + hex_color[3:5] + hex_color[1:3]
+
+
+def get_fill_style_id(hex_color):
+    # Id of the shared KML style of a polygon fill color, e.g. fill-1f77b4
+    return 'fill-{}'.format(hex_color.lstrip('#').lower())
+
+
+def get_place_name(property_dict):
+    # Business name, else the address, like the folium popups
+    for column in ['Business Name', 'Address']:
+        if property_dict.get(column) is not None:
+            return str(property_dict[column])
+    return 'Unnamed place'
+
+
+def iterate_place_rows(place_source):
+    # Yield (longitude, latitude, property dict) for every row of a df or of
+    # every df of an iterable of dfs. The columns are read as arrays, which
+    # is much faster than iterrows()
+    df_iterable = [place_source] if isinstance(place_source,
+                                               pd.DataFrame) else place_source
+    for place_df in df_iterable:
+        property_column_list = [column for column in
+                                place_property_column_list
+                                if column in place_df.columns]
+        column_array_list = [place_df[column].values
+                             for column in property_column_list]
+        for i, (longitude, latitude) in enumerate(zip(
+                place_df['Longitude'].values, place_df['Latitude'].values)):
+            if pd.isnull(longitude) or pd.isnull(latitude):
+                continue
+            yield longitude, latitude, {
+                column: to_json_value(column_array[i])
+                for column, column_array in zip(property_column_list,
+                                                column_array_list)
+            }
+
+
+def iterate_day_routes(day_plan_df):
+    # Yield (day, [(longitude, latitude, property dict), ...]) for every day
+    # of the output of plan_days(), in visit order
+    planned_df = day_plan_df[day_plan_df['Day'].notnull()].sort_values(
+        by=['Day', 'Visit Start'])
+    for day, day_df in planned_df.groupby('Day', sort=True):
+        yield int(day), list(iterate_place_rows(day_df))
+
+
+def close_ring(coordinate_list):
+    # Make the last point exactly the 1st one. The periodic spline of the
+    # hulls already ends where it starts (give or take float noise), so the
+    # 1st point is only appended to rings that aren't closed
+    if np.allclose(coordinate_list[0], coordinate_list[-1], rtol=0,
+                   atol=1e-9):
+        return coordinate_list[:-1] + coordinate_list[:1]
+    return coordinate_list + coordinate_list[:1]
+
+
+def get_cluster_hex_color_list(df_no_restaurant):
+    # '#rrggbb' of every cluster number, the colors of the folium and plt
+    # maps
+    from matplotlib.colors import to_hex
+    from plt_map_toolkit import generate_cluster_color_list
+
+    return [to_hex(color) for color in
+            generate_cluster_color_list(df_no_restaurant['Cluster'])]
+
+
+def iterate_cluster_hulls(df_no_restaurant):
+    # Yield (cluster number, [(longitude, latitude), ...], hex color) for
+    # the smoothed hull of every cluster, closed and with the color of the
+    # cluster on the folium and plt maps
+    from convex_hull_interpolation_toolkit import generate_cluster_hulls
+
+    color_list = get_cluster_hex_color_list(df_no_restaurant)
+    for cluster_idx, (interp_x, interp_y) in sorted(
+            generate_cluster_hulls(df_no_restaurant).items()):
+        yield int(cluster_idx), close_ring(
+            list(zip(interp_x.tolist(), interp_y.tolist()))), \
+            color_list[cluster_idx]
+
+
+class IncrementalGeoJSONWriter:
+    # Write a GeoJSON FeatureCollection 1 feature at a time, so only 1
+    # feature is ever held in memory. The writes go through the file buffer
+    # and the array of features is closed once by close(), so the file is
+    # only valid GeoJSON after that (a with block does it)
+
+    footer = b'\n]}\n'
+
+    def __init__(self, file_path,
+                 coordinate_decimals=default_coordinate_decimals):
+        self.file = open(file_path, 'wb', buffering=1024 * 1024)
+        self.coordinate_decimals = coordinate_decimals
+        self.feature_count = 0
+        self.file.write(b'{"type": "FeatureCollection", "features": [')
+
+    def round_coordinates(self, coordinate_list):
+        return [[round(float(longitude), self.coordinate_decimals),
+                 round(float(latitude), self.coordinate_decimals)]
+                for longitude, latitude in coordinate_list]
+
+    def write_feature(self, geometry_dict, property_dict):
+        feature = {'type': 'Feature', 'geometry': geometry_dict,
+                   'properties': property_dict}
+        self.file.write(b'\n,' if self.feature_count else b'\n')
+        self.file.write(json.dumps(feature, ensure_ascii=False,
+                                   default=str).encode('utf-8'))
+        self.feature_count += 1
+        return self.feature_count
+
+    def write_point(self, longitude, latitude, property_dict):
+        return self.write_feature({
+            'type': 'Point',
+            'coordinates': self.round_coordinates([(longitude, latitude)])[0]
+        }, property_dict)
+
+    def write_row(self, row_dict):
+        # 1 row of a location df. The other columns become the properties
+        property_dict = {
+            column: to_json_value(value)
+            for column, value in row_dict.items()
+            if column not in ('Latitude', 'Longitude')
+        }
+        return self.write_point(row_dict['Longitude'], row_dict['Latitude'],
+                                property_dict)
+
+    def write_line(self, coordinate_list, property_dict):
+        return self.write_feature({
+            'type': 'LineString',
+            'coordinates': self.round_coordinates(coordinate_list)
+        }, property_dict)
+
+    def write_polygon(self, coordinate_list, property_dict):
+        return self.write_feature({
+            'type': 'Polygon',
+            'coordinates': [self.round_coordinates(coordinate_list)]
+        }, property_dict)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write(self.footer)
+            self.file.close()
+        return self.feature_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class KMLWriter:
+    # Write a KML document 1 placemark at a time. The places get the color
+    # of their category, the hulls are filled polygons and the day routes
+    # are lines. KML wants the shared styles before the 1st placemark, so
+    # the fill colors of the hulls ('#rrggbb') are given to the constructor
+
+    def __init__(self, file_path, document_name='Trip',
+                 coordinate_decimals=default_coordinate_decimals,
+                 fill_color_list=()):
+        self.file = open(file_path, 'w', encoding='utf-8')
+        self.coordinate_decimals = coordinate_decimals
+        self.feature_count = 0
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+                        '<Document><name>{}</name>\n'.format(
+                            escape(document_name)))
+        for category, color in kml_color_dict.items():
+            self.file.write(
+                '<Style id={}><IconStyle><color>{}</color></IconStyle>'
+                '<LineStyle><color>{}</color><width>3</width></LineStyle>'
+                '<PolyStyle><color>4d{}</color></PolyStyle></Style>\n'
+                .format(quoteattr(category), color, color, color[2:]))
+
+        self.fill_style_id_set = set()
+        for hex_color in fill_color_list:  # Half transparent inside like
+            # on the folium map
+            style_id = get_fill_style_id(hex_color)
+            if style_id not in self.fill_style_id_set:
+                self.fill_style_id_set.add(style_id)
+                self.file.write('<Style id={}>{}</Style>\n'.format(
+                    quoteattr(style_id), self.format_fill_style(hex_color)))
+
+    @staticmethod
+    def format_fill_style(hex_color):
+        color = hex_to_kml_color(hex_color)
+        return '<LineStyle><color>ff{}</color><width>2</width></LineStyle>' \
+               '<PolyStyle><color>4d{}</color></PolyStyle>'.format(color,
+                                                                    color)
+
+    def format_coordinates(self, coordinate_list):
+        return ' '.join('{},{}'.format(
+            format_coordinate(longitude, self.coordinate_decimals),
+            format_coordinate(latitude, self.coordinate_decimals))
+            for longitude, latitude in coordinate_list)
+
+    def write_placemark(self, name, description, geometry_kml,
+                        style=None, style_kml=''):
+        # style is the id of a shared style, style_kml an inline style. The
+        # elements are in the order of the KML schema: name, description,
+        # styleUrl, Style, then the geometry
+        self.file.write('<Placemark><name>{}</name>{}{}{}{}</Placemark>\n'
+                        .format(escape(name),
+                                '<description>{}</description>'.format(
+                                    escape(description)) if description
+                                else '',
+                                '<styleUrl>#{}</styleUrl>'.format(
+                                    escape(style)) if style else '',
+                                style_kml,
+                                geometry_kml))
+        self.feature_count += 1
+        return self.feature_count
+
+    def write_point(self, longitude, latitude, property_dict):
+        description = '\n'.join(
+            '{}: {}'.format(column, value)
+            for column, value in property_dict.items()
+            if value is not None and column != 'Business Name')
+        return self.write_placemark(
+            get_place_name(property_dict), description,
+            '<Point><coordinates>{}</coordinates></Point>'.format(
+                self.format_coordinates([(longitude, latitude)])),
+            property_dict.get('Category'))
+
+    def write_line(self, coordinate_list, property_dict):
+        return self.write_placemark(
+            property_dict.get('name', 'Route'),
+            property_dict.get('description'),
+            '<LineString><tessellate>1</tessellate><coordinates>{}'
+            '</coordinates></LineString>'.format(
+                self.format_coordinates(coordinate_list)))
+
+    def write_polygon(self, coordinate_list, property_dict):
+        # The polygon uses the shared style of its fill color ('#rrggbb'),
+        # or an inline one if the color wasn't given to the constructor
+        style, style_kml = 'Site', ''
+        if property_dict.get('fill'):
+            style = get_fill_style_id(property_dict['fill'])
+            if style not in self.fill_style_id_set:
+                style, style_kml = None, '<Style>{}</Style>'.format(
+                    self.format_fill_style(property_dict['fill']))
+        return self.write_placemark(
+            property_dict.get('name', 'Cluster'),
+            property_dict.get('description'),
+            '<Polygon><outerBoundaryIs><LinearRing><coordinates>{}'
+            '</coordinates></LinearRing></outerBoundaryIs></Polygon>'.format(
+                self.format_coordinates(coordinate_list)),
+            style, style_kml)
+
+    def close(self):
+        self.file.write('</Document>\n</kml>\n')
+        self.file.close()
+        return self.feature_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class GPXWriter:
+    # Write a GPX file 1 element at a time. GPX has no polygons, so a hull
+    # is written as a closed track, and a day route as a route that
+    # navigation apps can follow. GPX requires the waypoints before the
+    # routes and the routes before the tracks, so they have to be written in
+    # that order
+
+    element_order_list = ['wpt', 'rte', 'trk']
+
+    def __init__(self, file_path,
+                 coordinate_decimals=default_coordinate_decimals):
+        self.file = open(file_path, 'w', encoding='utf-8')
+        self.coordinate_decimals = coordinate_decimals
+        self.feature_count = 0
+        self.last_element = 'wpt'
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<gpx version="1.1" creator="TravelPlanning" '
+                        'xmlns="http://www.topografix.com/GPX/1/1">\n')
+
+    def check_order(self, element):
+        if self.element_order_list.index(element) < \
+                self.element_order_list.index(self.last_element):
+            raise ValueError('GPX needs the places before the routes and the '
+                             'routes before the hulls.')
+        self.last_element = element
+
+    def format_point(self, tag, longitude, latitude, property_dict):
+        description = '\n'.join(
+            '{}: {}'.format(column, value)
+            for column, value in property_dict.items()
+            if value is not None and column not in ('Business Name',
+                                                    'Category'))
+        return '<{} lat="{}" lon="{}"><name>{}</name>{}{}</{}>'.format(
+            tag, format_coordinate(latitude, self.coordinate_decimals),
+            format_coordinate(longitude, self.coordinate_decimals),
+            escape(get_place_name(property_dict)),
+            '<desc>{}</desc>'.format(escape(description)) if description
+            else '',
+            '<type>{}</type>'.format(escape(str(property_dict['Category'])))
+            if property_dict.get('Category') is not None else '', tag)
+
+    def write_point(self, longitude, latitude, property_dict):
+        self.check_order('wpt')
+        self.file.write(self.format_point('wpt', longitude, latitude,
+                                          property_dict) + '\n')
+        self.feature_count += 1
+        return self.feature_count
+
+    def write_route(self, point_list, property_dict):
+        # point_list is [(longitude, latitude, property dict), ...]
+        self.check_order('rte')
+        self.file.write('<rte><name>{}</name>\n'.format(
+            escape(property_dict.get('name', 'Route'))))
+        for longitude, latitude, point_property_dict in point_list:
+            self.file.write(self.format_point(
+                'rtept', longitude, latitude, point_property_dict) + '\n')
+        self.file.write('</rte>\n')
+        self.feature_count += 1
+        return self.feature_count
+
+    def write_polygon(self, coordinate_list, property_dict):
+        self.check_order('trk')
+        self.file.write('<trk><name>{}</name><trkseg>{}</trkseg></trk>\n'
+                        .format(escape(property_dict.get('name', 'Cluster')),
+                                ''.join('<trkpt lat="{}" lon="{}"/>'.format(
+                                    format_coordinate(
+                                        latitude, self.coordinate_decimals),
+                                    format_coordinate(
+                                        longitude, self.coordinate_decimals))
+                                    for longitude, latitude in
+                                    coordinate_list)))
+        self.feature_count += 1
+        return self.feature_count
+
+    def close(self):
+        self.file.write('</gpx>\n')
+        self.file.close()
+        return self.feature_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+writer_class_dict = {
+    'geojson': IncrementalGeoJSONWriter,
+    'json': IncrementalGeoJSONWriter,
+    'kml': KMLWriter,
+    'gpx': GPXWriter
+}
+
+
+@profile_stage()
+def export_trip(place_source, file_path, df_no_restaurant=None,
+                day_plan_df=None, file_format=None,
+                coordinate_decimals=default_coordinate_decimals):
+    # Caller function. place_source is open_df (or an iterable of dfs),
+    # df_no_restaurant with the column Cluster adds the cluster hulls and
+    # day_plan_df (output of plan_days()) adds 1 route per day. The format
+    # comes from the file extension unless file_format is given
+    file_format = (file_format or
+                   os.path.splitext(file_path)[1].lstrip('.')).lower()
+    if file_format not in writer_class_dict:
+        raise ValueError('Unknown format {}. Use one of {}.'.format(
+            file_format, list(writer_class_dict.keys())))
+
+    writer_kwarg_dict = {'coordinate_decimals': coordinate_decimals}
+    if file_format == 'kml' and df_no_restaurant is not None:
+        writer_kwarg_dict['fill_color_list'] = get_cluster_hex_color_list(
+            df_no_restaurant)
+    with writer_class_dict[file_format](file_path,
+                                        **writer_kwarg_dict) as writer:
+        for longitude, latitude, property_dict in iterate_place_rows(
+                place_source):
+            writer.write_point(longitude, latitude, property_dict)
+
+        if day_plan_df is not None:
+            for day, point_list in iterate_day_routes(day_plan_df):
+                route_property_dict = {
+                    'name': 'Day {}'.format(day),
+                    'description': ' -> '.join(
+                        get_place_name(point_property_dict)
+                        for _, _, point_property_dict in point_list)
+                }
+                if isinstance(writer, GPXWriter):
+                    writer.write_route(point_list, route_property_dict)
+                else:
+                    writer.write_line([point[:2] for point in point_list],
+                                      route_property_dict)
+
+        if df_no_restaurant is not None:
+            for cluster_idx, coordinate_list, color in \
+                    iterate_cluster_hulls(df_no_restaurant):
+                writer.write_polygon(coordinate_list, {
+                    'name': 'Cluster {}'.format(cluster_idx),
+                    'Cluster': cluster_idx,
+                    'stroke': color,  # simplestyle properties that
+                    'fill': color  # geojson.io and GitHub draw
+                })
+
+        feature_count = writer.feature_count
+    print('> {} features exported to {}.'.format(feature_count, file_path))
+    return file_path
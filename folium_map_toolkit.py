@@ -1,11 +1,13 @@
 import folium
 import folium.plugins as plugins
-import numpy as np
-from matplotlib import pyplot as plt
 
-from convex_hull_interpolation_toolkit import generate_convex_hull, \
-    generate_interpolation
-from plt_map_toolkit import create_four_point_diamond_around
+from compact_location_toolkit import get_google_maps_url
+from convex_hull_interpolation_toolkit import generate_cluster_hulls
+from density_layer_toolkit import add_aggregated_layers, \
+    default_marker_min_zoom, ZoomLayerSwitch
+from hierarchical_cluster_toolkit import cut_cluster_tree, \
+    default_zoom_cluster_dict
+from profiling_toolkit import profile_stage
 
 
 def initialize_folium_map(df_no_restaurant, num_cluster):
@@ -45,13 +47,6 @@ def initialize_folium_map(df_no_restaurant, num_cluster):
     site_group.add_to(my_map)
     cluster_group.add_to(my_map)
 
-    folium.LayerControl(
-        # LayerControl line must be after the FeatureGroup lines
-        # . Otherwise, you'll lose the LayerControl as a whole
-        collapsed=False
-    ).add_to(my_map)  # Give user the option to
-    # choose which style to use
-
     # Add in plugins. This section should be put in the same block as the map
     # initiation since running these twice will add duplicates
     plugins.Geocoder(
@@ -92,17 +87,34 @@ def initialize_folium_map(df_no_restaurant, num_cluster):
     return my_map, restaurant_group, site_group, cluster_group
 
 
-def add_in_location_markers(open_df, my_map, restaurant_group, site_group):
+def add_layer_control(my_map):
+    # LayerControl line must be after the FeatureGroup lines, including the
+    # ones added after initialize_folium_map() (clusters per zoom, heatmap,
+    # hexagons...). Otherwise, its script refers to layers that don't exist
+    # yet and the whole map script stops
+    folium.LayerControl(
+        collapsed=False
+    ).add_to(my_map)  # Give user the option to
+    # choose which style to use
+    return my_map
+
+
+def add_in_location_markers(open_df, my_map, restaurant_group, site_group,
+                            legend=True):
+    # legend=False only adds the markers, e.g. to a map that already has
+    # its legend
     for index, row in open_df.iterrows():
         latitude = row['Latitude']
         longitude = row['Longitude']
         category = row['Category']
 
         google_category = row['Extracted Category']
-        google_url = row['Google Maps URL']
+        google_url = get_google_maps_url(row)  # Also works for the
+        # compact df, which only keeps the place id
 
         place_name = row['Business Name']
-        if str(place_name) == 'nan':
+        if str(place_name) in ('nan', '<NA>'):  # <NA> is the missing
+            # value of the Arrow strings of the compact df
             place_name = 'No business name'
 
         # You have to recreate the icon_style since folium doesn't allow
@@ -202,6 +214,12 @@ def add_in_location_markers(open_df, my_map, restaurant_group, site_group):
             opacity=1
         ).add_to(feature_group)
 
+    if legend:
+        my_map = add_legend(my_map)
+    return my_map
+
+
+def add_legend(my_map):
     # Create a legend using BeautifyIcon and Icon classes
     legend_html = '''
          <div style="position: fixed;
@@ -233,95 +251,20 @@ def add_in_location_markers(open_df, my_map, restaurant_group, site_group):
 
 
 def generate_color_list(df_no_restaurant):
-    fig, ax = plt.subplots(figsize=(10, 8))
-
-    scatter_non_restaurant = ax.scatter(  # Draw cluster plot for all the
-        # non-restaurants
-        df_no_restaurant['Longitude'],
-        df_no_restaurant['Latitude'],
-        c=df_no_restaurant['Cluster'],
-        alpha=1,
-        s=100,
-        edgecolor='black',
-    )
+    # Colors of the clusters, the same as in plt_cluster_map(). They come
+    # straight from the colormap, so no throwaway scatter figure is needed.
+    # matplotlib is only loaded here, for the maps with clusters
+    from plt_map_toolkit import generate_cluster_color_list
 
-    # The 2 lines below output the colors used in the scatter plot so the later
-    # convex hull interpolation can use the same color as the points
-    labels = df_no_restaurant[
-        'Cluster'].unique()  # Get the unique cluster labels
-    color_list = scatter_non_restaurant.cmap(
-        scatter_non_restaurant.norm(
-            labels))  # Get the colors used for each label
+    return generate_cluster_color_list(df_no_restaurant['Cluster'])
 
-    plt.close() #This forbids to really plot out the scatter plot since I
-    # don't need that--all I need is the color_list. Without this line,
-    # you'll have a plt plot alongside the folium map
-    return color_list
 
 def plot_polygon_shades_for_clusters(my_map, df_no_restaurant, cluster_group):
     color_list = generate_color_list(df_no_restaurant)
 
-
-    for cluster_idx in df_no_restaurant.Cluster.unique():  # Add in the convex
-        # hull and interpolate
-
-        # You won't have a cluster that contains 0 location Technically,
-        # you can only make convex hull and the later interpolation with at
-        # least 3 points. So for clusters that contain only 1 or 2
-        # locations, you need to do something to increase the
-        # pseudo-location number to make the shade
-
-        cluster_df = df_no_restaurant[df_no_restaurant.Cluster == cluster_idx]
-        location_count_in_cluster = cluster_df.shape[0]
-
-        points = cluster_df[['Longitude', 'Latitude']].values  # Obtain the
-        # true location's longitude and latitude. Remember, points is a
-        # numpy.ndarray not a df
-        delta = 0.02  # Amount to add or subtract. I have adjusted this
-        # based on the Wilmington travel planning
-
-        if location_count_in_cluster == 1:# When a cluster has only 1
-            # location, add 4 pseudo-locations to make a diamond shade
-            # around the 1 true location. The side of the diamond will be
-            # controlled by the delta variable
-
-            new_rows = create_four_point_diamond_around(points, delta)
-            # Create 4 pseudo points around the 1 true location
-
-            points = np.vstack((points, new_rows))  # Add the 4
-            # pseudo-locations to be with the 1 true location
-
-        elif location_count_in_cluster == 2:  # When a cluster has only 2
-            # locations, you still cannot use the midpoint of the 2
-            # locations as the hull will be flat and the algorithum will
-            # complain about it. My method is to calculate out the midpoint
-            # and add in 4 pseudo-locations to create a diamond shape around
-            # that midpoint. Those 4 pseudo-locations will be added into the
-            # point ndarray to make the hull. I used a diamond here to avoid
-            # have only 2 pseudo-locations that perfectly align with the 2
-            # true locations, resulting in a flat hull again.
-            mid_point = points.mean(axis=0)
-            reshaped_mid_point = np.reshape(mid_point, (1, 2))
-
-            new_rows = create_four_point_diamond_around(reshaped_mid_point,
-                                                        delta)
-
-            points = np.vstack(
-                (points, new_rows))  # Add the 4 pseudo-locations to be with
-            # the 2 true locations
-
-        else:  # location_count_in_cluster >= 3:
-            # Then you can simply use the points obtained before without any
-            # processing
-
-            pass
-
-        x_hull, y_hull = generate_convex_hull(
-            points)  # Generate the convex
-        # hull
-
-        interp_x, interp_y = generate_interpolation(x_hull, y_hull)
-        # Generate the interpolation
+    for cluster_idx, (interp_x, interp_y) in generate_cluster_hulls(
+            df_no_restaurant).items():  # Add in the convex hull and
+        # interpolate
 
         # plot the polygon shades
         interp_coordinates = []
@@ -349,12 +292,66 @@ def plot_polygon_shades_for_clusters(my_map, df_no_restaurant, cluster_group):
     return my_map
 
 
-def generate_folium_map(open_df, df_no_restaurant, num_cluster):
+def add_multi_zoom_cluster_layers(my_map, df_no_restaurant, cluster_tree,
+                                  zoom_cluster_dict):
+    # 1 cluster layer per entry of zoom_cluster_dict ({zoom: num_cluster}),
+    # all cut from the same precomputed tree. Each layer is only shown from
+    # its zoom until the zoom of the next layer
+    zoom_list = sorted(zoom_cluster_dict)
+    zoom_layer_list = []
+    for i, zoom in enumerate(zoom_list):
+        num_cluster = zoom_cluster_dict[zoom]
+        zoom_cluster_group = folium.FeatureGroup(
+            name='Clusters: {} (zoom {}+)'.format(num_cluster, zoom))
+        zoom_cluster_group.add_to(my_map)
+
+        cut_df = df_no_restaurant.copy()
+        cut_df['Cluster'] = cut_cluster_tree(cluster_tree, num_cluster)
+        my_map = plot_polygon_shades_for_clusters(my_map, cut_df,
+                                                  zoom_cluster_group)
+
+        max_zoom = zoom_list[i + 1] - 1 if i + 1 < len(zoom_list) else 30
+        zoom_layer_list.append((zoom, max_zoom, zoom_cluster_group))
+
+    ZoomLayerSwitch(zoom_layer_list).add_to(my_map)
+    return my_map
+
+
+@profile_stage()
+def generate_folium_map(open_df, df_no_restaurant, num_cluster,
+                        aggregate=False, hex_zoom_list=None,
+                        marker_min_zoom=default_marker_min_zoom,
+                        max_marker_count=None, cluster_tree=None,
+                        zoom_cluster_dict=None):
+    # aggregate=True adds a heatmap and hexagon layers with per-category
+    # counts for dense place sets and only shows the markers from
+    # marker_min_zoom on. If open_df has more than max_marker_count places,
+    # the markers are left out of the html entirely so its size stays
+    # bounded. With a cluster_tree from build_cluster_tree(), the clusters
+    # of zoom_cluster_dict are shown per zoom level and the layer of the
+    # num_cluster clusters is hidden until it's ticked in the layer control
     my_map, restaurant_group, site_group, cluster_group = \
         initialize_folium_map(df_no_restaurant, num_cluster)
 
-    my_map = add_in_location_markers(open_df, my_map, restaurant_group, site_group)
+    marker_df = open_df
+    if max_marker_count is not None and open_df.shape[0] > max_marker_count:
+        marker_df = open_df.iloc[0:0]  # Only the legend is added
+        print('> {} places are more than max_marker_count ({}), so only the '
+              'aggregated layers are drawn.'.format(open_df.shape[0],
+                                                    max_marker_count))
+    my_map = add_in_location_markers(marker_df, my_map, restaurant_group, site_group)
 
     my_map = plot_polygon_shades_for_clusters(my_map, df_no_restaurant, cluster_group)
 
-    return my_map
+    if cluster_tree is not None:
+        cluster_group.show = False
+        my_map = add_multi_zoom_cluster_layers(
+            my_map, df_no_restaurant, cluster_tree,
+            zoom_cluster_dict or default_zoom_cluster_dict)
+
+    if aggregate:
+        my_map = add_aggregated_layers(my_map, open_df,
+                                       [restaurant_group, site_group],
+                                       hex_zoom_list, marker_min_zoom)
+
+    return add_layer_control(my_map)  # Last, after every feature group
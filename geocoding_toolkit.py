@@ -0,0 +1,277 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from dedup_toolkit import calculate_distance_m, normalize_text
+from profiling_toolkit import profile_stage, record_cache_lookup
+
+# Geocoding (address -> coordinates) and reverse geocoding (coordinates ->
+# address) of the places the export leaves incomplete: rows without
+# Latitude/Longitude and rows whose Address has no city, which
+# location_df_filter_by_allowed_cities() would drop. The lookups go through
+# a pluggable backend and a json memo cache that can be shared by all the
+# trips, so the same place is never looked up twice
+
+default_batch_size = 50  # The cache is saved after every batch
+coordinate_key_decimals = 5  # About 1 m, for the reverse geocoding keys
+
+
+class NominatimBackend:
+    # OpenStreetMap Nominatim through geopy. The usage policy of the public
+    # server allows at most 1 request per second
+    name = 'nominatim'
+
+    def __init__(self, user_agent='travel_planning', timeout=10,
+                 min_delay_seconds=1):
+        from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+        from geopy.geocoders import Nominatim
+
+        self.geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+        self.min_delay_seconds = min_delay_seconds
+        # Errors of 1 lookup (timeout, server error or rate limit) that
+        # leave its row empty instead of stopping the whole batch
+        self.lookup_error_tuple = (GeocoderTimedOut, GeocoderServiceError)
+
+    def geocode(self, query):
+        # {'Latitude':..., 'Longitude':..., 'Address':...} or None
+        location = self.geolocator.geocode(query, addressdetails=True)
+        if location is None:
+            return None
+        return {'Latitude': location.latitude,
+                'Longitude': location.longitude,
+                'Address': format_nominatim_address(location.raw.get(
+                    'address', {})) or location.address}
+
+    def reverse(self, latitude, longitude):
+        # Address of the coordinates or None
+        location = self.geolocator.reverse((latitude, longitude),
+                                           addressdetails=True)
+        if location is None:
+            return None
+        return format_nominatim_address(location.raw.get('address', {})) or \
+            location.address
+
+
+def format_nominatim_address(address_dict):
+    # Format the address details of Nominatim like the addresses of the
+    # Google map json ("123 Front St, Wilmington, NC 28401") so the city is
+    # the 2nd part, as location_df_filter_by_allowed_cities() expects
+    city = address_dict.get('city') or address_dict.get('town') or \
+        address_dict.get('village') or address_dict.get('hamlet')
+    if city is None:
+        return None
+    street = ' '.join(part for part in [address_dict.get('house_number'),
+                                        address_dict.get('road')] if part)
+    state = address_dict.get('ISO3166-2-lvl4', '').split('-')[-1] or \
+        address_dict.get('state', '')
+    state_postcode = ' '.join(part for part in
+                              [state, address_dict.get('postcode')] if part)
+    return ', '.join(part for part in [street or city, city, state_postcode]
+                     if part)
+
+
+class GazetteerBackend:
+    # Offline backend that looks places up in a table of known places (e.g.
+    # the cleaned dfs of previous trips, or a gazetteer csv with the columns
+    # Latitude, Longitude, Address and optionally Business Name). Useful
+    # without network access and for testing
+    name = 'gazetteer'
+    min_delay_seconds = 0
+    lookup_error_tuple = ()  # Local lookups don't fail
+
+    def __init__(self, gazetteer_df, max_reverse_distance_m=200):
+        self.gazetteer_df = gazetteer_df.dropna(
+            subset=['Latitude', 'Longitude']).reset_index(drop=True)
+        self.max_reverse_distance_m = max_reverse_distance_m
+
+        self.name_index_dict = {}  # Normalized name or address -> row
+        for column in ['Address', 'Business Name']:
+            if column not in self.gazetteer_df.columns:
+                continue
+            for i, text in normalize_text(
+                    self.gazetteer_df[column].dropna()).items():
+                self.name_index_dict.setdefault(text, i)
+
+    @classmethod
+    def from_csv(cls, file_path, **kwargs):
+        return cls(pd.read_csv(file_path), **kwargs)
+
+    def geocode(self, query):
+        i = self.name_index_dict.get(normalize_text(pd.Series([query]))[0])
+        if i is None:
+            return None
+        row = self.gazetteer_df.loc[i]
+        return {'Latitude': float(row['Latitude']),
+                'Longitude': float(row['Longitude']),
+                'Address': row.get('Address')}
+
+    def reverse(self, latitude, longitude):
+        # Address of the nearest known place if it's close enough
+        distance_array = calculate_distance_m(
+            latitude, longitude, self.gazetteer_df['Latitude'].values,
+            self.gazetteer_df['Longitude'].values)
+        if distance_array.size == 0:
+            return None
+        i = int(np.argmin(distance_array))
+        if distance_array[i] > self.max_reverse_distance_m:
+            return None
+        address = self.gazetteer_df.loc[i].get('Address')
+        return None if pd.isnull(address) else address
+
+
+def load_geocode_cache(cache_path):
+    # The cache is a json {backend name: {'geocode': {query: result},
+    # 'reverse': {"latitude,longitude": address}}}. Misses (None) are cached
+    # too so places that can't be found aren't looked up again
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    with open(cache_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_geocode_cache(geocode_cache, cache_path):
+    if cache_path is None:
+        return
+    with open(cache_path, 'w', encoding='utf-8') as file:
+        json.dump(geocode_cache, file, indent=1)
+
+
+def coordinates_to_cache_key(latitude, longitude):
+    return '{:.{decimals}f},{:.{decimals}f}'.format(
+        latitude, longitude, decimals=coordinate_key_decimals)
+
+
+def batch_lookup(key_list, lookup_func, backend, cache_path=None,
+                 cache_section='geocode', batch_size=default_batch_size):
+    # Look up every distinct key of key_list that isn't cached yet with
+    # lookup_func (backend.geocode or a wrapper of backend.reverse), at most
+    # 1 lookup every backend.min_delay_seconds. A lookup that raises one of
+    # backend.lookup_error_tuple gets None and isn't cached, so it's tried
+    # again by the next run. The cache is saved after every batch and when
+    # the loop stops, even on an error or an interruption, so a run never
+    # loses its progress. Returns {key: result}
+    geocode_cache = load_geocode_cache(cache_path)
+    section_dict = geocode_cache.setdefault(backend.name, {}).setdefault(
+        cache_section, {})
+
+    distinct_key_list = list(dict.fromkeys(key_list))  # Keeps the order
+    missing_key_list = []
+    for key in distinct_key_list:
+        record_cache_lookup(key in section_dict)
+        if key not in section_dict:
+            missing_key_list.append(key)
+    print('> {} of {} distinct lookups are cached, {} to look up with {}.'
+          .format(len(distinct_key_list) - len(missing_key_list),
+                  len(distinct_key_list), len(missing_key_list),
+                  backend.name))
+
+    lookup_error_tuple = getattr(backend, 'lookup_error_tuple', ())
+    failed_key_list = []
+    last_call_time = None
+    try:
+        for batch_start in range(0, len(missing_key_list), batch_size):
+            for key in missing_key_list[batch_start:batch_start + batch_size]:
+                if last_call_time is not None:  # Rate limiting
+                    sleep_seconds = backend.min_delay_seconds - (
+                            time.monotonic() - last_call_time)
+                    if sleep_seconds > 0:
+                        time.sleep(sleep_seconds)
+                last_call_time = time.monotonic()
+                try:
+                    section_dict[key] = lookup_func(key)
+                except lookup_error_tuple as error:
+                    print('> Lookup of {} failed: {!r}'.format(key, error))
+                    failed_key_list.append(key)
+            save_geocode_cache(geocode_cache, cache_path)
+    finally:
+        save_geocode_cache(geocode_cache, cache_path)
+
+    if failed_key_list:
+        print('> {} lookups failed and will be retried by the next run.'
+              .format(len(failed_key_list)))
+    return {key: section_dict.get(key) for key in key_list}
+
+
+def build_geocode_query(row, city_str=None):
+    # The address if there is one, otherwise the business name, with the
+    # city of the trip to tell apart places with the same name
+    query = row.get('Address')
+    if pd.isnull(query) or not str(query).strip():
+        query = row.get('Business Name')
+    if pd.isnull(query) or not str(query).strip():
+        return None
+    query = str(query).strip()
+    if city_str is not None and city_str.lower() not in query.lower():
+        query = '{}, {}'.format(query, city_str)
+    return query
+
+
+@profile_stage()
+def fill_missing_coordinates(input_df, backend, cache_path=None,
+                             city_str=None, batch_size=default_batch_size):
+    # Geocode the rows without Latitude or Longitude from their Address (or
+    # Business Name). Rows that can't be found keep NaN
+    output_df = input_df.copy()
+    missing_mask = output_df['Latitude'].isnull() | \
+        output_df['Longitude'].isnull()
+    query_series = output_df.loc[missing_mask].apply(
+        build_geocode_query, axis=1, city_str=city_str).dropna() \
+        if missing_mask.any() else pd.Series(dtype=object)
+    if query_series.empty:
+        print('> No place is missing its coordinates.')
+        return output_df
+
+    result_dict = batch_lookup(query_series.tolist(), backend.geocode,
+                               backend, cache_path, 'geocode', batch_size)
+    for i, query in query_series.items():
+        result = result_dict[query]
+        if result is not None:
+            output_df.loc[i, 'Latitude'] = result['Latitude']
+            output_df.loc[i, 'Longitude'] = result['Longitude']
+
+    print('> Coordinates filled for {} of {} places.'.format(
+        int((missing_mask & output_df['Latitude'].notnull()).sum()),
+        int(missing_mask.sum())))
+    return output_df
+
+
+def find_rows_missing_city(input_df):
+    # Rows whose Address is missing or has no "street, city, ..." form, e.g.
+    # places that only have a name
+    address_series = input_df['Address'].astype(object)
+    return address_series.isnull() | \
+        ~address_series.astype(str).str.contains(',')
+
+
+@profile_stage()
+def fill_missing_city(input_df, backend, cache_path=None,
+                      batch_size=default_batch_size):
+    # Reverse geocode the coordinates of the rows without a city in their
+    # Address and replace the Address with the found one
+    output_df = input_df.copy()
+    missing_mask = find_rows_missing_city(output_df) & \
+        output_df['Latitude'].notnull() & output_df['Longitude'].notnull()
+    if not missing_mask.any():
+        print('> No place is missing its city.')
+        return output_df
+
+    key_series = pd.Series([
+        coordinates_to_cache_key(latitude, longitude)
+        for latitude, longitude in output_df.loc[
+            missing_mask, ['Latitude', 'Longitude']].values
+    ], index=output_df.index[missing_mask])
+
+    def reverse_key(key):
+        return backend.reverse(*[float(value) for value in key.split(',')])
+
+    result_dict = batch_lookup(key_series.tolist(), reverse_key, backend,
+                               cache_path, 'reverse', batch_size)
+    filled_series = key_series.map(result_dict).dropna()
+    output_df.loc[filled_series.index, 'Address'] = filled_series
+
+    print('> City filled for {} of {} places.'.format(
+        filled_series.shape[0], int(missing_mask.sum())))
+    return output_df
@@ -1,6 +1,9 @@
 import json
 import pandas as pd
 import math
+from urllib.parse import quote_plus
+
+from profiling_toolkit import profile_stage
 
 
 def read_json_file(file_path, encoding='utf-8'):
@@ -11,6 +14,7 @@ def read_json_file(file_path, encoding='utf-8'):
         return json_data
 
 
+@profile_stage()
 def json_to_df(file_path):
     # Convert the Google map json into a df
     json_data = read_json_file(file_path)
@@ -43,9 +47,11 @@ def drop_same_columns(input_df):
     return output_df
 
 
-def drop_custom_columns(input_df):
+def drop_custom_columns(input_df, keep_updated=False):
     # Remove the columns picked by user given by columns_to_drop_list_of_str
-    # to specify the headers of those columns
+    # to specify the headers of those columns. keep_updated keeps the column
+    # properties.Updated, which the delta ingestion needs to tell which
+    # places have changed since the last export
     output_df = input_df.copy()
 
     columns_to_drop_list_of_str = [
@@ -54,6 +60,8 @@ def drop_custom_columns(input_df):
         'properties.Updated',
         'properties.Location.Country Code'
     ]  # This list contains the columns that I don't think are important
+    if keep_updated:
+        columns_to_drop_list_of_str.remove('properties.Updated')
 
     # Drop the picked columns
     output_df = output_df.drop(columns=columns_to_drop_list_of_str)
@@ -102,7 +110,8 @@ def rename_columns(input_df):
         'properties.Location.Geo Coordinates.Latitude': 'Latitude',
         'properties.Location.Geo Coordinates.Longitude': 'Longitude',
         'properties.Location.Address': 'Address',
-        'properties.Location.Business Name': 'Business Name'
+        'properties.Location.Business Name': 'Business Name',
+        'properties.Updated': 'Updated'  # Only kept for the delta ingestion
     }
 
     output_df.rename(columns=column_mapping, inplace=True)
@@ -124,12 +133,35 @@ def latitude_longitude_to_num(input_df):
     return output_df
 
 
-def location_df_clean(input_df):
+def extract_place_id(url_series):
+    # Google map URLs in the json come in 2 forms:
+    # http://maps.google.com/?cid=<cid> for businesses and
+    # http://maps.google.com/?q=<address>&ftid=<ftid> for plain addresses.
+    # This returns the ftid ("0x...:0x...") or "cid:<cid>" for every URL so
+    # places can be matched without comparing the whole URL
+    ftid_series = url_series.str.extract(
+        r'ftid=(0x[0-9a-fA-F]+:0x[0-9a-fA-F]+)', expand=False)
+    cid_series = 'cid:' + url_series.str.extract(r'cid=(\d+)', expand=False)
+    return ftid_series.fillna(cid_series)
+
+
+def build_google_maps_url(place_id, address):
+    # Rebuild a Google map URL from a place id given by extract_place_id()
+    # (plus the address for the ftid form). Commas are kept as they are in
+    # the URLs of the json
+    if place_id.startswith('cid:'):
+        return 'http://maps.google.com/?cid={}'.format(place_id[4:])
+    return 'http://maps.google.com/?q={}&ftid={}'.format(
+        quote_plus(str(address), safe=','), place_id)
+
+
+@profile_stage()
+def location_df_clean(input_df, keep_updated=False):
     # Caller function that cleans the location df.
 
     output_df = input_df.copy()
     output_df = drop_same_columns(output_df)
-    output_df = drop_custom_columns(output_df)
+    output_df = drop_custom_columns(output_df, keep_updated)
     output_df = organize_title_to_address(output_df)
     output_df = rename_columns(output_df)
     output_df = latitude_longitude_to_num(output_df)
@@ -160,46 +192,57 @@ def location_df_filter_by_allowed_cities(input_df, city_names_list):
     return filtered_df
 
 
+# Labels of the scraped categories. The matching can be done partially so
+# as long as the original category string contains any substring in the
+# tuples used as keys, it'll be matched to that category
+label_dict = {
+    ('restaurant', 'grill', 'bar'): 'Restaurant',
+    ('garden', 'nature preserve', 'park', 'arboretum'): 'Garden',
+    ('museum'): 'Museum',
+    ('store', 'market', 'shopping mall', 'shop'): 'Store',
+    ('no category', 'building'): 'Site',
+    # All the other categories that I'm
+    # not interested in will also be under this category
+    ('closed'): 'Closed'  # This is for the locations that are "Permanently
+    # closed" or "Temporarily Closed" and you shouldn't map these
+    # locations out on your maps
+}  # I have to use tuples as keys since they're immutable
+
+
+def match_scraped_category(extracted_category):
+    # Label of 1 scraped category according to label_dict, or None if no
+    # term of the category is covered by label_dict
+    lowercase_extracted_category = extracted_category.lower()
+
+    check_list = lowercase_extracted_category.split()
+    check_list.append(lowercase_extracted_category)
+    # lowercase_extracted_category itself also need to be checked
+
+    category = None
+    for term in check_list:
+        for tuple_key, category_str in label_dict.items():
+            if term in tuple_key:
+                category = category_str
+                break
+    return category
+
+
+def label_extracted_category(extracted_category):
+    # Label of 1 scraped category. All the other categories that are
+    # unmatched with any category will be "Site"
+    return match_scraped_category(extracted_category) or 'Site'
+
+
 def label_based_on_scraped_category(input_df):
     # Because the scraped category from Google map is very detailed,
     # this function further categorized a category into 1 of the
-    # user-defined categories below. The matching can be done partially so
-    # as long as the original category string contains any substring in the
-    # tuples used as keys in label_dict, it'll be matched to that category.
-    # All the other categories that are unmatched with any category will
-    # "Site".
-
-    label_dict = {
-        ('restaurant', 'grill', 'bar'): 'Restaurant',
-        ('garden', 'nature preserve', 'park', 'arboretum'): 'Garden',
-        ('museum'): 'Museum',
-        ('store', 'market', 'shopping mall', 'shop'): 'Store',
-        ('no category', 'building'): 'Site',
-        # All the other categories that I'm
-        # not interested in will also be under this category
-        ('closed'): 'Closed'  # This is for the locations that are "Permanently
-        # closed" or "Temporarily Closed" and you shouldn't map these
-        # locations out on your maps
-    }  # I have to use tuples as keys since they're immutable
-
+    # user-defined categories in label_dict. All the other categories that
+    # are unmatched with any category will be "Site".
     output_df = input_df.copy()
 
     category_labels = []
     for extracted_category in output_df['Extracted Category']:
-        lowercase_extracted_category = extracted_category.lower()
-
-        check_list = lowercase_extracted_category.split()
-        check_list.append(lowercase_extracted_category)
-        # lowercase_extracted_category itself also need to be checked
-
-        category = 'Site'
-        for term in check_list:
-            for tuple_key, category_str in label_dict.items():
-                if term in tuple_key:
-                    category = category_str
-                    break
-
-        category_labels.append(category)
+        category_labels.append(label_extracted_category(extracted_category))
 
     output_df['Category'] = category_labels
     return output_df
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+from profiling_toolkit import profile_stage
+
+# Hierarchical clustering of the non-restaurant sites. The agglomerative tree
+# is built once per trip, and any number of clusters is then obtained by
+# cutting the tree, without fitting KMeans again. This is what lets the
+# folium map show coarse regions at low zoom and day-sized clusters at high
+# zoom, and makes changing the number of clusters instantaneous
+
+# Zoom level -> number of clusters shown from that zoom on in the multi-zoom
+# folium map
+default_zoom_cluster_dict = {
+    0: 3,  # Regions of the trip
+    12: 6,
+    14: 12  # Roughly what can be visited in a day
+}
+
+
+@profile_stage()
+def build_cluster_tree(df_no_restaurant, method='ward'):
+    # Build the agglomerative tree on the same coordinates as the KMeans of
+    # the notebook. Ward linkage merges the 2 clusters that increase the
+    # within-cluster variance the least, which is the criterion KMeans
+    # minimizes, so the cuts look like KMeans clusters. The index of
+    # df_no_restaurant is kept with the tree so the cuts can be matched back
+    # to the rows even after the df has been sorted
+    from scipy.cluster.hierarchy import linkage
+
+    coordinate_array = df_no_restaurant[['Latitude', 'Longitude']].values
+    cluster_tree = {
+        'linkage': linkage(coordinate_array, method=method),
+        'index': df_no_restaurant.index
+    }
+    return cluster_tree
+
+
+def precompute_cluster_cuts(cluster_tree, num_cluster_list):
+    # Cut the tree at every number of clusters in num_cluster_list. Returns
+    # a df with 1 column per number of clusters and the index of the df the
+    # tree was built on. fcluster() only walks the n - 1 merges of the tree,
+    # so every cut is linear. Its cluster numbers start from 1 in tree
+    # order, so they're renumbered from 0 in order of 1st appearance like
+    # KMeans
+    from scipy.cluster.hierarchy import fcluster
+
+    num_point = len(cluster_tree['index'])
+    num_cluster_list = sorted({int(min(max(num_cluster, 1), num_point))
+                               for num_cluster in num_cluster_list})
+
+    cut_df = pd.DataFrame(index=cluster_tree['index'])
+    for num_cluster in num_cluster_list:
+        if num_cluster == num_point:  # Every point on its own, even the
+            # ones at the same place, which fcluster() would keep together
+            cut_df[num_cluster] = np.arange(num_point)
+            continue
+        cut_df[num_cluster] = pd.factorize(fcluster(
+            cluster_tree['linkage'], num_cluster, criterion='maxclust'))[0]
+    return cut_df
+
+
+def cut_cluster_tree(cluster_tree, num_cluster):
+    # Cluster number of every row of the df the tree was built on when the
+    # tree is cut into num_cluster clusters. Assigning the result to a
+    # column aligns it by index
+    cut_df = precompute_cluster_cuts(cluster_tree, [num_cluster])
+    return cut_df[cut_df.columns[0]].rename('Cluster')
+
+
+def assign_clusters_from_tree(df_no_restaurant, cluster_tree, num_cluster):
+    # Same output as the KMeans cell of the notebook: the column Cluster is
+    # the 1st column and the df is sorted by it
+    output_df = df_no_restaurant.copy()
+    output_df.insert(0, 'Cluster', cut_cluster_tree(cluster_tree,
+                                                    num_cluster)
+                     .reindex(output_df.index))
+    output_df = output_df.sort_values(by=['Cluster'])
+    return output_df
+
+
+def calculate_tree_inertia(df_no_restaurant, cluster_tree, max_num_cluster):
+    # Within-cluster sum of squares of every cut from 1 to max_num_cluster
+    # clusters. This can be used instead of calculate_inertia() for the
+    # elbow plot without fitting KMeans max_num_cluster times
+    cut_df = precompute_cluster_cuts(cluster_tree,
+                                     range(1, max_num_cluster + 1))
+    coordinate_array = df_no_restaurant.loc[
+        cut_df.index, ['Longitude', 'Latitude']].values
+
+    wcss = []
+    for num_cluster in cut_df.columns:
+        labels = cut_df[num_cluster].values
+        centroid_array = np.vstack([
+            np.bincount(labels, weights=coordinate_array[:, i]) /
+            np.bincount(labels) for i in range(2)]).T
+        wcss.append(float(((coordinate_array - centroid_array[labels]) ** 2)
+                          .sum()))
+    return wcss
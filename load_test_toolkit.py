@@ -0,0 +1,148 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+from synthetic_takeout_toolkit import write_synthetic_takeout_json, \
+    add_synthetic_extracted_category
+
+# Load test of the planning service (planning_service_toolkit.py). Several
+# simulated planners request a mix of endpoints at the same time; the ones
+# that already have a response send its ETag back like a browser would. Run
+# it from the repo root, e.g.
+#   python load_test_toolkit.py --clients 8 --requests 50
+# With --url it tests a service that is already running, otherwise it starts
+# one on a synthetic trip
+
+default_path_list = [
+    '/trips',
+    '/trips/{trip}/places',
+    '/trips/{trip}/places?category=Garden,Museum',
+    '/trips/{trip}/clusters?k=4',
+    '/trips/{trip}/clusters?k=6',
+    '/trips/{trip}/hulls?k=4',
+    '/trips/{trip}/hulls?k=6',
+    '/trips/{trip}/map?k=4',
+]
+
+
+def build_synthetic_trip(num_place=2000, seed=0):
+    # Labeled df of a synthetic export, i.e. full_df_labeled of the notebook
+    from google_map_data_toolkit import json_to_df, location_df_clean, \
+        label_based_on_scraped_category
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        json_path = os.path.join(work_dir, 'saved_places.json')
+        write_synthetic_takeout_json(json_path, num_place, 'clustered', seed)
+        location_df = location_df_clean(json_to_df(json_path))
+    return label_based_on_scraped_category(
+        add_synthetic_extracted_category(location_df))
+
+
+def run_client(base_url, path_list, num_request, use_etag, seed, result_list,
+               result_lock):
+    # 1 simulated planner. Every result is (path, status, seconds, bytes)
+    rng = np.random.default_rng(seed)
+    etag_dict = {}
+    client_result_list = []
+    for _ in range(num_request):
+        path = path_list[rng.integers(0, len(path_list))]
+        request = Request(base_url + path)
+        if use_etag and path in etag_dict:
+            request.add_header('If-None-Match', etag_dict[path])
+
+        start = time.perf_counter()
+        try:
+            with urlopen(request, timeout=300) as response:
+                body = response.read()
+                status = response.status
+                etag_dict[path] = response.headers.get('ETag')
+        except HTTPError as error:  # 304 and the errors
+            body = b''
+            status = error.code
+        client_result_list.append((path, status,
+                                   time.perf_counter() - start, len(body)))
+
+    with result_lock:
+        result_list.extend(client_result_list)
+
+
+def run_load_test(base_url, trip, num_client=8, num_request=50,
+                  use_etag=True, path_list=None):
+    # Caller function that runs num_client planners in parallel and prints
+    # the throughput, the latency percentiles and the status counts
+    path_list = [path.format(trip=trip)
+                 for path in (path_list or default_path_list)]
+    result_list = []
+    result_lock = threading.Lock()
+    thread_list = [
+        threading.Thread(target=run_client, args=(
+            base_url, path_list, num_request, use_etag, seed, result_list,
+            result_lock))
+        for seed in range(num_client)
+    ]
+
+    start = time.perf_counter()
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    wall_time = time.perf_counter() - start
+
+    latency_array = np.array([result[2] for result in result_list])
+    status_list = [result[1] for result in result_list]
+    summary_dict = {
+        'requests': len(result_list),
+        'wall_time_s': wall_time,
+        'requests_per_s': len(result_list) / wall_time,
+        'p50_ms': float(np.percentile(latency_array, 50) * 1000),
+        'p95_ms': float(np.percentile(latency_array, 95) * 1000),
+        'max_ms': float(latency_array.max() * 1000),
+        'status_counts': {status: status_list.count(status)
+                          for status in sorted(set(status_list))},
+        'megabytes': sum(result[3] for result in result_list) / (1024 * 1024)
+    }
+    print('> {requests} requests in {wall_time_s:.2f} s '
+          '({requests_per_s:.1f}/s), p50 {p50_ms:.1f} ms, p95 {p95_ms:.1f} '
+          'ms, max {max_ms:.1f} ms, {megabytes:.1f} MB sent'
+          .format(**summary_dict))
+    print('> Status counts: {}'.format(summary_dict['status_counts']))
+    return summary_dict
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Load test the planning service.')
+    parser.add_argument('--url', help='Base URL of a running service, e.g. '
+                                      'http://127.0.0.1:8765')
+    parser.add_argument('--trip', default='synthetic')
+    parser.add_argument('--places', type=int, default=2000,
+                        help='Size of the synthetic trip when no --url')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50,
+                        help='Requests per client')
+    parser.add_argument('--no-etag', action='store_true',
+                        help="Don't send If-None-Match")
+    arguments = parser.parse_args()
+
+    planning_server = None
+    base_url = arguments.url
+    if base_url is None:
+        from planning_service_toolkit import start_planning_server
+
+        planning_server = start_planning_server(
+            {arguments.trip: build_synthetic_trip(arguments.places)}, port=0)
+        base_url = 'http://{}:{}'.format(*planning_server.server_address)
+
+    try:
+        run_load_test(base_url.rstrip('/'), arguments.trip,
+                      arguments.clients, arguments.requests,
+                      not arguments.no_etag)
+    finally:
+        if planning_server is not None:
+            planning_server.shutdown()
@@ -0,0 +1,61 @@
+import sys
+
+# Notifications at the end of long jobs (scraping, elbow plot). The sounds
+# used to come straight from winsound, which only exists on Windows and made
+# every module that imports the scraper fail elsewhere. Now every event
+# calls a hook that can be replaced, e.g. set_notification_hook('done',
+# None) for a silent worker or a function that sends a message
+
+notification_hook_dict = {}  # Event ('done' or 'error') -> function
+
+
+def beep_done():
+    # Rising beeps on Windows, the terminal bell elsewhere
+    try:
+        import winsound
+    except ImportError:
+        sys.stdout.write('\a')
+        sys.stdout.flush()
+        return 0
+
+    for i in range(2):
+        freq = 100
+        dur = 50
+        for i in range(5):
+            winsound.Beep(freq, dur)
+            freq += 100
+            dur += 50
+    return 0
+
+
+def beep_error():
+    try:
+        import winsound
+    except ImportError:
+        sys.stdout.write('\a')
+        sys.stdout.flush()
+        return 0
+
+    winsound.PlaySound("SystemHand", winsound.SND_ALIAS)
+    return 0
+
+
+def set_notification_hook(event, hook):
+    # hook is a function without arguments, or None to mute the event
+    notification_hook_dict[event] = hook
+    return 0
+
+
+def notify(event):
+    # Call the hook of event. Events without a hook set use the default
+    # sounds
+    hook = notification_hook_dict.get(event, default_hook_dict.get(event))
+    if hook is not None:
+        hook()
+    return 0
+
+
+default_hook_dict = {
+    'done': beep_done,
+    'error': beep_error
+}
@@ -0,0 +1,248 @@
+import queue
+import threading
+from random import randint
+from time import sleep
+
+import pandas as pd
+
+from export_toolkit import IncrementalGeoJSONWriter
+from google_map_data_toolkit import extract_place_id, label_extracted_category
+from profiling_toolkit import profile_stage, record_cache_lookup, \
+    get_current_stage, stage_in_thread
+
+# Streaming mode of the pipeline. Instead of scraping the whole df before
+# the labelling and the map can start, 3 threads are chained with bounded
+# queues: the scraper puts every place on the 1st queue as soon as it's
+# scraped, the labeller labels it and puts it on the 2nd queue, and the
+# writer appends it to a GeoJSON file and to a folium map that is saved at
+# the end and at the checkpoints. The stages overlap, so the total time is
+# about the time of the slowest stage (the scraping) instead of the sum of
+# all of them, and the bounded queues keep a fast stage from running far
+# ahead of a slow one
+
+default_queue_size = 20
+default_map_every = 50  # Places between 2 saves of the partial map. Saving
+# renders the whole map, so saving at every place would cost quadratic time
+geojson_coordinate_decimals = 7  # Full precision of the json (~1 cm), not
+# the rounder default of the exports
+end_of_stream = None  # Put on a queue after the last place
+
+
+def put_until_stopped(output_queue, item, stop_event):
+    # queue.put() that gives up when another stage has failed, otherwise a
+    # stage would wait forever for room on the queue of a dead stage
+    while not stop_event.is_set():
+        try:
+            output_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def get_until_stopped(input_queue, stop_event):
+    while not stop_event.is_set():
+        try:
+            return input_queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return end_of_stream
+
+
+class PartialMap:
+    # Folium map of the places labeled so far. New places are only added as
+    # markers to the existing feature groups, and the html is only rendered
+    # by save(), so the work grows with the number of places instead of
+    # rebuilding the whole map at every checkpoint. Closed places are left
+    # out like in the notebook
+
+    def __init__(self, map_path):
+        self.map_path = map_path
+        self.pending_row_dict_list = []
+        self.folium_map_tuple = None  # (map, restaurant group, site group)
+
+    def add(self, row_dict):
+        if row_dict.get('Category') != 'Closed':
+            self.pending_row_dict_list.append(row_dict)
+        return 0
+
+    def save(self):
+        from folium_map_toolkit import initialize_folium_map, \
+            add_in_location_markers, add_legend, add_layer_control
+
+        if self.pending_row_dict_list:
+            new_df = pd.DataFrame(self.pending_row_dict_list)
+            if self.folium_map_tuple is None:  # Centered on the 1st places
+                my_map, restaurant_group, site_group, _ = \
+                    initialize_folium_map(new_df, 0)
+                add_layer_control(add_legend(my_map))  # Once for all the
+                # checkpoints
+                self.folium_map_tuple = (my_map, restaurant_group, site_group)
+            add_in_location_markers(new_df, *self.folium_map_tuple,
+                                    legend=False)
+            self.pending_row_dict_list = []
+        if self.folium_map_tuple is None:
+            return None
+        self.folium_map_tuple[0].save(self.map_path)
+        return self.map_path
+
+
+def scrape_stage(input_df, output_queue, stop_event, error_list,
+                 collect_details, cache_path, scrape_row_func):
+    # Producer: put (row index, row dict with the scraped columns) on
+    # output_queue in the order of input_df. Cached places don't wait for
+    # the browser. scrape_row_func(url) -> dict replaces Chrome, e.g. for the
+    # fixture pages of the benchmarks
+    from scrape_google_map_toolkit import load_scrape_cache, \
+        save_scrape_cache, scrape_one_place, ManagedChromeDriver
+
+    scrape_cache = load_scrape_cache(cache_path)
+    place_id_series = extract_place_id(input_df['Google Maps URL']).fillna(
+        input_df['Google Maps URL'])
+    driver = None
+    try:
+        for (index, row), place_id in zip(input_df.iterrows(),
+                                          place_id_series):
+            if stop_event.is_set():
+                break
+            url = row['Google Maps URL']
+            scraped_dict = scrape_cache.get(place_id)
+            if scraped_dict is not None and (not collect_details or
+                                             'Opening Hours' in scraped_dict):
+                record_cache_lookup(True)
+            else:
+                record_cache_lookup(False)
+                if scrape_row_func is not None:
+                    scraped_dict = scrape_row_func(url)
+                else:
+                    if driver is None:
+                        driver = ManagedChromeDriver()
+                    scraped_dict = scrape_one_place(driver, url,
+                                                    collect_details)
+                    sleep(randint(1, 2))  # Same random sleep as
+                    # scrape_all_categories_from_urls()
+                scrape_cache[place_id] = scraped_dict
+
+            row_dict = row.to_dict()
+            row_dict.update(scraped_dict)
+            if not put_until_stopped(output_queue, (index, row_dict),
+                                     stop_event):
+                break
+    except Exception as error:
+        error_list.append(error)
+        stop_event.set()
+    finally:
+        save_scrape_cache(scrape_cache, cache_path)  # Keep what has been
+        # scraped, even if the pipeline fails
+        if driver is not None:
+            driver.quit()
+        put_until_stopped(output_queue, end_of_stream, stop_event)
+
+
+def label_stage(input_queue, output_queue, stop_event, error_list):
+    # Label every scraped place as soon as it arrives
+    try:
+        while True:
+            item = get_until_stopped(input_queue, stop_event)
+            if item is end_of_stream:
+                break
+            index, row_dict = item
+            row_dict['Category'] = label_extracted_category(
+                row_dict['Extracted Category'])
+            if not put_until_stopped(output_queue, (index, row_dict),
+                                     stop_event):
+                break
+    except Exception as error:
+        error_list.append(error)
+        stop_event.set()
+    finally:
+        put_until_stopped(output_queue, end_of_stream, stop_event)
+
+
+def write_stage(input_queue, stop_event, error_list, result_list,
+                geojson_path, map_path, map_every, checkpoint_event):
+    # Consumer: append every labeled place to the GeoJSON file and to the
+    # partial map. The map is saved at the end, every map_every places (never
+    # if map_every is None) and whenever checkpoint_event is set
+    writer = IncrementalGeoJSONWriter(
+        geojson_path, coordinate_decimals=geojson_coordinate_decimals) \
+        if geojson_path is not None else None
+    partial_map = PartialMap(map_path) if map_path is not None else None
+    try:
+        while True:
+            item = get_until_stopped(input_queue, stop_event)
+            if item is end_of_stream:
+                break
+            result_list.append(item)
+            if writer is not None:
+                writer.write_row(item[1])
+            if partial_map is None:
+                continue
+            partial_map.add(item[1])
+            if (map_every and len(result_list) % map_every == 0) or \
+                    (checkpoint_event is not None and
+                     checkpoint_event.is_set()):
+                partial_map.save()
+                if checkpoint_event is not None:
+                    checkpoint_event.clear()
+        if partial_map is not None and not stop_event.is_set():
+            partial_map.save()
+    except Exception as error:
+        error_list.append(error)
+        stop_event.set()
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def run_in_stage(stage_record, target, *args):
+    # Thread target that counts the cache lookups of target for the stage
+    # that started the thread
+    with stage_in_thread(stage_record):
+        return target(*args)
+
+
+@profile_stage()
+def run_streaming_pipeline(input_df, geojson_path=None, map_path=None,
+                           map_every=default_map_every, collect_details=False,
+                           cache_path=None, queue_size=default_queue_size,
+                           scrape_row_func=None, checkpoint_event=None):
+    # Caller function. Same result as scrape_all_categories_from_urls()
+    # followed by label_based_on_scraped_category(), but the labeled places
+    # are written to geojson_path while the scraping is still running. The
+    # map at map_path is saved at the end, and before that every map_every
+    # places (None to only save at the end) or when checkpoint_event (a
+    # threading.Event) is set, e.g. from another notebook cell. If a stage
+    # fails, the other stages stop and the error is raised here
+    scraped_queue = queue.Queue(maxsize=queue_size)
+    labeled_queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    error_list = []
+    result_list = []
+
+    stage_record = get_current_stage()  # None when profiling is off
+    thread_list = [
+        threading.Thread(target=run_in_stage, name='scrape', args=(
+            stage_record, scrape_stage, input_df, scraped_queue, stop_event,
+            error_list, collect_details, cache_path, scrape_row_func)),
+        threading.Thread(target=run_in_stage, name='label', args=(
+            stage_record, label_stage, scraped_queue, labeled_queue,
+            stop_event, error_list)),
+        threading.Thread(target=run_in_stage, name='write', args=(
+            stage_record, write_stage, labeled_queue, stop_event, error_list,
+            result_list, geojson_path, map_path, map_every,
+            checkpoint_event))
+    ]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+
+    if error_list:
+        raise error_list[0]
+
+    output_df = pd.DataFrame([row_dict for _, row_dict in result_list],
+                             index=[index for index, _ in result_list])
+    print('> {} places scraped, labeled and written.'.format(
+        output_df.shape[0]))
+    return output_df
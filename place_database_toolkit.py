@@ -0,0 +1,259 @@
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from dedup_toolkit import calculate_distance_m, meters_per_degree_latitude
+from google_map_data_toolkit import json_to_df, location_df_clean, \
+    extract_place_id
+from profiling_toolkit import profile_stage
+
+# 1 SQLite file that keeps every place ever ingested, for all the trips,
+# with its scraped category, its label and the trips it belongs to. An
+# R-tree virtual table indexes the coordinates, so the places of a new trip
+# are a bounding box or radius query instead of a new ingestion and a new
+# scraping. SQLite comes with Python, so there is nothing to install
+
+default_database_path = 'outputs/places.sqlite'
+
+# Column of the pipeline dfs -> column of the table places
+database_column_dict = {
+    'Place ID': 'place_id',
+    'Google Maps URL': 'google_maps_url',
+    'Latitude': 'latitude',
+    'Longitude': 'longitude',
+    'Address': 'address',
+    'Business Name': 'business_name',
+    'Extracted Category': 'extracted_category',
+    'Category': 'category',
+    'Updated': 'updated'
+}
+
+# Columns that are only overwritten by a non-empty value, so upserting a
+# new export (which has no scraped category yet) keeps the categories
+# scraped for an earlier trip
+keep_existing_column_list = ['extracted_category', 'category', 'updated']
+
+schema_sql = '''
+CREATE TABLE IF NOT EXISTS places (
+    id INTEGER PRIMARY KEY,
+    place_id TEXT NOT NULL UNIQUE,
+    google_maps_url TEXT,
+    latitude REAL,
+    longitude REAL,
+    address TEXT,
+    business_name TEXT,
+    extracted_category TEXT,
+    category TEXT,
+    updated TEXT,
+    first_seen TEXT,
+    last_seen TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS place_rtree USING rtree(
+    id, min_latitude, max_latitude, min_longitude, max_longitude
+);
+CREATE TABLE IF NOT EXISTS trip_places (
+    trip TEXT NOT NULL,
+    place_row_id INTEGER NOT NULL REFERENCES places(id),
+    PRIMARY KEY (trip, place_row_id)
+);
+CREATE INDEX IF NOT EXISTS trip_places_row_id ON trip_places(place_row_id);
+'''
+
+
+def connect_place_database(database_path=default_database_path):
+    # Open (and create if needed) the place database. WAL lets the
+    # notebook read while another process writes
+    connection = sqlite3.connect(database_path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA foreign_keys=ON')
+    connection.executescript(schema_sql)
+    return connection
+
+
+def to_sqlite_value(value):
+    # sqlite3 only binds Python types: numpy int64 is rejected or stored as
+    # a BLOB depending on the version, so numpy scalars become Python
+    # numbers, and NaN, NaT and pd.NA become NULL
+    if pd.api.types.is_scalar(value) and pd.isnull(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value
+
+
+def location_df_to_records(location_df):
+    # Rows of location_df as tuples in the column order of
+    # database_column_dict. Missing columns and NaN become NULL
+    input_df = location_df.copy()
+    if 'Place ID' not in input_df.columns:
+        input_df['Place ID'] = extract_place_id(
+            input_df['Google Maps URL']).fillna(input_df['Google Maps URL'])
+
+    column_list = [input_df[column].tolist() if column in input_df.columns
+                   else [None] * input_df.shape[0]
+                   for column in database_column_dict]
+    return [tuple(to_sqlite_value(value) for value in record)
+            for record in zip(*column_list)]
+
+
+@profile_stage()
+def upsert_places(connection, location_df, trip=None):
+    # Insert the places of location_df (a df of the pipeline, e.g. cleaned,
+    # scraped or labeled) or update them if their ftid/cid is already
+    # there, refresh their R-tree entries and add them to trip. Everything
+    # is done in 1 transaction
+    record_list = location_df_to_records(location_df)
+    database_column_list = list(database_column_dict.values())
+    now = datetime.now().isoformat(timespec='seconds')
+
+    update_sql = ', '.join(
+        '{0} = COALESCE(excluded.{0}, places.{0})'.format(column)
+        if column in keep_existing_column_list else
+        '{0} = excluded.{0}'.format(column)
+        for column in database_column_list if column != 'place_id')
+    upsert_sql = '''
+        INSERT INTO places ({}, first_seen, last_seen)
+        VALUES ({}, ?, ?)
+        ON CONFLICT(place_id) DO UPDATE SET {}, last_seen = excluded.last_seen
+    '''.format(', '.join(database_column_list),
+               ', '.join('?' * len(database_column_list)), update_sql)
+
+    with connection:
+        connection.executemany(upsert_sql, [record + (now, now)
+                                            for record in record_list])
+        connection.execute('CREATE TEMP TABLE IF NOT EXISTS batch_place_ids '
+                           '(place_id TEXT PRIMARY KEY)')
+        connection.execute('DELETE FROM batch_place_ids')
+        connection.executemany(
+            'INSERT OR IGNORE INTO batch_place_ids VALUES (?)',
+            [(record[0],) for record in record_list])
+        # A place that lost its coordinates leaves the R-tree, otherwise the
+        # radius and bounding box queries would still find it at its old
+        # position
+        connection.execute('''
+            DELETE FROM place_rtree WHERE id IN (
+                SELECT id FROM places
+                WHERE place_id IN (SELECT place_id FROM batch_place_ids)
+                  AND (latitude IS NULL OR longitude IS NULL))
+        ''')
+        connection.execute('''
+            INSERT OR REPLACE INTO place_rtree
+            SELECT id, latitude, latitude, longitude, longitude FROM places
+            WHERE place_id IN (SELECT place_id FROM batch_place_ids)
+              AND latitude IS NOT NULL AND longitude IS NOT NULL
+        ''')
+        if trip is not None:
+            connection.execute('''
+                INSERT OR IGNORE INTO trip_places
+                SELECT ?, id FROM places
+                WHERE place_id IN (SELECT place_id FROM batch_place_ids)
+            ''', (trip,))
+
+    print('> {} places upserted into the place database{}.'.format(
+        len(record_list), '' if trip is None else ' for the trip ' + trip))
+    return len(record_list)
+
+
+def ingest_export(connection, file_path, trip):
+    # Caller function: read a Google map export with json_to_df(), clean it
+    # and upsert it for trip
+    location_df = location_df_clean(json_to_df(file_path), keep_updated=True)
+    return upsert_places(connection, location_df, trip)
+
+
+def read_places(connection, where_sql='', parameter_list=(), join_sql=''):
+    # Run a select on places and return a df with the column names of the
+    # pipeline
+    select_sql = 'SELECT {} FROM places {} {}'.format(
+        ', '.join('places.' + column
+                  for column in database_column_dict.values()),
+        join_sql, where_sql)
+    output_df = pd.read_sql_query(select_sql, connection,
+                                  params=list(parameter_list))
+    output_df.columns = list(database_column_dict.keys())
+    return output_df
+
+
+def build_trip_filter(trip):
+    # Extra where clause and parameters that keep only the places of trip
+    if trip is None:
+        return '', []
+    return (' AND places.id IN (SELECT place_row_id FROM trip_places '
+            'WHERE trip = ?)', [trip])
+
+
+def query_bounding_box(connection, min_latitude, max_latitude,
+                       min_longitude, max_longitude, trip=None):
+    # Places inside the box, found through the R-tree. The R-tree stores
+    # 32-bit floats rounded outwards, so the exact coordinates are checked
+    # again on the matched rows
+    trip_sql, trip_parameter_list = build_trip_filter(trip)
+    return read_places(
+        connection,
+        where_sql='''
+            WHERE place_rtree.min_latitude <= ? AND
+                  place_rtree.max_latitude >= ? AND
+                  place_rtree.min_longitude <= ? AND
+                  place_rtree.max_longitude >= ? AND
+                  places.latitude BETWEEN ? AND ? AND
+                  places.longitude BETWEEN ? AND ?''' + trip_sql,
+        parameter_list=[max_latitude, min_latitude, max_longitude,
+                        min_longitude, min_latitude, max_latitude,
+                        min_longitude, max_longitude] + trip_parameter_list,
+        join_sql='JOIN place_rtree ON place_rtree.id = places.id')
+
+
+def query_radius(connection, latitude, longitude, radius_m, trip=None):
+    # Places within radius_m of the point, closest first. The R-tree gives
+    # the places of the bounding box of the circle and only those get their
+    # distance computed
+    delta_latitude = radius_m / meters_per_degree_latitude
+    delta_longitude = delta_latitude / max(np.cos(np.radians(latitude)),
+                                           1e-6)
+    output_df = query_bounding_box(
+        connection, latitude - delta_latitude, latitude + delta_latitude,
+        longitude - delta_longitude, longitude + delta_longitude, trip)
+
+    output_df['Distance (m)'] = calculate_distance_m(
+        latitude, longitude, output_df['Latitude'], output_df['Longitude'])
+    output_df = output_df[output_df['Distance (m)'] <= radius_m]
+    return output_df.sort_values(by=['Distance (m)']).reset_index(drop=True)
+
+
+def query_trip(connection, trip):
+    # All the places of trip, like the .csv of outputs/<trip>/
+    trip_sql, trip_parameter_list = build_trip_filter(trip)
+    return read_places(connection, 'WHERE 1 = 1' + trip_sql,
+                       trip_parameter_list)
+
+
+def add_places_to_trip(connection, trip, place_id_list):
+    # Make existing places (ftid/cid) members of trip, e.g. the result of a
+    # radius query for a new trip to the same area
+    with connection:
+        connection.executemany('''
+            INSERT OR IGNORE INTO trip_places
+            SELECT ?, id FROM places WHERE place_id = ?
+        ''', [(trip, place_id) for place_id in place_id_list])
+    return 0
+
+
+def list_trips(connection):
+    # Number of places of every trip
+    return pd.read_sql_query('''
+        SELECT trip AS Trip, COUNT(*) AS Places FROM trip_places
+        GROUP BY trip ORDER BY trip
+    ''', connection)
+
+
+def get_places_without_category(connection, trip=None):
+    # Places that still need scraping. Places scraped for any earlier trip
+    # already have their category and aren't returned
+    trip_sql, trip_parameter_list = build_trip_filter(trip)
+    return read_places(connection,
+                       'WHERE places.extracted_category IS NULL' + trip_sql,
+                       trip_parameter_list)
@@ -0,0 +1,389 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from profiling_toolkit import record_cache_lookup
+
+# Local web service on top of the toolkits so the planners of a trip can
+# look at filtered places, clusters, hulls and maps from a browser instead of
+# running the notebook cells again. Every response is cached in an LRU cache
+# keyed by (endpoint, trip, filter, k), so KMeans, the convex hulls and the
+# folium html are only computed once per combination, and every response has
+# an ETag so a client that already has it gets a 304 without a body.
+#
+# Endpoints (GET):
+#   /trips
+#   /trips/<trip>/places?category=Garden,Museum
+#   /trips/<trip>/clusters?k=6&category=...
+#   /trips/<trip>/hulls?k=6&category=...
+#   /trips/<trip>/map?k=6&category=...
+# category keeps only the given labels (all but Closed by default). The
+# clusters, hulls and map only use the non-restaurants, like the notebook
+
+default_cache_size = 128  # Number of responses kept
+default_port = 8765
+
+
+class NotFoundError(Exception):
+    # Unknown trip, path or endpoint, answered with a 404. Any other error,
+    # KeyError included, is a failure of the service and gets a 500
+    pass
+
+
+class LRUCache:
+    # Thread-safe LRU cache. get_or_compute() runs compute_func only once
+    # per key even when several requests miss at the same time: the 1st one
+    # computes and the others wait for its result. A value whose computation
+    # started before an invalidate() is returned to its request but not
+    # cached, since it may come from the data that was just replaced
+
+    def __init__(self, max_size=default_cache_size):
+        self.max_size = max_size
+        self.item_dict = OrderedDict()
+        self.in_progress_dict = {}  # Key -> threading.Event
+        self.generation = 0  # Number of invalidate() calls so far
+        self.lock = threading.RLock()  # Reentrant so that a caller can
+        # change its data and invalidate() under the same lock
+
+    def get_or_compute(self, key, compute_func):
+        while True:
+            with self.lock:
+                if key in self.item_dict:
+                    self.item_dict.move_to_end(key)
+                    record_cache_lookup(True)
+                    return self.item_dict[key]
+                done_event = self.in_progress_dict.get(key)
+                if done_event is None:
+                    done_event = threading.Event()
+                    self.in_progress_dict[key] = done_event
+                    generation = self.generation
+                    break  # This thread computes the value
+            done_event.wait()  # Another thread computes it. If it failed,
+            # the key is still missing and this thread tries again
+
+        record_cache_lookup(False)
+        try:
+            value = compute_func()
+            with self.lock:
+                if self.generation == generation:
+                    self.item_dict[key] = value
+                    self.item_dict.move_to_end(key)
+                    while len(self.item_dict) > self.max_size:
+                        self.item_dict.popitem(last=False)
+            return value
+        finally:
+            with self.lock:
+                del self.in_progress_dict[key]
+            done_event.set()
+
+    def invalidate(self, trip):
+        # Drop every response of trip and the list of trips, e.g. after the
+        # places of trip have changed. The computations still running won't
+        # be cached
+        with self.lock:
+            self.generation += 1
+            for key in [key for key in self.item_dict
+                        if key[1] == trip or key[0] == 'trips']:
+                del self.item_dict[key]
+
+
+def make_response(body, content_type='application/json'):
+    # (body bytes, ETag, content type). The ETag is a hash of the body, so
+    # it only changes when the content does
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+    etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+    return body, etag, content_type
+
+
+def etag_matches(if_none_match, etag):
+    # True if the If-None-Match header (a comma-separated list of ETags,
+    # possibly weak W/"..." ones, or *) matches etag. If-None-Match uses the
+    # weak comparison, so the W/ prefix is ignored
+    if if_none_match is None:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def df_to_records(input_df, column_list):
+    # json-ready list of dicts with NaN as null
+    output_df = input_df[[column for column in column_list
+                          if column in input_df.columns]]
+    return json.loads(output_df.to_json(orient='records'))
+
+
+class PlanningService:
+    # The trips served and the cached computations on them. trip_df_dict
+    # maps a trip name to its labeled df (full_df_labeled of the notebook)
+
+    place_column_list = ['Google Maps URL', 'Latitude', 'Longitude',
+                         'Address', 'Business Name', 'Extracted Category',
+                         'Category']
+
+    def __init__(self, trip_df_dict, cache_size=default_cache_size):
+        self.trip_df_dict = dict(trip_df_dict)
+        self.cache = LRUCache(cache_size)
+
+    def set_trip(self, trip, labeled_df):
+        # Under the lock of the cache, so a response computed from the old df
+        # can't be cached after the invalidation
+        with self.cache.lock:
+            self.trip_df_dict[trip] = labeled_df
+            self.cache.invalidate(trip)
+
+    def get_trip_df(self, trip):
+        trip_df = self.trip_df_dict.get(trip)
+        if trip_df is None:
+            raise NotFoundError('Unknown trip {}'.format(trip))
+        return trip_df
+
+    def filter_places(self, trip, category_filter):
+        trip_df = self.get_trip_df(trip)
+        if category_filter:
+            return trip_df[trip_df['Category'].isin(category_filter)]
+        return trip_df[trip_df['Category'] != 'Closed']
+
+    def get_cluster_df(self, trip, category_filter, num_cluster):
+        # df_no_restaurant with the column Cluster, fitted the same way as
+        # the KMeans cell of the notebook
+        def compute():
+            from sklearn.cluster import KMeans
+
+            open_df = self.filter_places(trip, category_filter)
+            df_no_restaurant = open_df[
+                open_df['Category'] != 'Restaurant'].copy()
+            if df_no_restaurant.shape[0] < num_cluster:
+                raise ValueError('k={} is more than the {} places to '
+                                 'cluster'.format(num_cluster,
+                                                  df_no_restaurant.shape[0]))
+            df_no_restaurant.insert(0, 'Cluster', KMeans(
+                n_clusters=num_cluster, n_init=30, random_state=0)
+                .fit_predict(df_no_restaurant[['Latitude', 'Longitude']]))
+            return df_no_restaurant.sort_values(by=['Cluster'])
+
+        return self.cache.get_or_compute(
+            ('cluster_df', trip, category_filter, num_cluster), compute)
+
+    def trips_response(self):
+        def compute():
+            return make_response([
+                {'trip': trip, 'places': int(trip_df.shape[0])}
+                for trip, trip_df in list(self.trip_df_dict.items())])
+
+        return self.cache.get_or_compute(('trips', None, (), None), compute)
+
+    def places_response(self, trip, category_filter):
+        return self.cache.get_or_compute(
+            ('places', trip, category_filter, None),
+            lambda: make_response(df_to_records(
+                self.filter_places(trip, category_filter),
+                self.place_column_list)))
+
+    def clusters_response(self, trip, category_filter, num_cluster):
+        def compute():
+            cluster_df = self.get_cluster_df(trip, category_filter,
+                                             num_cluster)
+            centroid_df = cluster_df.groupby('Cluster')[
+                ['Latitude', 'Longitude']].mean().reset_index()
+            return make_response({
+                'k': num_cluster,
+                'centroids': df_to_records(centroid_df, ['Cluster',
+                                                         'Latitude',
+                                                         'Longitude']),
+                'places': df_to_records(cluster_df, ['Cluster'] +
+                                        self.place_column_list)
+            })
+
+        return self.cache.get_or_compute(
+            ('clusters', trip, category_filter, num_cluster), compute)
+
+    def hulls_response(self, trip, category_filter, num_cluster):
+        def compute():
+            from convex_hull_interpolation_toolkit import \
+                generate_cluster_hulls
+
+            hull_dict = generate_cluster_hulls(self.get_cluster_df(
+                trip, category_filter, num_cluster))
+            return make_response({
+                'k': num_cluster,
+                'hulls': [{
+                    'Cluster': int(cluster_idx),
+                    'coordinates': [[float(x), float(y)]
+                                    for x, y in zip(interp_x, interp_y)]
+                } for cluster_idx, (interp_x, interp_y) in
+                    sorted(hull_dict.items())]  # [longitude, latitude] like
+                # GeoJSON
+            })
+
+        return self.cache.get_or_compute(
+            ('hulls', trip, category_filter, num_cluster), compute)
+
+    def map_response(self, trip, category_filter, num_cluster):
+        def compute():
+            from folium_map_toolkit import generate_folium_map
+
+            my_map = generate_folium_map(
+                self.filter_places(trip, category_filter),
+                self.get_cluster_df(trip, category_filter, num_cluster),
+                num_cluster)
+            return make_response(my_map.get_root().render().encode('utf-8'),
+                                 'text/html; charset=utf-8')
+
+        return self.cache.get_or_compute(
+            ('map', trip, category_filter, num_cluster), compute)
+
+    def handle(self, path, query_dict):
+        # Route a GET to its response. Raises NotFoundError for unknown trips
+        # or paths and ValueError for bad parameters
+        part_list = [part for part in path.split('/') if part]
+        if part_list == ['trips']:
+            return self.trips_response()
+        if len(part_list) != 3 or part_list[0] != 'trips':
+            raise NotFoundError('Unknown path {}'.format(path))
+
+        trip, endpoint = part_list[1], part_list[2]
+        self.get_trip_df(trip)
+        category_filter = tuple(sorted(
+            category for category in
+            query_dict.get('category', [''])[0].split(',') if category))
+        if endpoint == 'places':
+            return self.places_response(trip, category_filter)
+
+        try:
+            num_cluster = int(query_dict.get('k', [''])[0])
+        except ValueError:
+            raise ValueError('k must be an integer')
+        if num_cluster < 1:
+            raise ValueError('k must be at least 1')
+        if endpoint == 'clusters':
+            return self.clusters_response(trip, category_filter, num_cluster)
+        if endpoint == 'hulls':
+            return self.hulls_response(trip, category_filter, num_cluster)
+        if endpoint == 'map':
+            return self.map_response(trip, category_filter, num_cluster)
+        raise NotFoundError('Unknown endpoint {}'.format(endpoint))
+
+
+class PlanningRequestHandler(BaseHTTPRequestHandler):
+    # The PlanningService is the attribute planning_service of the server
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            body, etag, content_type = self.server.planning_service.handle(
+                url.path, parse_qs(url.query))
+        except NotFoundError as error:
+            return self.send_error_json(404, str(error))
+        except ValueError as error:
+            return self.send_error_json(400, str(error))
+        except Exception as error:  # E.g. a failure of KMeans or folium,
+            # or a column missing from a trip. The client still gets a
+            # response instead of a dropped connection
+            traceback.print_exc()
+            return self.send_error_json(500, '{}: {}'.format(
+                type(error).__name__, error))
+
+        if etag_matches(self.headers.get('If-None-Match'), etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')  # Always revalidate
+        # with the ETag
+        self.end_headers()
+        self.wfile.write(body)
+        return None
+
+    def send_error_json(self, status, message):
+        body = json.dumps({'error': message}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return None
+
+    def log_message(self, format, *args):
+        pass  # Keep the notebook output clean
+
+
+def create_planning_server(trip_df_dict, host='127.0.0.1',
+                           port=default_port,
+                           cache_size=default_cache_size):
+    # Build the server without starting it. port=0 picks a free port
+    server = ThreadingHTTPServer((host, port), PlanningRequestHandler)
+    server.daemon_threads = True
+    server.planning_service = PlanningService(trip_df_dict, cache_size)
+    return server
+
+
+def start_planning_server(trip_df_dict, host='127.0.0.1', port=default_port,
+                          cache_size=default_cache_size):
+    # Start the server in a background thread, e.g. from the notebook. Call
+    # server.shutdown() when done
+    server = create_planning_server(trip_df_dict, host, port, cache_size)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print('> Planning service running at http://{}:{}/trips'.format(
+        *server.server_address))
+    return server
+
+
+def load_trip_dfs(output_directory='outputs'):
+    # {trip: labeled df} of every outputs/<trip>/ that has a labeled stage
+    # (see stage_store_toolkit.py) or a .csv with coordinates and labels
+    trip_df_dict = {}
+    for trip in sorted(os.listdir(output_directory)):
+        trip_directory = os.path.join(output_directory, trip)
+        if not os.path.isdir(trip_directory):
+            continue
+        labeled_path = os.path.join(trip_directory, 'stages',
+                                    'labeled.parquet')
+        if os.path.exists(labeled_path):
+            from stage_store_toolkit import load_stage
+            trip_df_dict[trip] = load_stage(trip_directory, 'labeled')
+            continue
+        for file_name in sorted(os.listdir(trip_directory)):
+            if not file_name.endswith('.csv'):
+                continue
+            trip_df = pd.read_csv(os.path.join(trip_directory, file_name))
+            if {'Latitude', 'Longitude', 'Category'}.issubset(
+                    trip_df.columns):
+                trip_df_dict[trip] = trip_df
+                break
+    return trip_df_dict
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Serve the trips of the outputs folder.')
+    parser.add_argument('--output-dir', default='outputs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=default_port)
+    arguments = parser.parse_args()
+
+    planning_server = create_planning_server(
+        load_trip_dfs(arguments.output_dir), arguments.host, arguments.port)
+    print('> Planning service running at http://{}:{}/trips'.format(
+        *planning_server.server_address))
+    planning_server.serve_forever()
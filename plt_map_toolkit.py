@@ -1,8 +1,15 @@
-import matplotlib.pyplot as plt
+import matplotlib
 import numpy as np
+import pandas as pd
+from matplotlib.colors import to_rgba
+from matplotlib.lines import Line2D
 
 from convex_hull_interpolation_toolkit import generate_convex_hull, \
-    generate_interpolation
+    generate_interpolation, create_four_point_diamond_around
+
+# pyplot is only imported by the functions that show a figure. It picks a
+# GUI backend and is the slowest part of matplotlib to import, and the
+# draw_*() functions and the headless rendering don't need it
 
 # Define the marker style and color for each category. These 2 dict will
 # only be used for making the plt scatter map
@@ -22,84 +29,154 @@ color_dict = {
     'Store': 'purple'
 }
 
+size_dict = {
+    'Restaurant': 200
+}  # The other categories use default_size
+
+# Style of the categories that aren't in the dicts above
+default_marker = 'o'
+default_color = 'grey'
+default_size = 100
+
+legend_order_list = ['Restaurant', 'Site', 'Garden', 'Store', 'Museum']
+# This is the order of legend I specified
+
 
 def plt_scatter_map(travel_city_name, open_df):
     # Simply plot a scatter plot of locations of different categories
+    import matplotlib.pyplot as plt
 
     fig, ax = plt.subplots(figsize=(10, 8))  # Create the scatter plot
+    draw_scatter_map(ax, travel_city_name, open_df)
+
+    # Show the plot
+    plt.show()
 
-    # Plot each category separately with a different marker style and color
-    for category in open_df['Category'].unique():
-        mask = open_df['Category'] == category
-        if category == 'Restaurant':
-            ax.scatter(
-                open_df['Longitude'][mask],
-                open_df['Latitude'][mask],
-                marker=marker_dict[category],
-                color=color_dict[category],
-                s=200,
-                label=category,
-                edgecolor='black',
-                alpha=0.5
-            )
-        else:
-            ax.scatter(
-                open_df['Longitude'][mask],
-                open_df['Latitude'][mask],
-                marker=marker_dict[category],
-                color=color_dict[category],
-                s=100,
-                label=category,
-                edgecolor='black',
-                alpha=0.5
-            )
+
+def draw_scatter_map(ax, travel_city_name, open_df):
+    # Draw the scatter map on a given ax. This only uses the object-oriented
+    # API of matplotlib, so it's also used for the headless rendering in
+    # plt_render_toolkit
+
+    # Encode the categories as integer codes once, look up the style of every
+    # category once and group the categories that share a style (marker,
+    # color and size). There is 1 draw call per style with a single color
+    # and size, which is cheaper for matplotlib than per-point arrays
+    category_codes, category_array = pd.factorize(open_df['Category'],
+                                                  use_na_sentinel=False)
+    category_list = [str(category) for category in category_array]
+
+    category_style_list = [
+        (marker_dict.get(category, default_marker),
+         to_rgba(color_dict.get(category, default_color)),
+         size_dict.get(category, default_size))
+        for category in category_list]
+    category_style_codes, style_list = pd.factorize(
+        pd.Series(category_style_list, dtype=object))
+
+    longitudes = open_df['Longitude'].values
+    latitudes = open_df['Latitude'].values
+    point_style_codes = category_style_codes[category_codes]
+    for style_code, (marker, color, size) in enumerate(style_list):
+        mask = point_style_codes == style_code
+        ax.scatter(
+            longitudes[mask],
+            latitudes[mask],
+            marker=marker,
+            color=color,
+            s=size,
+            edgecolor='black',
+            alpha=0.5
+        )
 
     # Set the chart title and axis labels
     ax.set_title('{} places to visit'.format(travel_city_name))
     ax.set_xlabel('Longitude')
     ax.set_ylabel('Latitude')
 
-    # Add a legend to the plot
-    legend_dict = {}
-    handles, labels = ax.get_legend_handles_labels()
-    for handle, label in zip(handles, labels):
-        legend_dict[label] = handle
-    new_labels = ['Restaurant', 'Site', 'Garden', 'Store', 'Museum']  # This is
-    # the order of legend I specified
-    new_handles = [legend_dict[label] for label in new_labels]
-    ax.legend(new_handles, new_labels, loc='center left',
+    # Add a legend with only the categories that are present, in the order
+    # of legend_order_list and then the unknown categories alphabetically
+    legend_label_list = [category for category in legend_order_list
+                         if category in category_list] + \
+                        sorted(set(category_list) - set(legend_order_list))
+    legend_handle_list = [
+        Line2D(
+            [],
+            [],
+            linestyle='none',
+            marker=marker_dict.get(category, default_marker),
+            markerfacecolor=color_dict.get(category, default_color),
+            markeredgecolor='black',
+            markersize=np.sqrt(size_dict.get(category, default_size)),
+            # scatter sizes are in points^2 and marker sizes in points
+            alpha=0.5
+        )
+        for category in legend_label_list]
+    ax.legend(legend_handle_list, legend_label_list, loc='center left',
               bbox_to_anchor=(1.0, 0.5))
+    return ax
+
+
+def plt_hexbin_map(travel_city_name, open_df, gridsize=30):
+    # Density map for dense place sets where the scatter map becomes
+    # unreadable. The places are binned into hexagons by matplotlib
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    draw_hexbin_map(fig, ax, travel_city_name, open_df, gridsize)
 
-    # Show the plot
     plt.show()
 
 
-def create_four_point_diamond_around(points, delta):
-    # points is a numpy.ndarray that contains only 1 true location's
-    # longitude and latitude. This function will create 4 more
-    # pseudo-locations and add them back to the points numpy.ndarray
+def draw_hexbin_map(fig, ax, travel_city_name, open_df, gridsize=30):
+    # Draw the hexbin map on a given figure and ax. The color of a hexagon
+    # is its number of places; empty hexagons aren't drawn
+    hexbin = ax.hexbin(
+        open_df['Longitude'],
+        open_df['Latitude'],
+        gridsize=gridsize,
+        cmap='YlOrRd',
+        mincnt=1,
+        edgecolors='grey',
+        linewidths=0.2
+    )
+    fig.colorbar(hexbin, ax=ax, label='Number of places')
+
+    ax.set_title('{} place density'.format(travel_city_name))
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    return ax
 
-    new_rows = np.array([
-        [points[0, 0] + delta, points[0, 1]],
-        # Plus delta to the first number
-        [points[0, 0] - delta, points[0, 1]],
-        # Minus delta from the first number
-        [points[0, 0], points[0, 1] + delta],
-        # Plus delta to the second number
-        [points[0, 0], points[0, 1] - delta],
-        # Minus delta from the second number
-    ])  # Create a numpy.ndarray for the 4 pseudo-locations
 
-    return new_rows
+def generate_cluster_color_list(cluster_series, cmap_name='viridis'):
+    # Colors of the clusters, indexed by the cluster number. These are the
+    # colors ax.scatter(c=cluster_series) gives the points by default (the
+    # viridis colormap normalized between the smallest and the largest
+    # cluster number), computed straight from the colormap so no figure is
+    # needed
+    cmap = matplotlib.colormaps[cmap_name]
+    norm = matplotlib.colors.Normalize(vmin=cluster_series.min(),
+                                       vmax=cluster_series.max())
+    return cmap(norm(np.arange(cluster_series.max() + 1)))
 
 
 def plt_cluster_map(travel_city_name, df_no_restaurant, df_restaurant):
     # Plot the clustered data points with the new marker and color dictionaries
+    import matplotlib.pyplot as plt
 
     fig, ax = plt.subplots(figsize=(10, 8))
+    draw_cluster_map(fig, ax, travel_city_name, df_no_restaurant,
+                     df_restaurant)
 
-    scatter_non_restaurant = ax.scatter(  # Draw cluster plot for all the
-        # non-restaurants
+    plt.show()
+
+
+def draw_cluster_map(fig, ax, travel_city_name, df_no_restaurant,
+                     df_restaurant):
+    # Draw the cluster map on a given figure and ax. Like draw_scatter_map(),
+    # this doesn't touch the pyplot state machine
+
+    ax.scatter(  # Draw cluster plot for all the non-restaurants
         df_no_restaurant['Longitude'],
         df_no_restaurant['Latitude'],
         c=df_no_restaurant['Cluster'],
@@ -108,13 +185,9 @@ def plt_cluster_map(travel_city_name, df_no_restaurant, df_restaurant):
         edgecolor='black',
     )
 
-    # The 2 lines below output the colors used in the scatter plot so the later
-    # convex hull interpolation can use the same color as the points
-    labels = df_no_restaurant[
-        'Cluster'].unique()  # Get the unique cluster labels
-    color_list = scatter_non_restaurant.cmap(
-        scatter_non_restaurant.norm(
-            labels))  # Get the colors used for each label
+    # Use the same colors as the points for the later convex hull
+    # interpolation
+    color_list = generate_cluster_color_list(df_no_restaurant['Cluster'])
 
     for cluster_idx in df_no_restaurant.Cluster.unique():  # Add in the convex
         # hull and interpolate
@@ -201,7 +274,7 @@ def plt_cluster_map(travel_city_name, df_no_restaurant, df_restaurant):
     ax.set_xlabel('Longitude')
     ax.set_ylabel('Latitude')
 
-    plt.figtext(
+    fig.text(
         0,
         0,
         'Only cluster with 3 points have a convex hull '
@@ -211,5 +284,4 @@ def plt_cluster_map(travel_city_name, df_no_restaurant, df_restaurant):
         fontsize=10,
         color='red'
     )
-
-    plt.show()
+    return ax
@@ -0,0 +1,184 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from file_management_toolkit import judge_create_directory
+from plt_map_toolkit import draw_scatter_map, draw_cluster_map, \
+    draw_hexbin_map
+
+# Headless rendering of the plt maps into .png/.svg files. The figures are
+# made with the object-oriented API and the Agg canvas, so nothing goes
+# through the pyplot state machine and nothing is shown. Many trips can be
+# rendered in parallel worker processes that read the coordinates from
+# shared memory instead of receiving a pickled copy of every df
+
+
+def new_agg_figure(figsize=(10, 8)):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)  # Attach the Agg canvas to the figure
+    ax = fig.add_subplot()
+    return fig, ax
+
+
+def save_figure(fig, file_path):
+    # The file format (png, svg, pdf...) follows the file extension
+    fig.savefig(file_path, bbox_inches='tight')
+    return file_path
+
+
+def render_scatter_map_to_file(travel_city_name, open_df, file_path):
+    # Headless version of plt_scatter_map()
+    fig, ax = new_agg_figure()
+    draw_scatter_map(ax, travel_city_name, open_df)
+    return save_figure(fig, file_path)
+
+
+def render_cluster_map_to_file(travel_city_name, df_no_restaurant,
+                               df_restaurant, file_path):
+    # Headless version of plt_cluster_map()
+    fig, ax = new_agg_figure()
+    draw_cluster_map(fig, ax, travel_city_name, df_no_restaurant,
+                     df_restaurant)
+    return save_figure(fig, file_path)
+
+
+def render_hexbin_map_to_file(travel_city_name, open_df, file_path,
+                              gridsize=30):
+    # Headless version of plt_hexbin_map()
+    fig, ax = new_agg_figure()
+    draw_hexbin_map(fig, ax, travel_city_name, open_df, gridsize)
+    return save_figure(fig, file_path)
+
+
+def pack_trips_into_shared_memory(trip_list):
+    # Put the coordinates, category codes and cluster numbers of the open_df
+    # of every trip into 2 shared memory blocks, 1 for the float64
+    # coordinates and 1 for the int32 codes. Each trip is a dict with the
+    # keys name, open_df and, for the cluster map, df_no_restaurant. Returns
+    # the 2 blocks, the category names and the row range of every trip
+    category_list = sorted(set().union(
+        *[set(trip['open_df']['Category'].unique()) for trip in trip_list]))
+    num_row = sum(trip['open_df'].shape[0] for trip in trip_list)
+
+    coordinate_shm = shared_memory.SharedMemory(
+        create=True, size=max(num_row * 2 * 8, 1))
+    code_shm = shared_memory.SharedMemory(
+        create=True, size=max(num_row * 2 * 4, 1))
+    coordinate_array = np.ndarray((num_row, 2), dtype=np.float64,
+                                  buffer=coordinate_shm.buf)
+    code_array = np.ndarray((num_row, 2), dtype=np.int32,
+                            buffer=code_shm.buf)
+
+    row_range_list = []
+    start = 0
+    for trip in trip_list:
+        open_df = trip['open_df']
+        end = start + open_df.shape[0]
+
+        coordinate_array[start:end, 0] = open_df['Longitude'].values
+        coordinate_array[start:end, 1] = open_df['Latitude'].values
+        code_array[start:end, 0] = pd.Categorical(
+            open_df['Category'], categories=category_list).codes
+
+        if trip.get('df_no_restaurant') is not None:  # -1 for the places
+            # that aren't clustered (restaurants)
+            code_array[start:end, 1] = trip['df_no_restaurant']['Cluster'] \
+                .reindex(open_df.index).fillna(-1).astype(np.int32).values
+        else:
+            code_array[start:end, 1] = -1
+
+        row_range_list.append((start, end))
+        start = end
+
+    return coordinate_shm, code_shm, category_list, row_range_list
+
+
+def render_trip_from_shared_memory(task_dict):
+    # Worker function. Rebuild the dfs of 1 trip from the shared memory and
+    # render its maps. The arrays are views of the shared memory, so the
+    # coordinates are never pickled
+    coordinate_shm = shared_memory.SharedMemory(
+        name=task_dict['coordinate_shm_name'])
+    code_shm = shared_memory.SharedMemory(name=task_dict['code_shm_name'])
+    try:
+        num_row = task_dict['num_row']
+        start, end = task_dict['row_range']
+        coordinate_array = np.ndarray((num_row, 2), dtype=np.float64,
+                                      buffer=coordinate_shm.buf)[start:end]
+        code_array = np.ndarray((num_row, 2), dtype=np.int32,
+                                buffer=code_shm.buf)[start:end]
+
+        open_df = pd.DataFrame({
+            'Longitude': coordinate_array[:, 0],
+            'Latitude': coordinate_array[:, 1],
+            'Category': pd.Categorical.from_codes(
+                code_array[:, 0], categories=task_dict['category_list']),
+            'Cluster': code_array[:, 1],
+        })
+
+        file_path_list = [render_scatter_map_to_file(
+            task_dict['name'], open_df, task_dict['scatter_path'])]
+
+        if task_dict['cluster_path'] is not None:
+            df_no_restaurant = open_df[open_df['Cluster'] >= 0]
+            df_restaurant = open_df[open_df['Category'] == 'Restaurant']
+            file_path_list.append(render_cluster_map_to_file(
+                task_dict['name'], df_no_restaurant, df_restaurant,
+                task_dict['cluster_path']))
+
+        del coordinate_array, code_array, open_df  # Release the views
+        # before the shared memory is closed
+    finally:
+        coordinate_shm.close()
+        code_shm.close()
+    return file_path_list
+
+
+def render_trip_maps_in_parallel(trip_list, output_directory,
+                                 file_format='png', max_workers=None):
+    # Caller function that renders the scatter map (and the cluster map if
+    # the trip has a df_no_restaurant) of every trip in trip_list into
+    # output_directory/<name>_scatter.<file_format> and
+    # output_directory/<name>_cluster.<file_format>
+    judge_create_directory(output_directory)
+    coordinate_shm, code_shm, category_list, row_range_list = \
+        pack_trips_into_shared_memory(trip_list)
+    num_row = sum(end - start for start, end in row_range_list)
+
+    task_list = []
+    for trip, row_range in zip(trip_list, row_range_list):
+        file_name = trip['name'].replace(' ', '_').lower()
+        task_list.append({
+            'name': trip['name'],
+            'coordinate_shm_name': coordinate_shm.name,
+            'code_shm_name': code_shm.name,
+            'num_row': num_row,
+            'row_range': row_range,
+            'category_list': category_list,
+            'scatter_path': os.path.join(output_directory, '{}_scatter.{}'
+                                         .format(file_name, file_format)),
+            'cluster_path': os.path.join(output_directory, '{}_cluster.{}'
+                                         .format(file_name, file_format))
+            if trip.get('df_no_restaurant') is not None else None,
+        })
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            file_path_list = [file_path for trip_file_path_list in
+                              executor.map(render_trip_from_shared_memory,
+                                           task_list)
+                              for file_path in trip_file_path_list]
+    finally:
+        coordinate_shm.close()
+        coordinate_shm.unlink()
+        code_shm.close()
+        code_shm.unlink()
+
+    print('> {} maps of {} trips rendered into {}.'.format(
+        len(file_path_list), len(trip_list), output_directory))
+    return file_path_list
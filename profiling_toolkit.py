@@ -0,0 +1,281 @@
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# Opt-in instrumentation for the pipeline stages. Nothing is recorded unless
+# enable_profiling() is called or the environment variable
+# TRAVEL_PLANNING_PROFILE is set to 1 before the toolkits are imported, so the
+# decorated functions behave exactly as before for normal notebook runs
+
+_profiling_enabled = os.environ.get('TRAVEL_PLANNING_PROFILE', '0') == '1'
+_stage_records = []  # One dict per finished stage call
+_records_lock = threading.Lock()  # Stages can finish in different threads
+_thread_state = threading.local()  # Holds the stack of running stages per
+# thread so cache lookups can be attributed to the innermost stage
+_profiling_origin = time.perf_counter()  # Time zero of the Chrome trace
+
+
+def enable_profiling():
+    global _profiling_enabled
+    _profiling_enabled = True
+    return 0
+
+
+def disable_profiling():
+    global _profiling_enabled
+    _profiling_enabled = False
+    return 0
+
+
+def is_profiling_enabled():
+    return _profiling_enabled
+
+
+def reset_profiling():
+    # Forget all the recorded stages and restart the trace clock
+    global _profiling_origin
+    with _records_lock:
+        _stage_records.clear()
+    _profiling_origin = time.perf_counter()
+    return 0
+
+
+def get_peak_rss_mb():
+    # Peak resident set size of the current process in MB since it started,
+    # not of the running stage. resource is only
+    # available on Unix and psutil is optional, so None is returned when
+    # neither can be used
+    try:
+        import resource
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':  # macOS reports bytes, Linux reports KB
+            return peak_rss / (1024 * 1024)
+        return peak_rss / 1024
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+        memory_info = psutil.Process().memory_info()
+        peak_rss = getattr(memory_info, 'peak_wset', memory_info.rss)
+        # peak_wset is the peak working set on Windows
+        return peak_rss / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def count_rows(obj):
+    # Number of rows of a df or an ndarray. Other objects (folium maps,
+    # tuples of hull coordinates...) have no meaningful row count
+    shape = getattr(obj, 'shape', None)
+    if shape is not None and len(shape) > 0:
+        return int(shape[0])
+    return None
+
+
+def _get_stage_stack():
+    if not hasattr(_thread_state, 'stack'):
+        _thread_state.stack = []
+    return _thread_state.stack
+
+
+def get_current_stage():
+    # Record of the innermost stage running in this thread, or None. Pass it
+    # to the worker threads a stage starts, see stage_in_thread()
+    stage_stack = _get_stage_stack()
+    return stage_stack[-1] if stage_stack else None
+
+
+@contextlib.contextmanager
+def stage_in_thread(record):
+    # The stage stack is per thread, so the cache lookups of a worker thread
+    # started by a stage wouldn't be counted for it. Run the worker inside
+    # this with the record given by get_current_stage() in the stage's
+    # thread. A None record (profiling off) does nothing
+    stage_stack = _get_stage_stack()
+    if record is not None:
+        stage_stack.append(record)
+    try:
+        yield record
+    finally:
+        if record is not None:
+            stage_stack.pop()
+
+
+def record_cache_lookup(hit):
+    # Let a cache report a hit (True) or a miss (False) to the innermost
+    # running stage. This is a no-op when profiling is off or when no
+    # decorated stage is running
+    if not _profiling_enabled:
+        return 0
+    stage_stack = _get_stage_stack()
+    if stage_stack:
+        with _records_lock:  # The record can be shared by several threads
+            if hit:
+                stage_stack[-1]['cache_hits'] += 1
+            else:
+                stage_stack[-1]['cache_misses'] += 1
+    return 0
+
+
+def profile_stage(stage_name=None):
+    # Decorator that records wall time, CPU time, memory, rows in/out and
+    # cache hits of a pipeline stage. The rows in are taken from the 1st
+    # positional argument (usually the input_df) and the rows out from the
+    # returned value. The peak RSS of the process never goes down, so a
+    # stage is given by how much it raised it (peak_rss_growth_mb, 0 when
+    # the stage stayed below an earlier peak) next to the peak of the
+    # process when it ended (process_peak_rss_mb)
+    def decorator(func):
+        name = stage_name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profiling_enabled:
+                return func(*args, **kwargs)
+
+            record = {
+                'stage': name,
+                'rows_in': count_rows(args[0]) if args else None,
+                'cache_hits': 0,
+                'cache_misses': 0,
+            }
+            stage_stack = _get_stage_stack()
+            stage_stack.append(record)
+
+            peak_rss_start = get_peak_rss_mb()
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                wall_end = time.perf_counter()
+                cpu_end = time.process_time()
+                stage_stack.pop()
+            process_peak_rss = get_peak_rss_mb()
+
+            lookup_count = record['cache_hits'] + record['cache_misses']
+            record.update({
+                'rows_out': count_rows(result),
+                'start_s': wall_start - _profiling_origin,
+                'wall_time_s': wall_end - wall_start,
+                'cpu_time_s': cpu_end - cpu_start,
+                # process_time() covers all the threads of the process
+                'process_peak_rss_mb': process_peak_rss,
+                'peak_rss_growth_mb': max(process_peak_rss - peak_rss_start,
+                                          0)
+                if process_peak_rss is not None else None,
+                'cache_hit_rate': record['cache_hits'] / lookup_count
+                if lookup_count else None,
+                'thread_id': threading.get_ident(),
+                'depth': len(stage_stack),  # 0 for a top-level stage
+            })
+            with _records_lock:
+                _stage_records.append(record)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def get_stage_records():
+    # Copy of all the recorded stage calls in the order they finished
+    with _records_lock:
+        return [dict(record) for record in _stage_records]
+
+
+def summarize_stage_records():
+    # Aggregate the records of the same stage so repeated calls (e.g. one
+    # generate_convex_hull per cluster) show up as a single line
+    summary_dict = {}
+    for record in get_stage_records():
+        summary = summary_dict.setdefault(record['stage'], {
+            'stage': record['stage'],
+            'calls': 0,
+            'wall_time_s': 0.0,
+            'cpu_time_s': 0.0,
+            'process_peak_rss_mb': None,
+            'peak_rss_growth_mb': None,  # Largest growth of 1 call
+            'cache_hits': 0,
+            'cache_misses': 0,
+        })
+        summary['calls'] += 1
+        summary['wall_time_s'] += record['wall_time_s']
+        summary['cpu_time_s'] += record['cpu_time_s']
+        summary['cache_hits'] += record['cache_hits']
+        summary['cache_misses'] += record['cache_misses']
+        for key in ('process_peak_rss_mb', 'peak_rss_growth_mb'):
+            if record[key] is not None:
+                summary[key] = max(summary[key] or 0, record[key])
+
+    for summary in summary_dict.values():
+        lookup_count = summary['cache_hits'] + summary['cache_misses']
+        summary['cache_hit_rate'] = summary['cache_hits'] / lookup_count \
+            if lookup_count else None
+    return list(summary_dict.values())
+
+
+def print_profile_summary():
+    for summary in summarize_stage_records():
+        print('> {}: {} call(s), wall {:.3f} s, CPU {:.3f} s, peak RSS '
+              'growth {} MB (process peak {} MB), cache hit rate {}'.format(
+            summary['stage'],
+            summary['calls'],
+            summary['wall_time_s'],
+            summary['cpu_time_s'],
+            'n/a' if summary['peak_rss_growth_mb'] is None
+            else '{:.1f}'.format(summary['peak_rss_growth_mb']),
+            'n/a' if summary['process_peak_rss_mb'] is None
+            else '{:.1f}'.format(summary['process_peak_rss_mb']),
+            'n/a' if summary['cache_hit_rate'] is None
+            else '{:.1%}'.format(summary['cache_hit_rate'])
+        ))
+    return 0
+
+
+def save_profile_json(file_path):
+    # Save the raw records and the per-stage summary as structured json so
+    # runs can be compared later
+    profile_dict = {
+        'records': get_stage_records(),
+        'summary': summarize_stage_records(),
+    }
+    with open(file_path, 'w', encoding='utf-8') as file:
+        json.dump(profile_dict, file, indent=2)
+    print('> Profile saved to {}.'.format(file_path))
+    return file_path
+
+
+def save_chrome_trace(file_path):
+    # Save the records in the Chrome trace event format. Open the file in
+    # chrome://tracing or https://ui.perfetto.dev to see the stages on a
+    # timeline
+    process_id = os.getpid()
+    trace_events = []
+    for record in get_stage_records():
+        trace_events.append({
+            'name': record['stage'],
+            'cat': 'stage',
+            'ph': 'X',  # Complete event with a start and a duration
+            'ts': record['start_s'] * 1e6,  # Chrome traces use microseconds
+            'dur': record['wall_time_s'] * 1e6,
+            'pid': process_id,
+            'tid': record['thread_id'],
+            'args': {
+                key: record[key] for key in (
+                    'rows_in', 'rows_out', 'cpu_time_s',
+                    'process_peak_rss_mb', 'peak_rss_growth_mb',
+                    'cache_hits', 'cache_misses', 'cache_hit_rate'
+                )
+            },
+        })
+
+    with open(file_path, 'w', encoding='utf-8') as file:
+        json.dump({'traceEvents': trace_events}, file)
+    print('> Chrome trace saved to {}.'.format(file_path))
+    return file_path
@@ -0,0 +1,242 @@
+import json
+import re
+
+import numpy as np
+
+from dedup_toolkit import calculate_distance_m
+
+# Pack the clustered places into day plans that respect the opening hours and
+# the typical visit durations scraped by
+# scrape_all_categories_from_urls(..., collect_details=True). Clustering
+# alone can put a place that closes at noon into an afternoon, or more
+# hours of visits into a cluster than a day has
+
+default_visit_minutes = 60  # For places without a Visit Duration
+travel_speed_km_per_hour = 30  # Rough driving speed inside a city
+min_travel_minutes = 10  # Parking, walking to the entrance...
+
+
+def normalize_hours_text(text):
+    # Google map uses narrow no-break spaces before AM/PM and en dashes
+    # between times
+    return str(text).replace('\u202f', ' ').replace('\u2009', ' ') \
+        .replace('\u2013', '-').replace('\u2014', '-') \
+        .replace(' to ', '-').strip()
+
+
+def parse_visit_duration_minutes(visit_duration):
+    # "1-2.5 hours", "45 min", "15 min to 1 hr", "Up to 2 hours"... -> the
+    # middle of the range in minutes. Unknown durations get
+    # default_visit_minutes
+    if not isinstance(visit_duration, str) or not visit_duration.strip():
+        return default_visit_minutes
+
+    text = normalize_hours_text(visit_duration).lower()
+    minutes_list = []
+    for number, unit in re.findall(r'(\d+(?:\.\d+)?)\s*(min|hr|hour)?', text):
+        minutes_list.append([float(number), unit])
+    if not minutes_list:
+        return default_visit_minutes
+
+    last_unit = minutes_list[-1][1] or 'hour'  # "1-2.5 hours": the unit of
+    # the 1st number is the one of the 2nd
+    total_minutes = []
+    for number, unit in minutes_list:
+        unit = unit or last_unit
+        total_minutes.append(number if unit == 'min' else number * 60)
+    if visit_duration.strip().lower().startswith('up to'):
+        total_minutes.insert(0, 0)
+    return int(round(np.mean(total_minutes)))
+
+
+def parse_clock_minutes(clock_text, default_meridiem=None):
+    # "9 AM" -> 540, "5:30 PM" -> 1050, "12 AM" -> 0. default_meridiem is
+    # used for times like "5" in "5-9 PM"
+    match = re.match(r'(\d{1,2})(?::(\d{2}))?\s*(AM|PM)?', clock_text.strip(),
+                     re.IGNORECASE)
+    if match is None:
+        return None
+    hour = int(match.group(1)) % 12
+    minute = int(match.group(2) or 0)
+    meridiem = (match.group(3) or default_meridiem or 'AM').upper()
+    if meridiem == 'PM':
+        hour += 12
+    return hour * 60 + minute
+
+
+def parse_opening_intervals(hours_text):
+    # "9 AM-5 PM" -> [(540, 1020)], "11 AM-2 PM, 5-9 PM" -> 2 intervals,
+    # "Open 24 hours" -> [(0, 1440)], "Closed" -> []. Closing after midnight
+    # is clipped to the end of the day
+    text = normalize_hours_text(hours_text)
+    if 'closed' in text.lower():
+        return []
+    if '24 hours' in text.lower():
+        return [(0, 24 * 60)]
+
+    interval_list = []
+    for part in text.split(','):
+        if '-' not in part:
+            continue
+        open_text, close_text = part.split('-', 1)
+        close_meridiem = re.search(r'(AM|PM)', close_text, re.IGNORECASE)
+        close_minutes = parse_clock_minutes(close_text)
+        open_minutes = parse_clock_minutes(
+            open_text, close_meridiem.group(1) if close_meridiem else None)
+        if open_minutes is None or close_minutes is None:
+            continue
+        if close_minutes <= open_minutes:  # e.g. 5 PM-2 AM
+            close_minutes = 24 * 60
+        interval_list.append((open_minutes, close_minutes))
+    return interval_list
+
+
+def parse_24h_clock_minutes(clock_text):
+    # "09:00" -> 540, "18:30" -> 1110
+    hour, minute = clock_text.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+def get_opening_intervals(opening_hours, weekday):
+    # Opening intervals of a place on a weekday from its Opening Hours json.
+    # Places without opening hours (parks, landmarks...) are regarded as
+    # always open
+    if not isinstance(opening_hours, str) or not opening_hours.strip():
+        return [(0, 24 * 60)]
+    opening_hours_dict = json.loads(opening_hours)
+    for day, hours_text in opening_hours_dict.items():
+        if day.lower().startswith(weekday.lower()[:3]):
+            return parse_opening_intervals(hours_text)
+    return [(0, 24 * 60)]
+
+
+def find_visit_start(arrival_minutes, visit_minutes, interval_list):
+    # Earliest start >= arrival_minutes such that the whole visit fits into
+    # 1 opening interval, and the closing of that interval, or (None, None)
+    for open_minutes, close_minutes in interval_list:
+        start_minutes = max(arrival_minutes, open_minutes)
+        if start_minutes + visit_minutes <= close_minutes:
+            return start_minutes, close_minutes
+    return None, None
+
+
+def calculate_travel_minutes(latitude_a, longitude_a, latitude_b,
+                             longitude_b):
+    distance_km = calculate_distance_m(latitude_a, longitude_a, latitude_b,
+                                       longitude_b) / 1000
+    return min_travel_minutes + distance_km / travel_speed_km_per_hour * 60
+
+
+def format_clock(minutes):
+    return '{:02d}:{:02d}'.format(int(minutes) // 60, int(minutes) % 60)
+
+
+def plan_one_day(candidate_df, weekday, day_start_minutes, day_end_minutes,
+                 current_location=None):
+    # Greedy plan for 1 day: from the current place, go to the feasible
+    # place that can be started the earliest (ties broken by the earliest
+    # closing of the opening interval of the visit), until nothing fits
+    # before day_end_minutes. current_location is the (latitude, longitude)
+    # the day continues from, if it doesn't start here. Returns
+    # [(row index, start minutes, end minutes), ...]
+    remaining_index_list = list(candidate_df.index)
+    visit_list = []
+    current_minutes = day_start_minutes
+
+    while remaining_index_list:
+        best = None
+        for index in remaining_index_list:
+            row = candidate_df.loc[index]
+            travel_minutes = 0 if current_location is None else \
+                calculate_travel_minutes(*current_location, row['Latitude'],
+                                         row['Longitude'])
+            interval_list = get_opening_intervals(row.get('Opening Hours'),
+                                                  weekday)
+            start_minutes, closing_minutes = find_visit_start(
+                current_minutes + travel_minutes, row['Visit Minutes'],
+                interval_list)
+            if start_minutes is None or \
+                    start_minutes + row['Visit Minutes'] > day_end_minutes:
+                continue
+            if best is None or (start_minutes, closing_minutes) < best[1:]:
+                best = (index, start_minutes, closing_minutes)
+
+        if best is None:
+            break
+        index, start_minutes, _ = best
+        end_minutes = start_minutes + candidate_df.loc[index, 'Visit Minutes']
+        visit_list.append((index, start_minutes, end_minutes))
+        remaining_index_list.remove(index)
+        current_minutes = end_minutes
+        current_location = (candidate_df.loc[index, 'Latitude'],
+                            candidate_df.loc[index, 'Longitude'])
+
+    return visit_list
+
+
+def find_nearest_cluster(unscheduled_df, cluster_list, location):
+    # Cluster of cluster_list whose centroid is the closest to location
+    centroid_df = unscheduled_df[unscheduled_df['Cluster'].isin(
+        cluster_list)].groupby('Cluster')[['Latitude', 'Longitude']].mean()
+    distance_array = calculate_distance_m(
+        location[0], location[1], centroid_df['Latitude'].values,
+        centroid_df['Longitude'].values)
+    return centroid_df.index[np.argmin(distance_array)]
+
+
+def plan_days(df_no_restaurant, weekday_plan_list, day_start='09:00',
+              day_end='18:00'):
+    # Caller function. weekday_plan_list is the weekday of every day of the
+    # trip, e.g. ['Saturday', 'Sunday', 'Monday']. Every day starts with the
+    # cluster with the most unscheduled places and packs as many of them as
+    # their hours allow. If time is left, the day goes on into the nearest
+    # other cluster, and so on; what doesn't fit is left for the later days.
+    # Adds the columns Day (1, 2... or NaN if it doesn't fit anywhere),
+    # Visit Start and Visit End
+    output_df = df_no_restaurant.copy()
+    output_df['Visit Minutes'] = output_df['Visit Duration'].map(
+        parse_visit_duration_minutes) if 'Visit Duration' in \
+        output_df.columns else default_visit_minutes
+    output_df['Day'] = np.nan
+    output_df['Visit Start'] = None
+    output_df['Visit End'] = None
+
+    day_start_minutes = parse_24h_clock_minutes(day_start)
+    day_end_minutes = parse_24h_clock_minutes(day_end)
+
+    for day_number, weekday in enumerate(weekday_plan_list, start=1):
+        unscheduled_df = output_df[output_df['Day'].isnull()]
+        if unscheduled_df.empty:
+            break
+
+        visit_list = []
+        cluster_list = list(unscheduled_df['Cluster'].value_counts().index)
+        while cluster_list:
+            # Biggest cluster first, then the nearest one to where the day
+            # has got to. A cluster where nothing fits (e.g. all closed on
+            # this weekday) is skipped for this day
+            if visit_list:
+                last_index = visit_list[-1][0]
+                current_location = (output_df.loc[last_index, 'Latitude'],
+                                    output_df.loc[last_index, 'Longitude'])
+                cluster_idx = find_nearest_cluster(
+                    unscheduled_df, cluster_list, current_location)
+                current_minutes = visit_list[-1][2]
+            else:
+                current_location = None
+                cluster_idx = cluster_list[0]
+                current_minutes = day_start_minutes
+            cluster_list.remove(cluster_idx)
+            visit_list += plan_one_day(
+                unscheduled_df[unscheduled_df['Cluster'] == cluster_idx],
+                weekday, current_minutes, day_end_minutes, current_location)
+
+        for index, start_minutes, end_minutes in visit_list:
+            output_df.loc[index, 'Day'] = day_number
+            output_df.loc[index, 'Visit Start'] = format_clock(start_minutes)
+            output_df.loc[index, 'Visit End'] = format_clock(end_minutes)
+
+    print('> {} of {} places fit into {} days.'.format(
+        int(output_df['Day'].notnull().sum()), output_df.shape[0],
+        len(weekday_plan_list)))
+    return output_df.sort_values(by=['Day', 'Visit Start'])
@@ -1,22 +1,26 @@
+import itertools
+import json
 import os
+import re
 import sys
-import requests_cache
 import tempfile
 from datetime import timedelta
 from random import choice
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.common import NoSuchElementException
-import itertools
 
 # Other libraries that can be useful to you
-from bs4 import BeautifulSoup
 from pprint import pprint  # For pretty print
 from random import randint  # For random sleep
 from time import sleep  # For hard-pause sleep
-from tqdm.notebook import tqdm  # Show loop progress
-import winsound  # For audio notification
-import pyperclip  # For copying a string to clipboard
+from tqdm.auto import tqdm  # Show loop progress (a notebook widget in
+# Jupyter and a text bar elsewhere, e.g. when benchmarking)
+
+from google_map_data_toolkit import extract_place_id
+from notification_toolkit import notify  # For audio notification
+from profiling_toolkit import profile_stage, record_cache_lookup
+
+# selenium, requests_cache, bs4 and pyperclip are imported inside the
+# functions that use them, so importing this module (e.g. for
+# load_scrape_cache()) doesn't load the whole scraping stack
 
 
 def generate_headers(headers_dict_from_browser=None):
@@ -33,6 +37,8 @@ def generate_headers(headers_dict_from_browser=None):
         headers (dict): the full headers dict now with a randomly picked
         user_agents
     """
+    import requests_cache
+
     requests_cache.install_cache(
         cache_name=os.path.join(tempfile.gettempdir(), "cnn_cache"),
         expire_after=timedelta(minutes=1),
@@ -105,29 +111,23 @@ def xpath_from_soup_element(element):
 
 
 def sound_notification():
-    for i in range(2):
-        freq = 100
-        dur = 50
-        for i in range(5):
-            winsound.Beep(freq, dur)
-            freq += 100
-            dur += 50
-    return 0
+    return notify('done')  # See notification_toolkit.py to change or mute it
 
 
 def error_sound():
-    winsound.PlaySound("SystemHand", winsound.SND_ALIAS)
-    return 0
+    return notify('error')
 
 
 def soup_element_to_clipboard(soup_element):
+    import pyperclip  # For copying a string to clipboard
+
     pyperclip.copy(str(soup_element))
     return 0
 
 
-def url_to_category(selenium_driver, url):
-    # Srape a given Google map url for the category
-    selenium_driver.get(url)  # Navigate to the URL
+def find_category_element(selenium_driver):
+    # Find the category element of the page that is already loaded
+    from selenium.webdriver.common.by import By
 
     parent_element = selenium_driver.find_element(
         By.CLASS_NAME,
@@ -143,55 +143,317 @@ def url_to_category(selenium_driver, url):
     return child_element
 
 
-def scrape_all_categories_from_urls(input_df):
-    # Caller function for url_to_category(). It works on all the URL from the
-    # column Google Maps URL in input_df and stores all the scraped
-    # categories into a new column Extracted Category
-    output_df = input_df.copy()
+def url_to_category(selenium_driver, url):
+    # Srape a given Google map url for the category
+    selenium_driver.get(url)  # Navigate to the URL
+    wait_for_place_page(selenium_driver)
+
+    return find_category_element(selenium_driver)
+
+
+def scrape_opening_hours(selenium_driver):
+    # Read the opening hours table of the page that is already loaded. The
+    # table is collapsed on the page, so textContent is used instead of
+    # .text, which is empty for hidden elements. Returns a json str like
+    # {"Monday": "9 AM to 5 PM", ...} or '' if the place shows no hours
+    from selenium.webdriver.common.by import By
+
+    opening_hours_dict = {}
+    for row in selenium_driver.find_elements(By.CSS_SELECTOR,
+                                             'table.eK4R0e tr'):
+        cells = row.find_elements(By.TAG_NAME, 'td')
+        if len(cells) < 2:
+            continue
+        day = cells[0].get_attribute('textContent').strip()
+        hours = cells[1].get_attribute('aria-label') or \
+            cells[1].get_attribute('textContent')
+        opening_hours_dict[day] = hours.strip()
+
+    return json.dumps(opening_hours_dict) if opening_hours_dict else ''
+
+
+def scrape_visit_duration(selenium_driver):
+    # Read "People typically spend ... here" of the page that is already
+    # loaded, e.g. "1-2.5 hours". Returns '' if the place shows no duration
+    match = re.search(r'People typically spend ([^<"]+?) here',
+                      selenium_driver.page_source)
+    return match.group(1).strip() if match else ''
+
+
+def url_to_place_details(selenium_driver, url):
+    # Scrape the category, the opening hours and the typical visit duration
+    # of a given Google map url with a single page load
+    from selenium.common import NoSuchElementException
+
+    selenium_driver.get(url)  # Navigate to the URL
+    wait_for_place_page(selenium_driver)
+
+    try:
+        category = find_category_element(selenium_driver).text
+    except NoSuchElementException:  # Same as in
+        # scrape_all_categories_from_urls()
+        category = 'No Category'
+
+    return {
+        'Extracted Category': category,
+        'Opening Hours': scrape_opening_hours(selenium_driver),
+        'Visit Duration': scrape_visit_duration(selenium_driver)
+    }
+
+
+def scrape_one_place(selenium_driver, url, collect_details=False):
+    # Scrape 1 place the way scrape_all_categories_from_urls() does and
+    # return the dict of the scraped columns. Errors other than a missing
+    # category are raised to the caller
+    from selenium.common import NoSuchElementException
+
+    try:
+        if collect_details:
+            return url_to_place_details(selenium_driver, url)
+        child_element = url_to_category(selenium_driver, url)
+        return {'Extracted Category': child_element.text}  # Extract the
+        # text from the desired element
+    except NoSuchElementException:  # This means the location has no
+        # category as specified on Google map (usually the case of a
+        # residential address)
+        return {'Extracted Category': 'No Category'}
+
+
+def load_scrape_cache(cache_path):
+    # The scrape cache is a json {place id: {column: scraped value}} so
+    # places scraped for an earlier trip are never loaded again
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    with open(cache_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_scrape_cache(scrape_cache, cache_path):
+    if cache_path is None:
+        return 0
+    with open(cache_path, 'w', encoding='utf-8') as file:
+        json.dump(scrape_cache, file, indent=1)
+    return 0
+
+
+# URL patterns Chrome doesn't download when block_resources is on: images,
+# fonts, media and the map tiles. None of them is needed to read the text of
+# a place page
+blocked_url_pattern_list = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf',
+    '*.mp4', '*.webm', '*.mp3',
+    '*/maps/vt*', '*/kh/v*', '*/maps/api/js/StaticMapService*',
+    '*googleusercontent.com/*'  # Photos of the places
+]
+
+
+def create_chrome_driver(block_resources=True, window_size=(1024, 768),
+                         page_load_strategy='eager'):
+    # Configure Selenium WebDriver. page_load_strategy 'eager' returns from
+    # driver.get() as soon as the html is parsed instead of waiting for
+    # every image and script, and wait_for_place_page() then waits for the
+    # element that is actually needed
+    from selenium import webdriver
 
-    # Configure Selenium WebDriver
     options = webdriver.ChromeOptions()
     options.add_argument(
         '--headless')  # Open Chrome in headless mode for making
     # screenshots. Uncomment this line to hide the browser UI.
     options.add_argument(
-        '--start-maximized')  # Maximize the browser window to full screen
-    # of your computer
+        '--window-size={},{}'.format(*window_size))  # A small window means
+    # fewer map tiles and less to lay out. --start-maximized has no effect
+    # in headless mode
+    options.page_load_strategy = page_load_strategy
+
+    if block_resources:
+        options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.default_content_setting_values.notifications': 2,
+        })  # 2 means blocked
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_argument('--autoplay-policy=user-gesture-required')
+        # Don't start videos
+
     driver = webdriver.Chrome(options=options)
 
-    extracted_categories = []  # Create a list to store the extracted text
+    if block_resources:  # Fonts, media and tiles can only be blocked by
+        # request interception through the Chrome DevTools Protocol
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs',
+                               {'urls': blocked_url_pattern_list})
+    return driver
+
+
+def wait_for_place_page(selenium_driver, timeout=10, category_timeout=3):
+    # Wait until the place page shows its category (class "skqShb"). A place
+    # without a category has no "skqShb" element, so once its name (h1) is
+    # there the category gets category_timeout more seconds to render
+    # before the page is taken as having none: with the eager page load
+    # strategy the name often shows up before the category. If nothing
+    # shows up in time, the caller's find_element() raises
+    # NoSuchElementException as it did before
+    from selenium.common import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    category_located = EC.presence_of_element_located(
+        (By.CLASS_NAME, 'skqShb'))
+    try:
+        WebDriverWait(selenium_driver, timeout).until(EC.any_of(
+            category_located,
+            EC.presence_of_element_located((By.CSS_SELECTOR, 'h1.DUwDvf'))
+        ))
+        WebDriverWait(selenium_driver, category_timeout).until(
+            category_located)
+    except TimeoutException:
+        pass
+    return 0
 
-    for url in tqdm(output_df[
-                        'Google Maps URL']):  # Iterate over the URLs with
-        # tqdm progress bar
+
+class ManagedChromeDriver:
+    # Chrome driver that is recycled (quit and started again) after
+    # max_pages pages or when the browser processes use more than
+    # max_rss_mb of memory, so long crawls don't slow down or bloat.
+    # Everything else (find_element, page_source...) is passed on to the
+    # current selenium driver, so it can be used wherever a driver is used
+
+    def __init__(self, max_pages=200, max_rss_mb=1500, **driver_kwargs):
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.driver_kwargs = driver_kwargs
+        self.driver = None
+        self.page_count = 0
+        self.recycle_count = 0
+
+    def __getattr__(self, name):
+        # Only called for attributes that ManagedChromeDriver doesn't have.
+        # self.driver is read through __dict__: before __init__ has set it
+        # (failed __init__, copy, unpickling) self.driver would call
+        # __getattr__ again without end
+        if 'driver' not in self.__dict__:
+            raise AttributeError(name)
+        if self.driver is None:
+            self.start()
+        return getattr(self.driver, name)
+
+    def start(self):
+        self.driver = create_chrome_driver(**self.driver_kwargs)
+        self.page_count = 0
+        return self.driver
+
+    def get_browser_rss_mb(self):
+        # Memory of Chrome and all its renderer processes. psutil is
+        # optional; without it only the page count triggers a recycle
+        try:
+            import psutil
+        except ImportError:
+            return None
         try:
-            child_element = url_to_category(driver, url)
+            browser_process = psutil.Process(self.driver.service.process.pid)
+            process_list = [browser_process] + \
+                browser_process.children(recursive=True)
+            return sum(process.memory_info().rss for process in process_list
+                       if process.is_running()) / (1024 * 1024)
+        except (psutil.Error, AttributeError):
+            return None
+
+    def needs_recycle(self):
+        if self.page_count >= self.max_pages:
+            return True
+        if self.max_rss_mb is not None:
+            browser_rss_mb = self.get_browser_rss_mb()
+            return browser_rss_mb is not None and \
+                browser_rss_mb > self.max_rss_mb
+        return False
+
+    def recycle(self):
+        self.quit()
+        self.recycle_count += 1
+        return self.start()
+
+    def get(self, url):
+        if self.driver is None:
+            self.start()
+        elif self.needs_recycle():
+            self.recycle()
+        self.driver.get(url)
+        self.page_count += 1
+        return None
+
+    def quit(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+        return 0
+
+
+@profile_stage()
+def scrape_all_categories_from_urls(input_df, collect_details=False,
+                                   cache_path=None):
+    # Caller function for url_to_category(). It works on all the URL from the
+    # column Google Maps URL in input_df and stores all the scraped
+    # categories into a new column Extracted Category. With collect_details,
+    # url_to_place_details() is used instead and the opening hours and the
+    # visit duration are stored into the columns Opening Hours and Visit
+    # Duration from the same page load. With cache_path, the scraped values
+    # are cached in that json by place id and cached places are skipped
+    output_df = input_df.copy()
 
-            element_text = child_element.text  # Extract the text from the
-            # desired element
+    scrape_cache = load_scrape_cache(cache_path)
+    place_id_series = extract_place_id(output_df['Google Maps URL']).fillna(
+        output_df['Google Maps URL'])  # Fall back to the whole URL if it
+    # has neither a ftid nor a cid
+    driver = None  # Chrome is only started when a place isn't cached
+
+    scraped_dict_list = []  # Create a list to store the extracted values
+
+    for url, place_id in tqdm(zip(output_df['Google Maps URL'],
+                                  place_id_series),
+                              total=output_df.shape[0]):  # Iterate over the
+        # URLs with tqdm progress bar
+        cached_dict = scrape_cache.get(place_id)
+        if cached_dict is not None and (not collect_details or
+                                        'Opening Hours' in cached_dict):
+            record_cache_lookup(True)
+            scraped_dict_list.append(cached_dict)
+            continue
+        record_cache_lookup(False)
+
+        if driver is None:
+            driver = ManagedChromeDriver()
 
-        except NoSuchElementException:  # This means the location has no
-            # category as specified on Google map (usually the case of a
-            # residential address)
-            element_text = 'No Category'
+        try:
+            scraped_dict = scrape_one_place(driver, url, collect_details)
         except Exception as error:  # For all the other errors than
             # NoSuchElementException
+            save_scrape_cache(scrape_cache, cache_path)  # Keep what has
+            # been scraped so far
             error_sound()
             print('Unknown error {} occurs. Program is terminated.'.format(
                 str(error)))
             sys.exit(1)  # Terminate the program
 
-        extracted_categories.append(
-            element_text)  # Append the extracted text to the list
+        scrape_cache[place_id] = scraped_dict
+        scraped_dict_list.append(
+            scraped_dict)  # Append the extracted values to the list
 
         sleep_interval = randint(1, 2)  # Generate a random sleep interval
         # between 1 and 2 seconds
         sleep(sleep_interval)  # Sleep for the random interval
 
-    output_df[
-        'Extracted Category'] = extracted_categories  # Add the extracted text
-    # as a new column in the dataframe
-
-    driver.quit()  # Close the browser
+    output_df['Extracted Category'] = [
+        scraped_dict['Extracted Category']
+        for scraped_dict in scraped_dict_list
+    ]  # Add the extracted text as a new column in the dataframe
+    if collect_details:
+        for column in ['Opening Hours', 'Visit Duration']:
+            output_df[column] = [scraped_dict.get(column, '')
+                                 for scraped_dict in scraped_dict_list]
+
+    save_scrape_cache(scrape_cache, cache_path)
+    if driver is not None:
+        driver.quit()  # Close the browser
     sound_notification()  # Vocally notify the job is done
     return output_df
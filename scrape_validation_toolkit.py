@@ -0,0 +1,169 @@
+import pandas as pd
+
+from dedup_toolkit import calculate_distance_m
+from google_map_data_toolkit import extract_place_id, match_scraped_category
+from profiling_toolkit import profile_stage
+
+# Bulk checks of the scraped categories right after
+# scrape_all_categories_from_urls(), so only the suspicious rows have to be
+# checked by eye and a bad crawl can be repaired by scraping again only the
+# URLs that need it. All the checks are vectorized over the whole df (the
+# category matching is done once per distinct category)
+
+# Share of places without a category in a normal crawl (residential
+# addresses, trailheads...). A window of the crawl where it's several times
+# higher usually means Google changed the html and the selector of
+# url_to_category() no longer finds the category, or Chrome got a captcha
+default_no_category_rate = 0.2
+drift_window = 50  # Number of consecutively scraped places per window
+drift_factor = 3  # A window is a spike above drift_factor * the normal rate
+drift_min_rate = 0.5  # ... and above this rate
+
+max_centroid_distance_km = 50  # Places further from the centroid of the
+# trip are flagged (wrong coordinates in the export or a place of another
+# trip)
+
+# Columns added by validate_scraped_df()
+validation_column_list = ['Selector Drift', 'Missing Category',
+                          'Business Without Category', 'Unknown Category',
+                          'Malformed Category', 'Distance To Centroid (km)',
+                          'Far From Centroid', 'Needs Rescrape']
+
+
+def flag_selector_drift(extracted_category_series, window=drift_window,
+                        baseline_rate=default_no_category_rate):
+    # Rows without a category inside a window of the crawl (in the order
+    # the URLs were scraped) where the share of "No Category" spikes
+    is_no_category = (extracted_category_series == 'No Category') \
+        .astype(float)
+    rolling_rate = is_no_category.rolling(window, center=True,
+                                          min_periods=1).mean()
+    spike_rate = max(drift_factor * baseline_rate, drift_min_rate)
+    return (is_no_category > 0) & (rolling_rate > spike_rate)
+
+
+def flag_unknown_categories(extracted_category_series):
+    # Categories that no term of label_dict covers. They silently become
+    # "Site" in label_based_on_scraped_category(), so either label_dict
+    # needs a new entry or the scraper picked up the wrong element
+    unique_category_array = extracted_category_series.dropna().unique()
+    is_known_dict = {
+        category: category == 'No Category' or
+        match_scraped_category(category) is not None
+        for category in unique_category_array
+    }
+    return ~extracted_category_series.map(is_known_dict).fillna(True) \
+        .astype(bool)
+
+
+def calculate_distance_to_centroid_km(input_df):
+    # Distance of every place to the median point of the df. The median
+    # isn't pulled away by the far places it's meant to find
+    centroid_latitude = input_df['Latitude'].median()
+    centroid_longitude = input_df['Longitude'].median()
+    return calculate_distance_m(centroid_latitude, centroid_longitude,
+                                input_df['Latitude'],
+                                input_df['Longitude']) / 1000
+
+
+@profile_stage()
+def validate_scraped_df(input_df, max_distance_km=max_centroid_distance_km,
+                        window=drift_window,
+                        baseline_rate=default_no_category_rate):
+    # Caller function that adds 1 boolean column per check (see
+    # validation_column_list) and the column Needs Rescrape for the rows
+    # whose scraped category can't be trusted. Unknown categories and far
+    # places are only flagged for a look since scraping them again wouldn't
+    # change them
+    output_df = input_df.drop(columns=validation_column_list,
+                              errors='ignore')
+    extracted_category_series = output_df['Extracted Category']
+
+    output_df['Selector Drift'] = flag_selector_drift(
+        extracted_category_series, window, baseline_rate)
+    output_df['Missing Category'] = extracted_category_series.isnull() | \
+        (extracted_category_series.astype(str).str.strip() == '')
+    output_df['Business Without Category'] = \
+        (extracted_category_series == 'No Category') & \
+        extract_place_id(output_df['Google Maps URL']).str.startswith(
+            'cid:', na=False)  # Places with a cid are businesses, which
+    # always have a category on Google map
+    output_df['Unknown Category'] = flag_unknown_categories(
+        extracted_category_series) & ~output_df['Missing Category']
+    output_df['Malformed Category'] = output_df['Unknown Category'] & \
+        extracted_category_series.astype(str).str.contains(
+            r'[\d(]', regex=True)  # Ratings ("4.5(1,234)"), prices...
+    # are never categories, so the selector matched another element
+    output_df['Distance To Centroid (km)'] = \
+        calculate_distance_to_centroid_km(output_df)
+    output_df['Far From Centroid'] = \
+        output_df['Distance To Centroid (km)'] > max_distance_km
+    output_df['Needs Rescrape'] = output_df['Selector Drift'] | \
+        output_df['Missing Category'] | \
+        output_df['Business Without Category'] | \
+        output_df['Malformed Category']
+
+    print_validation_summary(output_df, baseline_rate)
+    return output_df
+
+
+def print_validation_summary(validated_df, baseline_rate):
+    no_category_rate = (validated_df['Extracted Category'] ==
+                        'No Category').mean()
+    print('> {:.0%} of the places have no category (about {:.0%} is '
+          'normal).'.format(no_category_rate, baseline_rate))
+    for column in validation_column_list:
+        if validated_df[column].dtype == bool:
+            print('> {}: {} places.'.format(column,
+                                            int(validated_df[column].sum())))
+
+    unknown_category_list = sorted(validated_df.loc[
+        validated_df['Unknown Category'], 'Extracted Category'].unique())
+    if unknown_category_list:
+        print('> Categories not covered by label_dict: {}'.format(
+            unknown_category_list))
+
+
+def get_urls_to_rescrape(validated_df):
+    # Exactly the URLs that have to be scraped again
+    return validated_df.loc[validated_df['Needs Rescrape'],
+                            'Google Maps URL'].tolist()
+
+
+def invalidate_scrape_cache(url_list, cache_path):
+    # Remove the places of url_list from the scrape cache, otherwise
+    # scrape_all_categories_from_urls() would give back the bad results
+    from scrape_google_map_toolkit import load_scrape_cache, \
+        save_scrape_cache
+
+    scrape_cache = load_scrape_cache(cache_path)
+    url_series = pd.Series(url_list, dtype=object)
+    place_id_series = extract_place_id(url_series).fillna(url_series)
+    for place_id in place_id_series:
+        scrape_cache.pop(place_id, None)
+    save_scrape_cache(scrape_cache, cache_path)
+
+
+def rescrape_flagged_places(validated_df, collect_details=False,
+                            cache_path=None, **validation_kwargs):
+    # Repair a crawl by scraping again only the rows with Needs Rescrape,
+    # then validate the repaired df again
+    from scrape_google_map_toolkit import scrape_all_categories_from_urls
+
+    rescrape_mask = validated_df['Needs Rescrape']
+    if not rescrape_mask.any():
+        print('> Nothing to scrape again.')
+        return validated_df
+
+    print('> Scraping again {} of {} places.'.format(
+        int(rescrape_mask.sum()), validated_df.shape[0]))
+    invalidate_scrape_cache(get_urls_to_rescrape(validated_df), cache_path)
+    rescraped_df = scrape_all_categories_from_urls(
+        validated_df.loc[rescrape_mask].drop(columns=validation_column_list),
+        collect_details, cache_path)
+
+    output_df = validated_df.drop(columns=validation_column_list)
+    for column in ['Extracted Category', 'Opening Hours', 'Visit Duration']:
+        if column in rescraped_df.columns:
+            output_df.loc[rescrape_mask, column] = rescraped_df[column]
+    return validate_scraped_df(output_df, **validation_kwargs)
@@ -0,0 +1,131 @@
+import os
+
+from file_management_toolkit import judge_create_directory
+from profiling_toolkit import profile_stage
+
+# Save every stage of the pipeline as a columnar file instead of a .csv so
+# the dtypes survive the round-trip and later stages can read only the
+# columns they need. Parquet is compressed and good for keeping results
+# around; the Arrow IPC (Feather) format is uncompressed and can be
+# memory-mapped, so reading it costs almost nothing
+
+stage_name_list = [
+    'raw',  # Output of json_to_df()
+    'cleaned',  # Output of location_df_clean()
+    'filtered',  # Output of location_df_filter_by_allowed_cities()
+    'scraped',  # Output of scrape_all_categories_from_urls()
+    'labeled',  # Output of label_based_on_scraped_category()
+    'clustered'  # df_no_restaurant with the column Cluster
+]
+
+# These columns only hold a handful of distinct strings, so storing them as
+# categories (dictionary encoded) shrinks both the file and the loaded df
+categorical_column_list = ['Category', 'Extracted Category']
+
+# The only columns needed for clustering and the cluster maps
+clustering_column_list = ['Latitude', 'Longitude', 'Category']
+
+file_extension_dict = {
+    'parquet': 'parquet',
+    'arrow': 'arrow'
+}
+
+
+def import_pyarrow():
+    # pyarrow is only needed by this toolkit, so it's imported here with a
+    # clear message rather than at the top of every notebook
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('The stage store needs pyarrow. Install it with '
+                          '"pip install pyarrow".')
+    return pyarrow
+
+
+def get_stage_path(trip_directory, stage, file_format='parquet'):
+    # e.g. outputs/nc_wilmington/stages/labeled.parquet
+    if stage not in stage_name_list:
+        raise ValueError('Unknown stage {}. Use one of {}.'.format(
+            stage, stage_name_list))
+    if file_format not in file_extension_dict:
+        raise ValueError('Unknown file format {}. Use one of {}.'.format(
+            file_format, list(file_extension_dict.keys())))
+    return os.path.join(trip_directory, 'stages', '{}.{}'.format(
+        stage, file_extension_dict[file_format]))
+
+
+def categorize_columns(input_df):
+    # Convert the repeated string columns into the category dtype
+    output_df = input_df.copy()
+    for column in categorical_column_list:
+        if column in output_df.columns and \
+                output_df[column].dtype.name != 'category':
+            output_df[column] = output_df[column].astype('category')
+    return output_df
+
+
+def save_stage(input_df, trip_directory, stage, file_format='parquet'):
+    # Save the df of a pipeline stage. The index is dropped since every
+    # stage works on a plain RangeIndex (or a sorted copy of one)
+    pyarrow = import_pyarrow()
+
+    stage_path = get_stage_path(trip_directory, stage, file_format)
+    judge_create_directory(os.path.dirname(stage_path))
+
+    table = pyarrow.Table.from_pandas(categorize_columns(input_df),
+                                      preserve_index=False)
+    if file_format == 'parquet':
+        pyarrow.parquet.write_table(table, stage_path)
+    else:
+        pyarrow.feather.write_feather(table, stage_path,
+                                      compression='uncompressed')
+        # Uncompressed so the file can be memory-mapped without decoding
+
+    print('> Stage {} ({} rows) saved to {}.'.format(stage, table.num_rows,
+                                                     stage_path))
+    return stage_path
+
+
+@profile_stage()
+def load_stage(trip_directory, stage, columns=None, file_format=None,
+               memory_map=True):
+    # Load a saved stage. columns limits the read to those columns (e.g.
+    # clustering_column_list), which skips the other columns on disk
+    # entirely. If file_format is None, the Arrow file is preferred over the
+    # Parquet one since it can be memory-mapped
+    pyarrow = import_pyarrow()
+
+    if file_format is None:
+        file_format = 'arrow' if os.path.exists(get_stage_path(
+            trip_directory, stage, 'arrow')) else 'parquet'
+    stage_path = get_stage_path(trip_directory, stage, file_format)
+
+    if file_format == 'parquet':
+        table = pyarrow.parquet.read_table(stage_path, columns=columns,
+                                           memory_map=memory_map)
+    else:
+        table = pyarrow.feather.read_table(stage_path, columns=columns,
+                                           memory_map=memory_map)
+
+    return table.to_pandas()  # Dictionary encoded columns come back as
+    # the category dtype
+
+
+def load_clustering_columns(trip_directory, stage='labeled'):
+    # Shortcut that loads only Latitude, Longitude and Category for the
+    # clustering
+    return load_stage(trip_directory, stage, columns=clustering_column_list)
+
+
+def list_saved_stages(trip_directory):
+    # Stages of a trip that have been saved, in pipeline order
+    saved_stage_list = []
+    for stage in stage_name_list:
+        for file_format in file_extension_dict:
+            if os.path.exists(get_stage_path(trip_directory, stage,
+                                             file_format)):
+                saved_stage_list.append(stage)
+                break
+    return saved_stage_list
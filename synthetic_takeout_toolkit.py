@@ -0,0 +1,325 @@
+import json
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote_plus, urlsplit
+
+import numpy as np
+
+# Generate synthetic Google map "Saved Places.json" exports with the same
+# structure as the real Takeout file so the pipeline can be benchmarked
+# without privacy-sensitive data. The fixture server below imitates the
+# Google map place pages so the scraper can be benchmarked without hitting
+# Google
+
+# Fake cities placed around Wilmington, NC. The 1st one is the centre used for
+# all the spatial distributions
+synthetic_city_list = [
+    ('Wilmington', 'NC', '28401', 34.2257, -77.9447),
+    ('Wrightsville Beach', 'NC', '28480', 34.2085, -77.7964),
+    ('Carolina Beach', 'NC', '28428', 34.0352, -77.8936),
+    ('Southport', 'NC', '28461', 33.9210, -78.0203),
+    ('Leland', 'NC', '28451', 34.2563, -78.0447),
+    ('Chapel Hill', 'NC', '27514', 35.9132, -79.0558),
+]
+
+# Scraped categories with the share of the places they're used for. These
+# cover every label in label_based_on_scraped_category()
+synthetic_category_weight_dict = {
+    'American restaurant': 0.15,
+    'Italian restaurant': 0.05,
+    'Bar & grill': 0.05,
+    'Park': 0.08,
+    'Nature preserve': 0.04,
+    'Arboretum': 0.02,
+    'Local history museum': 0.05,
+    'Art museum': 0.03,
+    'Grocery store': 0.06,
+    'Shopping mall': 0.03,
+    'Chocolate shop': 0.03,
+    'Tourist attraction': 0.12,
+    'Historical landmark': 0.08,
+    'Building': 0.06,
+    'No Category': 0.08,
+    'Permanently closed': 0.02,
+    'Temporarily closed': 0.01,
+}
+
+synthetic_category_list = list(synthetic_category_weight_dict.keys())
+
+# Opening hours shown on every fixture place page
+synthetic_opening_hours_list = [
+    ('Monday', 'Closed'),
+    ('Tuesday', '10 AM to 5 PM'),
+    ('Wednesday', '10 AM to 5 PM'),
+    ('Thursday', '10 AM to 5 PM'),
+    ('Friday', '10 AM to 9 PM'),
+    ('Saturday', '9 AM to 9 PM'),
+    ('Sunday', '11 AM to 4 PM'),
+]
+
+street_name_list = ['Front St', 'Market St', 'Chestnut St', 'Princess St',
+                    'Oleander Dr', 'College Rd', 'Lumina Ave', 'Dock St',
+                    'Water St', 'Castle St', 'Carolina Beach Rd', 'Racine Dr']
+business_word_list = ['Harbor', 'Cape Fear', 'Riverwalk', 'Coastal', 'Old',
+                      'Port City', 'Lumina', 'Azalea', 'Masonboro', 'Pelican']
+business_suffix_list = ['Cafe', 'Museum', 'Garden', 'Market', 'Grill',
+                        'Park', 'Gallery', 'Outfitters', 'House', 'Landing']
+
+
+def generate_coordinates(num_place, distribution, rng):
+    # Generate num_place (latitude, longitude) pairs. distribution can be
+    # 'uniform' (spread over a box around the centre), 'clustered' (Gaussian
+    # blobs around the synthetic cities) or 'dense' (most places packed in a
+    # small downtown area, which is the worst case for the map markers)
+    centre_latitude, centre_longitude = synthetic_city_list[0][3:5]
+
+    if distribution == 'uniform':
+        latitudes = rng.uniform(centre_latitude - 0.4, centre_latitude + 0.4,
+                                num_place)
+        longitudes = rng.uniform(centre_longitude - 0.4,
+                                 centre_longitude + 0.4, num_place)
+    elif distribution == 'clustered':
+        city_idx = rng.integers(0, len(synthetic_city_list), num_place)
+        city_coordinates = np.array(
+            [city[3:5] for city in synthetic_city_list])[city_idx]
+        latitudes = city_coordinates[:, 0] + rng.normal(0, 0.03, num_place)
+        longitudes = city_coordinates[:, 1] + rng.normal(0, 0.03, num_place)
+    elif distribution == 'dense':
+        latitudes = centre_latitude + rng.normal(0, 0.005, num_place)
+        longitudes = centre_longitude + rng.normal(0, 0.005, num_place)
+    else:
+        raise ValueError('Unknown distribution {}. Use uniform, clustered or '
+                         'dense.'.format(distribution))
+
+    return latitudes, longitudes
+
+
+def generate_synthetic_columns(num_place, distribution='clustered', seed=0):
+    # Draw every random value of the export at once with 1 seeded generator
+    # and build the string columns with numpy, so 1M places take seconds.
+    # Returns a dict of arrays, 1 entry per place
+    rng = np.random.default_rng(seed)
+    latitudes, longitudes = generate_coordinates(num_place, distribution, rng)
+
+    city_idx = rng.integers(0, len(synthetic_city_list), num_place)
+    is_business = rng.random(num_place) < 0.5
+    has_address_in_title = rng.random(num_place) < 0.1
+    country_codes = np.where(rng.random(num_place) < 0.98, 'US', 'CA')
+    # Some places of a real export are abroad. Without this the column
+    # Country Code would be dropped by drop_same_columns() before
+    # drop_custom_columns() looks for it
+    published_offsets = rng.integers(0, 365 * 24 * 3600, num_place)
+    updated_offsets = published_offsets + rng.integers(0, 30 * 24 * 3600,
+                                                       num_place)
+    street_numbers = rng.integers(1, 3000, num_place)
+    street_idx = rng.integers(0, len(street_name_list), num_place)
+    business_word_idx = rng.integers(0, len(business_word_list), num_place)
+    business_suffix_idx = rng.integers(0, len(business_suffix_list),
+                                       num_place)
+    ftid_halves = rng.integers(0, 2 ** 63, (num_place, 2))
+    cids = rng.integers(10 ** 18, 2 ** 63, num_place)
+
+    city_array = np.array(synthetic_city_list, dtype=object)[city_idx]
+    addresses = (street_numbers.astype(str).astype(object) + ' ' +
+                 np.array(street_name_list, dtype=object)[street_idx] + ', ' +
+                 city_array[:, 0] + ', ' + city_array[:, 1] + ' ' +
+                 city_array[:, 2])
+    business_names = (np.array(business_word_list, dtype=object)[
+                          business_word_idx] + ' ' +
+                      np.array(business_suffix_list, dtype=object)[
+                          business_suffix_idx])
+
+    published_base = np.datetime64('2023-01-01T00:00:00')
+
+    def to_timestamps(offsets):
+        return np.char.add(np.datetime_as_string(
+            published_base + offsets.astype('timedelta64[s]'), unit='s'), 'Z')
+
+    return {
+        'latitude': latitudes,
+        'longitude': longitudes,
+        'is_business': is_business,
+        'has_address_in_title': has_address_in_title,
+        'country_code': country_codes,
+        'address': addresses,
+        'business_name': business_names,
+        'ftid': ['0x{:016x}:0x{:016x}'.format(high, low)
+                 for high, low in ftid_halves.tolist()],
+        'cid': cids.tolist(),
+        'published': to_timestamps(published_offsets),
+        'updated': to_timestamps(updated_offsets)
+    }
+
+
+def iterate_synthetic_features(num_place, distribution='clustered', seed=0):
+    # Yield the GeoJSON features in the Takeout format. About half of the
+    # places are businesses (cid URL with a Business Name) and the rest are
+    # plain addresses (q + ftid URL). Some plain addresses put their address
+    # into Title and leave Address empty, like the real export does
+    column_dict = {
+        column: list(values) if isinstance(values, list) else values.tolist()
+        for column, values in generate_synthetic_columns(
+            num_place, distribution, seed).items()
+    }  # Python lists are much faster to index 1 item at a time
+    latitude_list = column_dict['latitude']
+    longitude_list = column_dict['longitude']
+
+    for i in range(num_place):
+        address = column_dict['address'][i]
+        location_dict = {
+            'Country Code': column_dict['country_code'][i],
+            'Geo Coordinates': {
+                'Latitude': '{:.7f}'.format(latitude_list[i]),
+                'Longitude': '{:.7f}'.format(longitude_list[i])
+            }
+        }  # The real export stores the coordinates as strings
+
+        if column_dict['is_business'][i]:
+            title = column_dict['business_name'][i]
+            google_maps_url = 'http://maps.google.com/?cid={}'.format(
+                column_dict['cid'][i])
+            location_dict['Address'] = address
+            location_dict['Business Name'] = title
+        else:
+            title = address
+            google_maps_url = 'http://maps.google.com/?q={}&ftid={}'.format(
+                quote_plus(address, safe=','), column_dict['ftid'][i])
+            if not column_dict['has_address_in_title'][i]:
+                location_dict['Address'] = address
+
+        yield {
+            'geometry': {
+                'coordinates': [longitude_list[i], latitude_list[i]],
+                'type': 'Point'
+            },
+            'properties': {
+                'Google Maps URL': google_maps_url,
+                'Location': location_dict,
+                'Published': column_dict['published'][i],
+                'Title': title,
+                'Updated': column_dict['updated'][i]
+            },
+            'type': 'Feature'
+        }
+
+
+def generate_synthetic_features(num_place, distribution='clustered', seed=0):
+    # List of the GeoJSON features in the Takeout format
+    return list(iterate_synthetic_features(num_place, distribution, seed))
+
+
+def write_synthetic_takeout_json(file_path, num_place,
+                                 distribution='clustered', seed=0):
+    # Write a synthetic "Saved Places.json" that json_to_df() can read. The
+    # features are written 1 at a time, so the whole export is never held in
+    # memory as Python dicts
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write('{"type": "FeatureCollection", "features": [')
+        for i, feature in enumerate(iterate_synthetic_features(
+                num_place, distribution, seed)):
+            file.write(', ' if i else '')
+            file.write(json.dumps(feature))
+        file.write(']}')
+    print('> Synthetic export with {} places ({}) saved to {}.'.format(
+        num_place, distribution, file_path))
+    return file_path
+
+
+def hash_url(url):
+    # Stable hash of a URL (the builtin hash() is salted per process)
+    return zlib.crc32(url.encode('utf-8'))
+
+
+def synthetic_category_idx(url_list):
+    # Position in synthetic_category_weight_dict of the category of every
+    # URL. The hash of the URL, as a number between 0 and 1, is looked up in
+    # the cumulated weights, so the fixture server and the benchmarks agree
+    # on what a page should contain without any random generator
+    weight_array = np.array(list(synthetic_category_weight_dict.values()))
+    cumulated_weight_array = np.cumsum(weight_array / weight_array.sum())
+    hash_array = np.array([hash_url(url) for url in url_list],
+                          dtype=np.float64) / 2 ** 32
+    return np.minimum(np.searchsorted(cumulated_weight_array, hash_array,
+                                      side='right'),
+                      len(weight_array) - 1)
+
+
+def synthetic_category_for_url(url):
+    # Deterministic scraped category of 1 URL
+    return synthetic_category_list[synthetic_category_idx([url])[0]]
+
+
+def add_synthetic_extracted_category(input_df):
+    # Fill the column Extracted Category the same way the fixture server
+    # would, so the stages after the scraping can be benchmarked without
+    # running the scraper
+    output_df = input_df.copy()
+    output_df['Extracted Category'] = np.array(
+        synthetic_category_list, dtype=object)[
+        synthetic_category_idx(output_df['Google Maps URL'])]
+    return output_df
+
+
+def render_fixture_place_page(url):
+    # Minimal html that has the same structure url_to_category() looks for:
+    # a div with class "skqShb" that contains a div with class
+    # "fontBodyMedium". Places with the category "No Category" have no such
+    # div, like residential addresses on Google map
+    category = synthetic_category_for_url(url)
+    if category == 'No Category':
+        category_html = ''
+        details_html = ''
+    else:
+        category_html = ('<div class="skqShb "><div class="fontBodyMedium">'
+                         '{}</div></div>'.format(category))
+        details_html = (  # Opening hours table and visit duration, the
+            # way url_to_place_details() reads them
+            '<table class="eK4R0e"><tbody>{}</tbody></table>'
+            '<div>People typically spend {} hours here</div>'.format(
+                ''.join('<tr><td>{}</td><td aria-label="{}">{}</td></tr>'
+                        .format(day, hours, hours)
+                        for day, hours in synthetic_opening_hours_list),
+                1 + hash_url(url) % 3))
+    return ('<!DOCTYPE html><html><head><title>Fixture place</title></head>'
+            '<body><h1 class="DUwDvf">Fixture place</h1>{}{}</body>'
+            '</html>'.format(category_html, details_html))
+
+
+class FixturePlaceHandler(BaseHTTPRequestHandler):
+    # Answer every GET with a fixture place page. The category is derived
+    # from the query string so the same ?cid= or ?q=&ftid= always gives the
+    # same page
+
+    def do_GET(self):
+        query = urlsplit(self.path).query
+        original_url = 'http://maps.google.com/?{}'.format(query)
+        body = render_fixture_place_page(original_url).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep the benchmark output clean
+
+
+def start_fixture_server(host='127.0.0.1', port=0):
+    # Start the fixture server in a background thread. port=0 picks a free
+    # port. Call server.shutdown() when done
+    server = ThreadingHTTPServer((host, port), FixturePlaceHandler)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    print('> Fixture server running at http://{}:{}/'.format(
+        *server.server_address))
+    return server
+
+
+def point_url_to_fixture_server(url, server):
+    # Rewrite a Google map URL so it's served by the fixture server instead
+    query_dict = parse_qs(urlsplit(url).query)
+    query = '&'.join('{}={}'.format(key, quote_plus(value[0], safe=',:'))
+                     for key, value in query_dict.items())
+    return 'http://{}:{}/?{}'.format(*server.server_address, query)
@@ -0,0 +1,31 @@
+import pandas as pd
+
+from compact_location_toolkit import compact_location_df, \
+    expand_location_df, get_google_maps_url, int_pair_to_place_id, \
+    place_id_to_int_pair
+
+
+def test_place_id_round_trip_keeps_leading_zeros():
+    place_id_series = pd.Series(['0x0145c54c76c4dd12:0x0caf89a8c37057c3',
+                                 'cid:123456789'])
+    high_array, low_array = place_id_to_int_pair(place_id_series)
+    assert [int_pair_to_place_id(high, low) for high, low in
+            zip(high_array, low_array)] == list(place_id_series)
+
+
+def test_expand_rebuilds_url_with_leading_zero_ftid():
+    location_df = pd.DataFrame({
+        'Google Maps URL': [
+            'http://maps.google.com/?q=1+Main+St,Wilmington,+NC+28401'
+            '&ftid=0x0145c54c76c4dd12:0x0caf89a8c37057c3',
+            'http://maps.google.com/?cid=987654321'],
+        'Latitude': [34.2257, 34.2358],
+        'Longitude': [-77.9447, -77.9481],
+        'Address': ['1 Main St,Wilmington, NC 28401', None],
+        'Business Name': [None, 'Cafe']
+    })
+    compact_df = compact_location_df(location_df, coordinate_mode='fixed')
+    assert list(expand_location_df(compact_df)['Google Maps URL']) == \
+        list(location_df['Google Maps URL'])
+    assert get_google_maps_url(compact_df.iloc[0]) == \
+        location_df['Google Maps URL'][0]
@@ -0,0 +1,61 @@
+import pandas as pd
+
+from dedup_toolkit import deduplicate_places, find_duplicate_groups
+
+
+def make_location_df(row_list):
+    return pd.DataFrame(row_list, columns=['Google Maps URL', 'Latitude',
+                                           'Longitude', 'Address',
+                                           'Business Name'])
+
+
+def test_neighbouring_businesses_are_not_merged():
+    location_df = make_location_df([
+        ['http://maps.google.com/?cid=1', 34.23590, -77.94850,
+         '101 N Front St, Wilmington, NC 28401', 'Front Street Brewery'],
+        ['http://maps.google.com/?cid=2', 34.23600, -77.94852,
+         '105 N Front St, Wilmington, NC 28401', 'Old Books on Front St'],
+        ['http://maps.google.com/?cid=3', 34.23610, -77.94854,
+         '109 N Front St, Wilmington, NC 28401', 'Dram Tree Gallery'],
+    ])
+    assert deduplicate_places(location_df).shape[0] == 3
+
+
+def test_same_street_number_with_different_names_is_not_merged():
+    location_df = make_location_df([
+        ['http://maps.google.com/?cid=1', 34.2359, -77.9485,
+         '101 N Front St, Wilmington, NC 28401', 'Front Street Brewery'],
+        ['http://maps.google.com/?cid=2', 34.2359, -77.9485,
+         '101 N Front St, Wilmington, NC 28401', 'Dram Tree Gallery'],
+    ])
+    assert find_duplicate_groups(location_df).nunique() == 2
+
+
+def test_same_place_from_2_exports_is_merged():
+    location_df = make_location_df([
+        ['http://maps.google.com/?cid=1', 34.23590, -77.94850,
+         '101 N Front St, Wilmington, NC 28401', "Joe's Cafe"],
+        ['http://maps.google.com/?cid=2', 34.23595, -77.94851,
+         '101 N. Front St, Wilmington, NC 28401, United States',
+         'Joes Cafe'],
+        ['http://maps.google.com/?q=1121+S+Front+St&ftid=0x1:0x2', 34.2200,
+         -77.9500, '1121 S Front St, Wilmington, NC 28401', None],
+        ['http://maps.google.com/?q=1121+S+Front+St&ftid=0x1:0x3', 34.2200,
+         -77.9500, '1121 S Front St, Wilmington, NC 28401', None],
+    ])
+    assert list(find_duplicate_groups(location_df)) == [0, 0, 1, 1]
+
+
+def test_close_places_far_from_the_mean_latitude_are_merged():
+    # 2 exports of the same place, 72 m apart from east to west at 60N, with
+    # other places at the equator that pull the mean latitude down
+    location_df = make_location_df([
+        ['http://maps.google.com/?cid={}'.format(i), 0.001 * i, 10.0,
+         '{} Main St'.format(i), 'Place {}'.format(i)] for i in range(10)
+    ] + [
+        ['http://maps.google.com/?cid=100', 60.0, 11.0,
+         '1 Nordic Rd', 'Harbour Cafe'],
+        ['http://maps.google.com/?cid=101', 60.0, 11.0 + 72 / (111320 * 0.5),
+         '1 Nordic Rd', 'Harbour Cafe'],
+    ])
+    assert deduplicate_places(location_df).shape[0] == 11
@@ -0,0 +1,63 @@
+import json
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+from export_toolkit import export_trip
+
+
+def make_trip_dfs():
+    rng = np.random.default_rng(0)
+    open_df = pd.DataFrame({
+        'Latitude': 34.2 + rng.random(60) * 0.1,
+        'Longitude': -77.9 + rng.random(60) * 0.1,
+        'Business Name': ['Place {}'.format(i) for i in range(60)],
+        'Category': 'Site'
+    })
+    df_no_restaurant = open_df.copy()
+    df_no_restaurant.insert(0, 'Cluster', np.arange(60) % 3)
+    return open_df, df_no_restaurant
+
+
+def test_geojson_hulls_are_closed_once_and_colored(tmp_path):
+    open_df, df_no_restaurant = make_trip_dfs()
+    file_path = str(tmp_path / 'trip.geojson')
+    export_trip(open_df, file_path, df_no_restaurant=df_no_restaurant)
+
+    feature_list = json.load(open(file_path))['features']
+    polygon_list = [feature for feature in feature_list
+                    if feature['geometry']['type'] == 'Polygon']
+    assert len(feature_list) == 63 and len(polygon_list) == 3
+    for polygon in polygon_list:
+        ring = polygon['geometry']['coordinates'][0]
+        assert ring[0] == ring[-1] and ring[-2] != ring[-1]
+    assert len({polygon['properties']['fill']
+                for polygon in polygon_list}) == 3
+
+
+def test_kml_has_a_style_per_cluster(tmp_path):
+    open_df, df_no_restaurant = make_trip_dfs()
+    file_path = str(tmp_path / 'trip.kml')
+    export_trip(open_df, file_path, df_no_restaurant=df_no_restaurant)
+
+    namespace = {'kml': 'http://www.opengis.net/kml/2.2'}
+    document = ET.parse(file_path).getroot().find('kml:Document', namespace)
+    tag_list = [element.tag.split('}')[1] for element in document]
+    # The shared styles come before the 1st placemark
+    assert 'Style' not in tag_list[tag_list.index('Placemark'):]
+    style_color_dict = {
+        style.get('id'): style.find('kml:PolyStyle/kml:color', namespace).text
+        for style in document.findall('kml:Style', namespace)}
+
+    polygon_color_set = set()
+    for placemark in document.findall('kml:Placemark', namespace):
+        # name, description, styleUrl, Style, then the geometry
+        child_tag_list = [element.tag.split('}')[1] for element in placemark]
+        assert child_tag_list == sorted(child_tag_list, key=[
+            'name', 'description', 'styleUrl', 'Style', 'Point',
+            'LineString', 'Polygon'].index)
+        if placemark.find('kml:Polygon', namespace) is not None:
+            polygon_color_set.add(style_color_dict[placemark.find(
+                'kml:styleUrl', namespace).text.lstrip('#')])
+    assert len(polygon_color_set) == 3
@@ -0,0 +1,41 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from folium_map_toolkit import generate_folium_map
+from hierarchical_cluster_toolkit import build_cluster_tree
+
+
+def make_trip_dfs():
+    rng = np.random.default_rng(0)
+    open_df = pd.DataFrame({
+        'Google Maps URL': ['http://maps.google.com/?cid={}'.format(i)
+                            for i in range(80)],
+        'Latitude': 34.2 + rng.random(80) * 0.1,
+        'Longitude': -77.9 + rng.random(80) * 0.1,
+        'Business Name': 'Place',
+        'Extracted Category': 'Park',
+        'Category': rng.choice(['Site', 'Garden', 'Restaurant'], 80)
+    })
+    df_no_restaurant = open_df[open_df['Category'] != 'Restaurant'].copy()
+    df_no_restaurant.insert(0, 'Cluster', np.arange(
+        df_no_restaurant.shape[0]) % 4)
+    return open_df, df_no_restaurant
+
+
+def test_layer_control_comes_after_every_overlay():
+    open_df, df_no_restaurant = make_trip_dfs()
+    my_map = generate_folium_map(
+        open_df, df_no_restaurant, 4, aggregate=True,
+        cluster_tree=build_cluster_tree(df_no_restaurant))
+    html = my_map.get_root().render()
+
+    # The layers of the control are listed in a dict right before the
+    # L.control.layers() call
+    control_position = html.index('overlays :')
+    overlay_block = html[control_position:html.index('L.control.layers(')]
+    overlay_name_list = re.findall(r':\s*(feature_group_\w+)', overlay_block)
+    assert len(overlay_name_list) >= 6  # Markers, clusters, zooms, density
+    for overlay_name in overlay_name_list:
+        assert html.index('var {} ='.format(overlay_name)) < control_position
@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from geocoding_toolkit import fill_missing_coordinates
+
+
+class FlakyBackend:
+    # Times out on 1 query and stops the run on another
+    name = 'flaky'
+    min_delay_seconds = 0
+    lookup_error_tuple = (TimeoutError,)
+
+    def geocode(self, query):
+        if query.startswith('2 '):
+            raise TimeoutError('read timed out')
+        if query.startswith('3 '):
+            raise KeyboardInterrupt
+        return {'Latitude': 34.2, 'Longitude': -77.9, 'Address': query}
+
+
+def make_missing_df(address_list):
+    return pd.DataFrame({'Latitude': np.nan, 'Longitude': np.nan,
+                         'Address': address_list})
+
+
+def test_a_failed_lookup_leaves_its_row_empty_and_is_not_cached(tmp_path):
+    cache_path = str(tmp_path / 'geocode.json')
+    output_df = fill_missing_coordinates(
+        make_missing_df(['1 Front St', '2 Front St']), FlakyBackend(),
+        cache_path, city_str='Wilmington')
+
+    assert output_df['Latitude'].notnull().tolist() == [True, False]
+    with open(cache_path, encoding='utf-8') as file:
+        assert list(json.load(file)['flaky']['geocode']) == [
+            '1 Front St, Wilmington']
+
+
+def test_the_cache_is_saved_when_the_run_stops(tmp_path):
+    cache_path = str(tmp_path / 'geocode.json')
+    with pytest.raises(KeyboardInterrupt):
+        fill_missing_coordinates(
+            make_missing_df(['1 Front St', '3 Front St']), FlakyBackend(),
+            cache_path, city_str='Wilmington')
+
+    with open(cache_path, encoding='utf-8') as file:
+        assert list(json.load(file)['flaky']['geocode']) == [
+            '1 Front St, Wilmington']
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from hierarchical_cluster_toolkit import build_cluster_tree, \
+    precompute_cluster_cuts
+
+
+def test_cuts_have_k_clusters_numbered_from_0():
+    rng = np.random.default_rng(0)
+    df_no_restaurant = pd.DataFrame({
+        'Latitude': 34.2 + rng.random(300) * 0.2,
+        'Longitude': -77.9 + rng.random(300) * 0.2
+    }, index=rng.permutation(300))
+    cut_df = precompute_cluster_cuts(build_cluster_tree(df_no_restaurant),
+                                     [1, 3, 12, 300])
+    assert list(cut_df.index) == list(df_no_restaurant.index)
+    for num_cluster in cut_df.columns:
+        label_array = cut_df[num_cluster].values
+        assert sorted(set(label_array)) == list(range(num_cluster))
+        assert label_array[0] == 0
+
+
+def test_cuts_are_nested():
+    rng = np.random.default_rng(1)
+    df_no_restaurant = pd.DataFrame({
+        'Latitude': 34.2 + rng.random(200) * 0.2,
+        'Longitude': -77.9 + rng.random(200) * 0.2
+    })
+    cut_df = precompute_cluster_cuts(build_cluster_tree(df_no_restaurant),
+                                     [4, 8])
+    # Every cluster of the finer cut lies inside 1 cluster of the coarser
+    assert (cut_df.groupby(8)[4].nunique() == 1).all()
@@ -0,0 +1,22 @@
+from pipeline_toolkit import PartialMap
+
+
+def test_partial_map_has_1_legend_after_several_saves(tmp_path):
+    partial_map = PartialMap(str(tmp_path / 'map.html'))
+    for checkpoint in range(3):
+        for i in range(4):
+            partial_map.add({
+                'Category': 'Restaurant' if i % 2 else 'Site',
+                'Extracted Category': 'Park',
+                'Business Name': 'Place {}'.format(i),
+                'Address': '{} Front St'.format(i),
+                'Google Maps URL': 'http://maps.google.com/?cid={}'.format(i),
+                'Latitude': 34.2 + 0.01 * i,
+                'Longitude': -77.9 + 0.01 * checkpoint
+            })
+        partial_map.save()
+
+    with open(partial_map.map_path, encoding='utf-8') as file:
+        html = file.read()
+    assert html.count('position: fixed') == 1  # The legend
+    assert html.count('L.control.layers(') == 1
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from place_database_toolkit import connect_place_database, \
+    location_df_to_records, query_bounding_box, query_trip, upsert_places
+
+
+def make_location_df():
+    return pd.DataFrame({
+        'Google Maps URL': ['http://maps.google.com/?cid=1',
+                            'http://maps.google.com/?cid=2'],
+        'Latitude': np.array([34.2257, np.nan]),
+        'Longitude': np.array([-77.9447, -77.9481]),
+        'Address': ['1 Main St, Wilmington, NC 28401', np.nan],
+        'Business Name': pd.array(['Cafe', pd.NA], dtype='string'),
+        'Category': pd.array([3, None], dtype='Int64').astype(object),
+        'Updated': pd.to_datetime(['2023-05-01', None])
+    })
+
+
+def test_records_only_hold_python_values():
+    for record in location_df_to_records(make_location_df()):
+        for value in record:
+            assert value is None or type(value) in (str, int, float)
+
+
+def test_upsert_stores_numbers_as_numbers(tmp_path):
+    connection = connect_place_database(str(tmp_path / 'places.sqlite'))
+    upsert_places(connection, make_location_df(), trip='wilmington')
+    row_list = connection.execute(
+        'SELECT typeof(latitude), category, typeof(address), updated '
+        'FROM places ORDER BY place_id').fetchall()
+    assert row_list == [('real', '3', 'text', '2023-05-01T00:00:00'),
+                        ('null', None, 'null', None)]  # Not BLOBs
+    assert query_trip(connection, 'wilmington').shape[0] == 2
+
+
+def test_place_without_coordinates_leaves_the_rtree(tmp_path):
+    connection = connect_place_database(str(tmp_path / 'places.sqlite'))
+    location_df = make_location_df().iloc[:1]
+    upsert_places(connection, location_df)
+    location_df = location_df.assign(Latitude=np.nan)
+    upsert_places(connection, location_df)
+
+    assert connection.execute(
+        'SELECT COUNT(*) FROM place_rtree').fetchone()[0] == 0
+    assert query_bounding_box(connection, 34, 35, -78, -77).empty
@@ -0,0 +1,64 @@
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pandas as pd
+import pytest
+
+from planning_service_toolkit import PlanningService, create_planning_server
+
+
+def make_trip_df(num_place=12):
+    return pd.DataFrame({
+        'Latitude': [34.2 + 0.01 * i for i in range(num_place)],
+        'Longitude': [-77.9 + 0.01 * (i % 3) for i in range(num_place)],
+        'Category': ['Restaurant' if i % 4 == 0 else 'Site'
+                     for i in range(num_place)]
+    })
+
+
+@pytest.fixture
+def server_url():
+    server = create_planning_server({
+        'wilmington': make_trip_df(),
+        'broken': make_trip_df().drop(columns=['Category'])
+    }, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://{}:{}'.format(*server.server_address)
+    server.shutdown()
+
+
+def get_status(url):
+    try:
+        with urlopen(url) as response:
+            return response.status
+    except HTTPError as error:
+        json.loads(error.read())  # Errors are json too
+        return error.code
+
+
+def test_only_unknown_trips_and_paths_are_404(server_url):
+    assert get_status(server_url + '/trips/wilmington/places') == 200
+    assert get_status(server_url + '/trips/lisbon/places') == 404
+    assert get_status(server_url + '/trips/wilmington/routes?k=2') == 404
+    assert get_status(server_url + '/trips/wilmington/clusters?k=x') == 400
+    # A KeyError while computing (the column Category is missing) is a
+    # failure of the service, not an unknown trip
+    assert get_status(server_url + '/trips/broken/places') == 500
+
+
+def test_response_computed_before_set_trip_is_not_cached():
+    service = PlanningService({'wilmington': make_trip_df()})
+    key = ('places', 'wilmington', (), None)
+
+    def compute():
+        value = service.trip_df_dict['wilmington'].shape[0]
+        service.set_trip('wilmington', make_trip_df(20))  # Lands while the
+        # old df is being used
+        return value
+
+    assert service.cache.get_or_compute(key, compute) == 12
+    assert key not in service.cache.item_dict
+    assert service.cache.get_or_compute(
+        key, lambda: service.trip_df_dict['wilmington'].shape[0]) == 20
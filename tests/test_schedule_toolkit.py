@@ -0,0 +1,40 @@
+import json
+
+import pandas as pd
+
+from schedule_toolkit import find_visit_start, plan_days, plan_one_day
+
+
+def test_day_with_spare_time_continues_into_the_nearest_cluster():
+    df_no_restaurant = pd.DataFrame({
+        'Cluster': [0, 0, 0, 1, 2],
+        'Latitude': [34.200, 34.201, 34.202, 34.210, 34.500],
+        'Longitude': [-77.900, -77.901, -77.902, -77.910, -77.500],
+        'Visit Duration': ['1 hour'] * 5
+    })
+    plan_df = plan_days(df_no_restaurant, ['Saturday'], '09:00', '15:00')
+    day_df = plan_df[plan_df['Day'] == 1]
+    assert set(day_df['Cluster']) == {0, 1}  # Cluster 1 is nearer than 2
+    assert day_df.shape[0] == 4
+
+
+def test_visit_start_gives_the_closing_of_its_interval():
+    interval_list = [(9 * 60, 10 * 60), (12 * 60, 20 * 60)]
+    assert find_visit_start(11 * 60, 60, interval_list) == (12 * 60, 20 * 60)
+    assert find_visit_start(21 * 60, 60, interval_list) == (None, None)
+
+
+def test_tie_break_uses_the_interval_of_the_visit():
+    # Both can start at 12:00. A closes its 2nd interval at 13:00 and B at
+    # 17:00, so A goes 1st even though B's 1st interval closes earlier
+    candidate_df = pd.DataFrame({
+        'Latitude': [34.2, 34.2],
+        'Longitude': [-77.9, -77.9],
+        'Visit Minutes': [60, 60],
+        'Opening Hours': [
+            json.dumps({'Saturday': '8-11 AM, 12-1 PM'}),
+            json.dumps({'Saturday': '7-8 AM, 12-5 PM'})]
+    }, index=['A', 'B'])
+    visit_list = plan_one_day(candidate_df, 'Saturday', 11 * 60 + 30,
+                              18 * 60)
+    assert [visit[0] for visit in visit_list] == ['A', 'B']